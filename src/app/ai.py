@@ -1,241 +1,332 @@
-from json import JSONDecodeError
+import asyncio
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
-from pydantic import BaseModel, field_validator
-
-from training.tictactoe_model import legal_actions, load_model, minimax_action
-
+from typing import Literal
+
+from fastapi import APIRouter, HTTPException, WebSocket
+from pydantic import field_validator
+
+from training.mcts import MCTS
+from training.opening_book import DEFAULT_BOOK_PATH, OpeningBook
+from training.qtable import DEFAULT_TABLE_PATH, file_crc, load_table
+from training.search import Searcher, TranspositionTable, best_move
+from training.tictactoe_model import load_model
+
+from . import core
+from . import events
+from . import journal
+from . import log
+from . import ratings
 from . import tic_tac_toe_cli as game
+from . import tracing
 
 
 router = APIRouter()
+logger = log.get_logger("ai")
 active_ai_games = {}
 active_ai_player_ids = set()
 
 
-class AIPayload(BaseModel):
+DIFFICULTY_POLICIES = {
+    "easy": {"temperature": 1.0, "epsilon": 0.6},
+    "medium": {"temperature": 0.3, "epsilon": 0.25},
+    "hard": {"temperature": 0.0, "epsilon": 0.0},
+}
+AI_THINK_MS = float(os.environ.get("AI_THINK_MS", "200"))
+MCTS_MAX_NODES = int(os.environ.get("MCTS_MAX_NODES", "50000"))
+MCTS_ROLLOUTS_PER_LEAF = int(os.environ.get("MCTS_ROLLOUTS_PER_LEAF", "4"))
+# Nodes an MCTS game may keep between moves (about 26 bytes each); a larger subtree is dropped.
+MCTS_KEEP_NODES = int(os.environ.get("MCTS_KEEP_NODES", "8192"))
+# Nonzero budgets replace AI_THINK_MS with a fixed amount of work, so a seeded game plays the
+# same moves on any host and under any load. Test mode (GAME_SEED) turns them on.
+AI_SEARCH_NODES = int(os.environ.get("AI_SEARCH_NODES", "2000" if core.GAME_SEED else "0"))
+MCTS_PLAYOUTS = int(os.environ.get("MCTS_PLAYOUTS", "1000" if core.GAME_SEED else "0"))
+SEARCH_TABLE = TranspositionTable(bits=18)
+# Fixed-budget searches reuse one table, cleared before each: entries left by other searches
+# would change the result.
+NODE_SEARCH_TABLE = TranspositionTable(bits=16)
+# AI moves are searched off the event loop. One thread: searches share the tables above, whose stores
+# are not atomic, and pure-Python searches would not run in parallel under the GIL anyway.
+SEARCH_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ai-search")
+
+
+class AIPayload(core.BoardPayload):
     game_id: str
     player_id: str
+    difficulty: Literal["easy", "medium", "hard"] = "hard"
+    engine: Literal["auto", "search", "mcts"] = "auto"
 
     @field_validator("game_id", "player_id", mode="before")
     @classmethod
     def validate_and_strip_id(cls, value):
-        if not isinstance(value, str):
-            raise ValueError("must be a string")
-        stripped = value.strip()
-        if stripped == "":
-            raise ValueError("must not be empty")
-        return stripped
+        return core.strip_id(value)
 
 
 MODEL = None
 MODEL_PATH = Path(__file__).resolve().parent.parent / "training" / "models" / "final_model.pkl"
 try:
-    if MODEL_PATH.exists():
+    # Workers map the same table file and share its pages; the pickle costs a private copy per worker.
+    if DEFAULT_TABLE_PATH.exists():
+        MODEL = load_table(str(DEFAULT_TABLE_PATH))
+        if MODEL_PATH.exists() and MODEL.q.source_crc != file_crc(str(MODEL_PATH)):
+            logger.warning("%s was built from another %s; run python -m training.qtable", DEFAULT_TABLE_PATH, MODEL_PATH)
+            MODEL.close()
+            MODEL = load_model(str(MODEL_PATH))
+    elif MODEL_PATH.exists():
+        logger.warning("mapped Q-table not found at %s, loading a private copy of %s", DEFAULT_TABLE_PATH, MODEL_PATH)
         MODEL = load_model(str(MODEL_PATH))
     else:
-        print(f"[ai] model not found at {MODEL_PATH}, using minimax fallback")
+        logger.warning("model not found at %s, using search fallback", MODEL_PATH)
 except Exception as exc:
-    print(f"[ai] failed to load model at {MODEL_PATH}: {exc}. Using minimax fallback")
+    logger.error("failed to load model: %s. Using search fallback", exc)
 
 
-def websocket_is_open(websocket):
-    return getattr(getattr(websocket, "client_state", None), "name", "") != "DISCONNECTED"
+BOOK = None
+try:
+    if DEFAULT_BOOK_PATH.exists():
+        BOOK = OpeningBook(str(DEFAULT_BOOK_PATH))
+except Exception as exc:
+    logger.error("failed to load opening book at %s: %s", DEFAULT_BOOK_PATH, exc)
 
 
-def current_board():
-    return [[game.table_game[h][w]["text"] for w in range(3)] for h in range(3)]
+MODEL_VALUES = (0, 1, -1)
 
 
-def ws_state_message(note="", ai_move=None):
-    state = game.is_winning()
-    payload = {
-        "board": current_board(),
-        "status": game.label["text"],
-        "game_status": state["status"],
-    }
-    if state["status"] == "win":
-        payload["winner"] = state["winner"]
-        payload["line_type"] = state["line_type"]
-        payload["cells"] = state["cells"]
-    if ai_move is not None:
-        payload["ai_move"] = ai_move
-    if note:
-        payload["message"] = note
-    return payload
-
-
-def board_to_model():
-    mapping = {"X": 1, "O": -1, "": 0}
-    board = []
-    for h in range(3):
-        for w in range(3):
-            board.append(mapping[game.table_game[h][w]["text"]])
-    return tuple(board)
-
-
-def apply_ai_turn(session):
-    state = game.is_winning()
-    if state["status"] != "ongoing" or game.player != session["ai_choice"]:
-        return None
+def board_to_model(cells):
+    return tuple(MODEL_VALUES[code] for code in cells)
 
-    board = board_to_model()
-    available = legal_actions(board)
-    if not available:
-        return None
 
-    ai_player = 1 if session["ai_choice"] == "X" else -1
+def mcts_action(session, cells, size, win_length, code, time_limit_ms, rng):
+    tree = session.get("mcts")
+    if tree is None or MCTS_PLAYOUTS:
+        # A fixed budget always searches from scratch: a resumed game has no tree to reuse,
+        # and it must still pick what the uninterrupted game would have.
+        tree = MCTS(
+            cells,
+            size,
+            win_length,
+            code,
+            rollouts_per_leaf=MCTS_ROLLOUTS_PER_LEAF,
+            max_nodes=MCTS_MAX_NODES,
+            rng=rng,
+        )
+    else:
+        # Keeps the subtree under the opponent's reply from the previous search.
+        tree.sync(cells, code)
+        tree.rng = rng
+    if MCTS_PLAYOUTS:
+        return tree.search(float("inf"), MCTS_PLAYOUTS).action
+    action = tree.search(time_limit_ms).action
+    # Held until the next move, so only the subtree that move can reuse, and at most
+    # MCTS_KEEP_NODES of it: a search may grow the tree to MCTS_MAX_NODES.
+    tree.advance(action)
+    tree.trim(MCTS_KEEP_NODES)
+    session["mcts"] = tree
+    return action
+
+
+def ai_to_move(session):
+    state = session["state"]
+    return game.is_winning(state)["status"] == "ongoing" and state["player"] == session["ai_choice"]
+
+
+def choose_ai_action(session, time_limit_ms=None):
+    # Only touches the session's own MCTS tree, so it can run on SEARCH_EXECUTOR while the
+    # handler that owns the session waits for it.
+    current = session["state"]["board"]
+    cells = current["cells"]
+    size = current["size"]
+    win_length = current["win_length"]
+    code = game.MARK_CODES[session["ai_choice"]]
+    policy = DIFFICULTY_POLICIES[session["difficulty"]]
+    rng = core.move_rng(session)
+    engine = session["engine"]
     action = None
 
-    if MODEL is not None:
-        try:
-            action = MODEL.choose_action(board, ai_player)
-        except Exception as exc:
-            print(f"[ai] model inference failed: {exc}. Using minimax fallback")
+    # The difficulty's random moves come first, whichever engine would have answered.
+    if policy["epsilon"] > 0.0 and rng.random() < policy["epsilon"]:
+        action = rng.choice(Searcher(cells, size, win_length, SEARCH_TABLE).candidates())
+
+    # The book holds the deterministic best move, so only the hard policy may use it, and only
+    # when the engine is left to the server.
+    if action is None and BOOK is not None and engine == "auto" and size == 3 and win_length == 3:
+        if session["difficulty"] == "hard":
+            action = BOOK.lookup(cells, code)
+
+    if action is None and MODEL is not None and engine == "auto" and size == 3 and win_length == 3:
+        board = board_to_model(cells)
+        ai_player = 1 if code == 1 else -1
+        if (board, ai_player) in MODEL.q:
+            try:
+                action = MODEL.sample_action(board, ai_player, policy["temperature"], rng)
+            except Exception as exc:
+                logger.error("model inference failed: %s. Using search fallback", exc)
+
+    if action is None or cells[action] != game.EMPTY:
+        if time_limit_ms is None:
+            time_limit_ms = AI_THINK_MS
+        if engine == "mcts":
+            action = mcts_action(session, cells, size, win_length, code, time_limit_ms, rng)
+        elif AI_SEARCH_NODES:
+            NODE_SEARCH_TABLE.clear()
+            action = best_move(
+                cells, size, win_length, code, float("inf"), table=NODE_SEARCH_TABLE, max_nodes=AI_SEARCH_NODES
+            ).action
+        else:
+            action = best_move(cells, size, win_length, code, time_limit_ms, table=SEARCH_TABLE).action
+    return action
+
+
+def play_ai_action(session, action):
+    state = session["state"]
+    size = state["board"]["size"]
+    h, w = divmod(action, size)
+    if not game.next(state, h, w):
+        return None
+    journal.record_move("ai", session["game_id"], h, w)
+    events.emit("move", "ai", session["game_id"], player=session["ai_choice"], row=h, col=w, ply=state["board"]["filled"])
+    return {"row": h, "col": w}
 
-    if action not in available:
-        action = minimax_action(board, ai_player)
 
-    if action not in available:
-        action = available[0]
+def apply_ai_turn(session, time_limit_ms=None):
+    # In-process callers (benchmarks) that have no event loop to keep free.
+    if not ai_to_move(session):
+        return None
+    return play_ai_action(session, choose_ai_action(session, time_limit_ms))
 
-    h, w = divmod(action, 3)
-    before = game.table_game[h][w]["text"]
-    game.next(h, w)
-    game.sync_state(session["state"])
 
-    if before == game.table_game[h][w]["text"]:
+async def play_ai_turn(session):
+    # The search runs for up to AI_THINK_MS; on the event loop it would stall every other game
+    # this worker serves for that long.
+    if not ai_to_move(session):
         return None
-    return {"row": h, "col": w}
+    action = await asyncio.get_running_loop().run_in_executor(SEARCH_EXECUTOR, choose_ai_action, session)
+    return play_ai_action(session, action)
+
+
+def register_session(
+    game_id,
+    player_id,
+    player_choice,
+    ai_choice,
+    starting_player,
+    difficulty="hard",
+    engine="auto",
+    board_size=game.DEFAULT_SIZE,
+    win_length=game.DEFAULT_WIN_LENGTH,
+    seed=None,
+):
+    seed = core.session_seed(game_id, seed)
+    active_ai_games[game_id] = {
+        "game_id": game_id,
+        "player_id": player_id,
+        "player_choice": player_choice,
+        "ai_choice": ai_choice,
+        "starting_player": starting_player,
+        "difficulty": difficulty,
+        "engine": engine,
+        "seed": seed,
+        "state": game.create_game_state(
+            player_choice=starting_player, size=board_size, win_length=win_length, rng=random.Random(seed)
+        ),
+        "mcts": None,
+        "connected": False,
+    }
+    active_ai_player_ids.add(player_id)
+    return active_ai_games[game_id]
+
+
+def restore_session(fields, moves):
+    session = register_session(**fields)
+    game.replay_moves(session["state"], moves)
+
+
+@router.get("/ai/stats")
+async def ai_stats():
+    return {
+        "active_games": len(active_ai_games),
+        "book_hits": BOOK.hits if BOOK is not None else 0,
+        "book_misses": BOOK.misses if BOOK is not None else 0,
+        "search_table_hits": SEARCH_TABLE.hits,
+        "search_table_stores": SEARCH_TABLE.stores,
+    }
 
 
 @router.post("/ai")
 async def ai(payload: AIPayload):
     game_id = payload.game_id
     player_id = payload.player_id
+    difficulty = payload.difficulty
+    engine = payload.engine
+    board_size = payload.board_size
+    win_length = payload.win_length
     player_choice = "X"
     ai_choice = "O"
     starting_player = "X"
 
-    if game_id in active_ai_games:
+    if game_id in active_ai_games or game_id in MODE.suspended:
         raise HTTPException(status_code=400, detail="game_id must be unique")
     if player_id in active_ai_player_ids:
         raise HTTPException(status_code=400, detail="player_id must be unique")
 
-    active_ai_games[game_id] = {
+    session = register_session(
+        game_id, player_id, player_choice, ai_choice, starting_player, difficulty, engine, board_size, win_length, payload.seed
+    )
+    fields = {
         "game_id": game_id,
         "player_id": player_id,
         "player_choice": player_choice,
         "ai_choice": ai_choice,
         "starting_player": starting_player,
-        "state": game.create_game_state(player_choice=starting_player),
-        "connected": False,
+        "difficulty": difficulty,
+        "engine": engine,
+        "board_size": board_size,
+        "win_length": win_length,
+        "seed": session["seed"],
     }
-    active_ai_player_ids.add(player_id)
-    return {"ws_path": f"/ws/ai/{game_id}"}
-
-
-@router.websocket("/ws/ai/{game_id}")
-async def websocket_ai(websocket: WebSocket, game_id: str):
-    await websocket.accept()
-    session = active_ai_games.get(game_id)
-
-    if session is None:
-        await websocket.send_json({"error": "Game not found."})
-        await websocket.close()
-        return
+    journal.record_create("ai", game_id, fields)
+    events.emit("created", "ai", game_id, fields=fields)
+    return {"ws_path": f"/ws/ai/{game_id}", **core.seed_reply(session, payload.seed)}
 
-    if session["connected"]:
-        await websocket.send_json({"error": "Game already has an active connection."})
-        await websocket.close()
-        return
 
-    session["connected"] = True
+class AIMode(core.SessionMode):
+    register_fields = ("game_id", "player_id", "player_choice", "ai_choice", "starting_player", "difficulty", "engine")
 
-    try:
-        game.bind_state(session["state"])
-        note = (
-            f"Game started. You are {session['player_choice']}. "
+    def greeting(self, session):
+        return (
+            f"Game started. You are {session['player_choice']} against a {session['difficulty']} AI. "
             f"{session['starting_player']} goes first. Send moves as "
             "{'row': 0, 'col': 0}."
         )
-        ai_move = apply_ai_turn(session)
-        if ai_move is not None:
-            note = f"{note} AI played at ({ai_move['row']}, {ai_move['col']})."
-            game.bind_state(session["state"])
-
-        await websocket.send_json(ws_state_message(note, ai_move))
-
-        state = game.is_winning()
-        if state["status"] in {"win", "tie"}:
-            if websocket_is_open(websocket):
-                await websocket.close()
-            return
-
-        while True:
-            game.bind_state(session["state"])
-            note = ""
-            ai_move = None
-            try:
-                raw = await websocket.receive_json()
-            except JSONDecodeError:
-                note = "Invalid JSON payload. Use JSON object with row and col."
-                await websocket.send_json(ws_state_message(note, ai_move))
-                continue
-
-            if not isinstance(raw, dict):
-                note = "Invalid payload. Use JSON object with row and col."
-            else:
-                h = raw.get("row")
-                w = raw.get("col")
-
-                if game.player != session["player_choice"]:
-                    note = "Wait for your turn. AI is playing."
-                elif type(h) is not int or type(w) is not int:
-                    note = "Invalid payload. row and col must be integers."
-                elif not (0 <= h <= 2 and 0 <= w <= 2):
-                    note = "Coordinates must be between 0 and 2."
-                else:
-                    before = game.table_game[h][w]["text"]
-                    before_label = game.label["text"]
-                    game.next(h, w)
-
-                    if before != game.table_game[h][w]["text"] or before_label != game.label["text"]:
-                        note = "Move accepted."
-                        state = game.is_winning()
-
-                        if state["status"] == "ongoing":
-                            ai_move = apply_ai_turn(session)
-                            game.bind_state(session["state"])
-                            if ai_move is not None:
-                                note = f"{note} AI played at ({ai_move['row']}, {ai_move['col']})."
-
-                        state = game.is_winning()
-                        if state["status"] == "win":
-                            note = f"Win details: type={state['line_type']}, cells={state['cells']}"
-                        elif state["status"] == "tie":
-                            note = "Game over: tie."
-                    else:
-                        note = "Move ignored. Cell is occupied or game already finished."
-
-            game.sync_state(session["state"])
-            response = ws_state_message(note, ai_move)
-            state = game.is_winning()
-            await websocket.send_json(response)
-
-            if state["status"] in {"win", "tie"}:
-                if websocket_is_open(websocket):
-                    await websocket.close()
-                break
-
-    except WebSocketDisconnect:
-        pass
-    except Exception as exc:
-        print(f"[ws-ai {game_id}] backend error: {exc}")
-        if websocket_is_open(websocket):
-            await websocket.close()
-    finally:
-        if game_id in active_ai_games:
-            active_ai_player_ids.discard(active_ai_games[game_id]["player_id"])
-            del active_ai_games[game_id]
+
+    async def start(self, session):
+        return await self.after_move(session, tracing.NOOP_TRACE)
+
+    def precheck(self, session, raw, player_id=None):
+        if session["state"]["player"] != session["player_choice"]:
+            return "Wait for your turn. AI is playing."
+        return None
+
+    async def after_move(self, session, trace):
+        started = tracing.now()
+        ai_move = await play_ai_turn(session)
+        trace.record("ai_turn", started)
+        if ai_move is None:
+            return "", {}
+        return f" AI played at ({ai_move['row']}, {ai_move['col']}).", {"ai_move": ai_move}
+
+    def on_end(self, session, state):
+        ratings.record_ai_result(session["player_id"], session["player_choice"], session["difficulty"], state)
+
+    def trace_attributes(self, session):
+        return {"game_id": session["game_id"], "difficulty": session["difficulty"]}
+
+
+MODE = AIMode("ai", active_ai_games, active_ai_player_ids, logger, register_session)
+
+
+@router.websocket("/ws/ai/{game_id}")
+async def websocket_ai(websocket: WebSocket, game_id: str):
+    await core.serve_single(MODE, websocket, game_id)
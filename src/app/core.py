@@ -0,0 +1,337 @@
+import os
+import random
+from functools import partial
+from json import JSONDecodeError
+
+from fastapi import WebSocketDisconnect
+from pydantic import BaseModel, model_validator
+
+from . import events
+from . import journal
+from . import log
+from . import ratelimit
+from . import resume
+from . import tic_tac_toe_cli as game
+from . import tracing
+
+
+FINISHED_STATUSES = {"win", "tie"}
+MOVE_IGNORED_NOTE = "Move ignored. Cell is occupied or game already finished."
+# Test mode: every game's seed follows from this and its game_id, so a rerun of the same load
+# test or benchmark plays every game the same way.
+GAME_SEED = os.environ.get("GAME_SEED", "")
+
+
+def strip_id(value):
+    if not isinstance(value, str):
+        raise ValueError("must be a string")
+    stripped = value.strip()
+    if stripped == "":
+        raise ValueError("must not be empty")
+    return stripped
+
+
+class BoardPayload(BaseModel):
+    board_size: int = game.DEFAULT_SIZE
+    win_length: int | None = None
+    seed: int | None = None
+
+    @model_validator(mode="after")
+    def validate_board_dimensions(self):
+        if self.win_length is None:
+            self.win_length = game.default_win_length(self.board_size)
+        game.validate_dimensions(self.board_size, self.win_length)
+        return self
+
+
+def session_seed(game_id, seed=None):
+    # A seed sent with the request wins; otherwise one is drawn (or derived in test mode) and
+    # journaled with the game, so any game can be replayed.
+    if seed is not None:
+        return seed
+    if GAME_SEED:
+        return random.Random(f"{GAME_SEED}:{game_id}").getrandbits(63)
+    return random.getrandbits(63)
+
+
+def seed_reply(session, requested=None):
+    # Knowing the seed makes every AI choice predictable, so it stays in the journal and the
+    # events; a create response only echoes one the client chose, or in test mode.
+    if requested is None and not GAME_SEED:
+        return {}
+    return {"seed": session["seed"]}
+
+
+def move_rng(session):
+    # One stream per ply: a choice depends only on the seed and the move count, not on how many
+    # draws earlier moves took or whether the game was suspended and resumed in between.
+    return random.Random(f"{session['seed']}:{session['state']['board']['filled']}")
+
+
+def websocket_is_open(websocket):
+    return getattr(getattr(websocket, "client_state", None), "name", "") != "DISCONNECTED"
+
+
+def state_message(state, note="", **extra):
+    game_status = game.is_winning(state)
+    payload = {
+        "board": game.board_rows(state),
+        "status": state["label"]["text"],
+        "game_status": game_status["status"],
+    }
+    if game_status["status"] == "win":
+        payload["winner"] = game_status["winner"]
+        payload["line_type"] = game_status["line_type"]
+        payload["cells"] = game_status["cells"]
+    for key, value in extra.items():
+        if value is not None:
+            payload[key] = value
+    if note:
+        payload["message"] = note
+    return payload
+
+
+def is_finished(state):
+    return game.is_winning(state)["status"] in FINISHED_STATUSES
+
+
+def result_note(state, note):
+    game_status = game.is_winning(state)
+    if game_status["status"] == "win":
+        return f"Win details: type={game_status['line_type']}, cells={game_status['cells']}"
+    if game_status["status"] == "tie":
+        return "Game over: tie."
+    return note
+
+
+def validate_move(state, raw):
+    h = raw.get("row")
+    w = raw.get("col")
+    if type(h) is not int or type(w) is not int:
+        return None, None, "Invalid payload. row and col must be integers."
+    if not game.in_bounds(state, h, w):
+        return None, None, f"Coordinates must be between 0 and {game.board_size(state) - 1}."
+    return h, w, None
+
+
+class SessionMode:
+    # One per router. The shared loop below calls these hooks; modes override what differs.
+    invalid_json_note = "Invalid JSON payload. Use JSON object with row and col."
+    invalid_payload_note = "Invalid payload. Use JSON object with row and col."
+    player_fields = ("player_id",)
+    # register_session's leading arguments; board_size, win_length and seed follow.
+    register_fields = ("game_id", "player_id", "player_choice", "starting_player")
+
+    def __init__(self, name, sessions, player_ids, logger, register):
+        self.name = name
+        self.sessions = sessions
+        self.player_ids = player_ids
+        self.logger = logger
+        self.register = register
+        self.suspended = {}
+        resume.modes.append(self)
+
+    def greeting(self, session):
+        return f"Game started. {session['starting_player']} goes first. Send moves as : {{'row': 0, 'col': 0}}."
+
+    async def start(self, session):
+        # Runs before the greeting is sent; returns a note suffix and extra message fields.
+        return "", {}
+
+    def precheck(self, session, raw, player_id=None):
+        return None
+
+    async def after_move(self, session, trace):
+        return "", {}
+
+    def on_end(self, session, state):
+        pass
+
+    def trace_attributes(self, session):
+        return {"game_id": session["game_id"]}
+
+    async def play_move(self, session, raw, trace, player_id=None):
+        # Only after_move may suspend; with the base hook nothing here yields to the loop.
+        note = self.precheck(session, raw, player_id)
+        if note is not None:
+            return note, {}
+        state = session["state"]
+        h, w, note = validate_move(state, raw)
+        if note is not None:
+            return note, {}
+
+        game_id = session["game_id"]
+        started = tracing.now()
+        played = game.next(state, h, w)
+        trace.record("engine", started)
+        if not played:
+            return MOVE_IGNORED_NOTE, {}
+
+        journal.record_move(self.name, game_id, h, w)
+        events.emit(
+            "move", self.name, game_id, player=game.cell_text(state, h, w), row=h, col=w, ply=state["board"]["filled"]
+        )
+        log.move(self.logger, game_id, state["label"]["text"], partial(game.board_state_text, state), row=h, col=w)
+        note, extra = "Move accepted.", {}
+        if not is_finished(state):
+            suffix, extra = await self.after_move(session, trace)
+            note += suffix
+        return result_note(state, note), extra
+
+    def issue_token(self, session, player_id):
+        # Rotated on every connect, so a token only ever resumes the connection it was sent to.
+        token = resume.new_token()
+        session.setdefault("resume_tokens", {})[player_id] = token
+        return token
+
+    def suspend(self, session):
+        # The ids stay reserved; everything that can be rebuilt from the cells is dropped.
+        state = session["state"]
+        current_board = state["board"]
+        game_id = session["game_id"]
+        self.suspended[game_id] = resume.Suspended(
+            tuple(session[name] for name in self.register_fields)
+            + (current_board["size"], current_board["win_length"], session["seed"]),
+            bytes(current_board["cells"]),
+            state["player"],
+            tuple(session.get("resume_tokens", {}).items()),
+            resume.deadline(),
+        )
+        del self.sessions[game_id]
+        resume.ensure_sweeper()
+        self.logger.info("game suspended", extra=log.fields(game_id=game_id, grace_seconds=resume.RESUME_GRACE_SECONDS))
+
+    def suspended_players(self, game_id):
+        fields = dict(zip(self.register_fields, self.suspended[game_id].fields))
+        return {fields[name] for name in self.player_fields}
+
+    def revive(self, game_id, token, player_id=None):
+        # Returns the rebuilt session, the player the token belongs to and the grace deadline.
+        # Nothing changes unless the player belongs to the game and presents their token.
+        entry = self.suspended.get(game_id)
+        tokens = dict(entry.tokens)
+        if player_id is None:
+            player_id = entry.player_for(token)
+            valid = player_id is not None
+        elif player_id not in self.suspended_players(game_id):
+            valid = False
+        elif player_id in tokens:
+            valid = resume.token_matches(tokens[player_id], token)
+        else:
+            # A player of the game who never connected was never issued a token to present.
+            valid = True
+        if not valid:
+            resume.stats["rejected_tokens"] += 1
+            return None, None, None
+        del self.suspended[game_id]
+        session = self.register(*entry.fields)
+        game.load_position(session["state"], entry.cells, entry.player)
+        session["resume_tokens"] = tokens
+        return session, player_id, entry.expires
+
+    async def sweep(self, now):
+        for game_id, entry in list(self.suspended.items()):
+            if entry.expires > now:
+                continue
+            del self.suspended[game_id]
+            resume.stats["expired"] += len(entry.tokens)
+            self.register(*entry.fields)
+            self.finish(game_id)
+            self.logger.info("suspended game expired", extra=log.fields(game_id=game_id))
+
+    def finish(self, game_id, resumable=False):
+        session = self.sessions.get(game_id)
+        if session is None:
+            return
+        if not resumable:
+            game_status = game.is_winning(session["state"])
+            journal.record_end(self.name, game_id, game_status["status"])
+            if game_status["status"] in FINISHED_STATUSES:
+                events.emit(
+                    "finished", self.name, game_id, game_status=game_status["status"], winner=game_status["winner"]
+                )
+            else:
+                # Ended before a result: a player left, or a held game was never resumed.
+                events.emit("abandoned", self.name, game_id, ply=session["state"]["board"]["filled"])
+            self.on_end(session, game_status)
+        for field in self.player_fields:
+            self.player_ids.discard(session[field])
+        del self.sessions[game_id]
+
+
+async def serve_single(mode, websocket, game_id):
+    await websocket.accept()
+    bucket = ratelimit.bucket_for(websocket)
+    if game_id in mode.suspended:
+        session, _, _ = mode.revive(game_id, resume.requested_token(websocket))
+        if session is None:
+            await websocket.send_json({"error": "Invalid resume token."})
+            await websocket.close()
+            return
+        resume.stats["resumed"] += 1
+        greeting = "Game resumed."
+        resumed = True
+    else:
+        session = mode.sessions.get(game_id)
+        if session is None:
+            await websocket.send_json({"error": "Game not found."})
+            await websocket.close()
+            return
+        if session["connected"]:
+            await websocket.send_json({"error": "Game already has an active connection."})
+            await websocket.close()
+            return
+        greeting = mode.greeting(session)
+        resumed = False
+
+    session["connected"] = True
+    state = session["state"]
+    events.emit("connected", mode.name, game_id, player_id=session["player_id"], resumed=resumed)
+    resumable = False
+    held = False
+
+    try:
+        mode.logger.info("game started", extra=log.fields(game_id=game_id, status=state["label"]["text"]))
+        token = mode.issue_token(session, session["player_id"])
+        suffix, extra = await mode.start(session)
+        finished = is_finished(state)
+        await websocket.send_json(state_message(state, greeting + suffix, resume_token=token, **extra))
+
+        while not finished:
+            try:
+                raw = await ratelimit.receive_json(websocket, bucket)
+            except JSONDecodeError:
+                await websocket.send_json(state_message(state, mode.invalid_json_note))
+                continue
+
+            trace = tracing.begin(f"{mode.name}.message", bucket, **mode.trace_attributes(session))
+            if isinstance(raw, dict):
+                note, extra = await mode.play_move(session, raw, trace)
+            else:
+                note, extra = mode.invalid_payload_note, {}
+
+            started = tracing.now()
+            response = state_message(state, note, **extra)
+            trace.record("render", started)
+            finished = is_finished(state)
+            started = tracing.now()
+            await websocket.send_json(response)
+            trace.record("send", started)
+            trace.finish()
+
+        if websocket_is_open(websocket):
+            await websocket.close()
+
+    except WebSocketDisconnect as exc:
+        resumable = journal.is_resumable_close(exc.code)
+        held = resume.should_hold(exc.code) and not is_finished(state)
+    except Exception as exc:
+        mode.logger.exception("backend error: %s", exc, extra=log.fields(game_id=game_id))
+        if websocket_is_open(websocket):
+            await websocket.close()
+    finally:
+        if held:
+            resume.stats["held"] += 1
+            mode.suspend(session)
+        else:
+            mode.finish(game_id, resumable)
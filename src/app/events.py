@@ -0,0 +1,237 @@
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+import urllib.request
+from collections import deque
+
+from fastapi import APIRouter
+
+from . import log
+
+
+router = APIRouter()
+logger = log.get_logger("events")
+
+# Where lifecycle events go: file:PATH, unix:PATH, tcp:HOST:PORT or kafka-rest:URL (a Kafka REST
+# proxy topic URL, e.g. http://localhost:8082/topics/game-events). Empty turns the stream off.
+EVENTS_SINK = os.environ.get("EVENTS_SINK", "")
+EVENTS_BUFFER_SIZE = int(os.environ.get("EVENTS_BUFFER_SIZE", "65536"))
+EVENTS_BATCH = int(os.environ.get("EVENTS_BATCH", "512"))
+EVENTS_FLUSH_INTERVAL = float(os.environ.get("EVENTS_FLUSH_INTERVAL", "0.2"))
+
+stats = {"emitted": 0, "delivered": 0, "dropped": 0, "batches": 0, "failed_batches": 0}
+
+
+def encode(batch):
+    return b"".join(json.dumps(event, separators=(",", ":")).encode() + b"\n" for event in batch)
+
+
+class FileSink:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "ab")
+
+    def write(self, batch):
+        self._file.write(encode(batch))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class SocketSink:
+    # Newline-delimited JSON over a stream socket; reconnects on the next batch after a failure.
+    def __init__(self, family, address):
+        self.family = family
+        self.address = address
+        self._sock = None
+
+    def write(self, batch):
+        if self._sock is None:
+            self._sock = socket.socket(self.family, socket.SOCK_STREAM)
+            self._sock.settimeout(5)
+            try:
+                self._sock.connect(self.address)
+            except OSError:
+                self.close()
+                raise
+        try:
+            self._sock.sendall(encode(batch))
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+class KafkaRestSink:
+    # Produces each batch in one request to a Kafka REST proxy (v2 JSON API). Events are keyed by
+    # game_id, so one game's events land in one partition, in order.
+    CONTENT_TYPE = "application/vnd.kafka.json.v2+json"
+
+    def __init__(self, url):
+        self.url = url
+
+    def write(self, batch):
+        body = json.dumps({"records": [{"key": event["game_id"], "value": event} for event in batch]})
+        request = urllib.request.Request(
+            self.url, data=body.encode(), headers={"Content-Type": self.CONTENT_TYPE}, method="POST"
+        )
+        urllib.request.urlopen(request, timeout=5).close()
+
+    def close(self):
+        pass
+
+
+def _tcp_sink(target):
+    host, _, port = target.rpartition(":")
+    return SocketSink(socket.AF_INET, (host, int(port)))
+
+
+# Other sinks plug in by adding a factory here before startup: factory(target) -> object with
+# write(batch) and close(), called from the drain thread only.
+SINKS = {
+    "file": FileSink,
+    "unix": lambda target: SocketSink(socket.AF_UNIX, target),
+    "tcp": _tcp_sink,
+    "kafka-rest": KafkaRestSink,
+}
+
+
+def make_sink(spec):
+    scheme, _, target = spec.partition(":")
+    if scheme not in SINKS:
+        raise ValueError(f"unknown events sink {scheme!r}; expected one of {', '.join(SINKS)}")
+    return SINKS[scheme](target)
+
+
+class EventStream:
+    # Routers append to a bounded ring buffer and return; a background thread drains it in
+    # batches to the sink. When the sink falls behind, the oldest events are overwritten and
+    # counted as dropped rather than slowing a game down.
+    def __init__(self, sink=None, capacity=EVENTS_BUFFER_SIZE, batch=EVENTS_BATCH, interval=EVENTS_FLUSH_INTERVAL):
+        self.sink = sink
+        self.batch = max(1, batch)
+        self.interval = interval
+        self._buffer = deque(maxlen=max(1, capacity))
+        self._seq = itertools.count(1)
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = None
+        self._failing = False
+
+    @property
+    def enabled(self):
+        return self.sink is not None
+
+    def emit(self, event, mode, game_id, **fields):
+        if self.sink is None:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._drain_loop, name="event-stream", daemon=True)
+            self._thread.start()
+        buffer = self._buffer
+        if len(buffer) == buffer.maxlen:
+            stats["dropped"] += 1
+        buffer.append(
+            {"seq": next(self._seq), "ts": time.time(), "event": event, "mode": mode, "game_id": game_id, **fields}
+        )
+        stats["emitted"] += 1
+        if len(buffer) >= self.batch and not self._wakeup.is_set():
+            self._wakeup.set()
+
+    def _take(self):
+        batch = []
+        buffer = self._buffer
+        while len(batch) < self.batch:
+            try:
+                batch.append(buffer.popleft())
+            except IndexError:
+                break
+        return batch
+
+    def _deliver(self, batch):
+        try:
+            self.sink.write(batch)
+        except (OSError, ValueError) as exc:
+            stats["failed_batches"] += 1
+            stats["dropped"] += len(batch)
+            # Logged once per outage; the counters keep the rest.
+            if not self._failing:
+                self._failing = True
+                logger.warning("event export failed: %s", exc, extra=log.fields(events=len(batch)))
+            return
+        stats["delivered"] += len(batch)
+        stats["batches"] += 1
+        if self._failing:
+            self._failing = False
+            logger.info("event export recovered")
+
+    def flush(self):
+        batch = self._take()
+        while batch:
+            self._deliver(batch)
+            batch = self._take()
+
+    def _drain_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.sink is not None:
+            self.flush()
+            self.sink.close()
+
+    def pending(self):
+        return len(self._buffer)
+
+    def capacity(self):
+        return self._buffer.maxlen
+
+
+stream = EventStream()
+
+
+def emit(event, mode, game_id, **fields):
+    stream.emit(event, mode, game_id, **fields)
+
+
+def open_stream(spec=EVENTS_SINK):
+    global stream
+    if not spec:
+        return
+    try:
+        stream = EventStream(make_sink(spec))
+    except (OSError, ValueError) as exc:
+        logger.error("events sink unavailable, stream disabled: %s", exc, extra=log.fields(sink=spec))
+        return
+    logger.info("streaming game events", extra=log.fields(sink=spec))
+
+
+def close_stream():
+    global stream
+    stream.close()
+    stream = EventStream()
+
+
+@router.get("/events/stats")
+async def events_stats():
+    return {
+        "sink": EVENTS_SINK if stream.enabled else "",
+        "buffered": stream.pending(),
+        "capacity": stream.capacity(),
+        **stats,
+    }
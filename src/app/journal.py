@@ -0,0 +1,275 @@
+import fcntl
+import glob
+import json
+import os
+import signal
+import threading
+import time
+
+from . import log
+
+
+logger = log.get_logger("journal")
+JOURNAL_PATH = os.environ.get("GAME_JOURNAL_PATH", "")
+JOURNAL_ARCHIVE_DIR = os.environ.get("GAME_JOURNAL_ARCHIVE_DIR", "")
+FSYNC_EVERY = int(os.environ.get("GAME_JOURNAL_FSYNC_EVERY", "64"))
+FSYNC_INTERVAL = float(os.environ.get("GAME_JOURNAL_FSYNC_INTERVAL", "0.05"))
+
+# 1012 is sent by uvicorn when the worker is restarting: the game must survive it. A client can
+# send 1012 too, so it only counts once this worker is really shutting down.
+RESUMABLE_CLOSE_CODES = {1012}
+SHUTDOWN_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+shutting_down = False
+
+
+class GameJournal:
+    def __init__(self, path, fsync_every=FSYNC_EVERY, fsync_interval=FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval = fsync_interval
+        self.records = 0
+        self.fsyncs = 0
+        self._file = open(path, "ab")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop, name="game-journal", daemon=True)
+        self._flusher.start()
+
+    def append(self, record):
+        line = json.dumps(record, separators=(",", ":")).encode() + b"\n"
+        with self._lock:
+            if self._closed:
+                return
+            self._file.write(line)
+            self._pending += 1
+            self.records += 1
+            if self._pending >= self.fsync_every:
+                self._wakeup.set()
+
+    def flush(self):
+        with self._lock:
+            if self._pending == 0 or self._file.closed:
+                return
+            self._file.flush()
+            self._pending = 0
+            fd = self._file.fileno()
+        os.fsync(fd)
+        self.fsyncs += 1
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.fsync_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except (OSError, ValueError) as exc:
+                logger.error("fsync failed: %s", exc)
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self._flusher.join()
+        self.flush()
+        with self._lock:
+            self._file.close()
+
+    def record_create(self, mode, game_id, fields):
+        self.append({"op": "create", "mode": mode, "game_id": game_id, "ts": time.time(), "fields": fields})
+
+    def record_move(self, mode, game_id, h, w):
+        self.append({"op": "move", "mode": mode, "game_id": game_id, "row": h, "col": w})
+
+    def record_end(self, mode, game_id, game_status):
+        self.append({"op": "end", "mode": mode, "game_id": game_id, "ts": time.time(), "game_status": game_status})
+
+
+def read_records(path):
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A torn write at the tail of the journal is expected after a crash.
+                continue
+            if isinstance(record, dict) and "op" in record:
+                yield record
+
+
+def live_games(path):
+    games = {}
+    for record in read_records(path):
+        key = (record.get("mode"), record.get("game_id"))
+        op = record["op"]
+        if op == "create":
+            games[key] = {"create": record, "moves": []}
+        elif op == "move" and key in games:
+            games[key]["moves"].append((record["row"], record["col"]))
+        elif op == "end":
+            games.pop(key, None)
+    return games
+
+
+def compact(path, games, archive_dir=""):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        for (mode, game_id), entry in games.items():
+            f.write(json.dumps(entry["create"], separators=(",", ":")).encode() + b"\n")
+            for h, w in entry["moves"]:
+                record = {"op": "move", "mode": mode, "game_id": game_id, "row": h, "col": w}
+                f.write(json.dumps(record, separators=(",", ":")).encode() + b"\n")
+        f.flush()
+        os.fsync(f.fileno())
+    if archive_dir and os.path.exists(path):
+        # Finished games are only dropped from the live journal; the archive keeps them for python -m training.analytics.
+        os.makedirs(archive_dir, exist_ok=True)
+        # Named after the slot too: a worker archives adopted slots in the same second as its own.
+        name = f"journal-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{os.path.basename(path)}.log"
+        os.replace(path, os.path.join(archive_dir, name))
+    os.replace(tmp_path, path)
+
+
+def lock_slot(slot_path):
+    lock = open(f"{slot_path}.lock", "ab")
+    try:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return None
+    return lock
+
+
+def claim_slot(path):
+    # Every worker journals to a file of its own: GAME_JOURNAL_PATH for the first, then
+    # PATH.1, PATH.2, ... A worker owns its file while it holds the lock next to it, so only it
+    # restores and compacts it. After a restart, each file goes to the worker that claims that
+    # slot, or to the first worker that finds it unclaimed (see orphan_slots).
+    slot = 0
+    while True:
+        slot_path = path if slot == 0 else f"{path}.{slot}"
+        lock = lock_slot(slot_path)
+        if lock is not None:
+            return slot_path, lock
+        slot += 1
+
+
+def orphan_slots(path, own_path):
+    # With overlapping restarts, new workers can claim low slots while old ones still hold them,
+    # so a higher slot may never be claimed again. Any non-empty slot file nobody holds is an
+    # orphan; the lock is taken before it is read and held until the caller has emptied it.
+    slot_paths = [path] + [
+        lock_path[: -len(".lock")]
+        for lock_path in glob.glob(f"{glob.escape(path)}.*.lock")
+        if lock_path[len(path) + 1 : -len(".lock")].isdigit()
+    ]
+    orphans = []
+    for slot_path in slot_paths:
+        if slot_path == own_path or not os.path.exists(slot_path):
+            continue
+        lock = lock_slot(slot_path)
+        if lock is None:
+            continue
+        if os.path.getsize(slot_path) == 0:
+            lock.close()
+            continue
+        orphans.append((slot_path, lock))
+    return orphans
+
+
+def is_resumable_close(code):
+    return shutting_down and code in RESUMABLE_CLOSE_CODES
+
+
+def _mark_shutdown(previous):
+    def handler(signum, frame):
+        global shutting_down
+        shutting_down = True
+        previous(signum, frame)
+
+    return handler
+
+
+def watch_shutdown():
+    # uvicorn installs its exit handlers before the lifespan starts; ours runs first and passes on.
+    try:
+        for signum in SHUTDOWN_SIGNALS:
+            previous = signal.getsignal(signum)
+            if callable(previous):
+                signal.signal(signum, _mark_shutdown(previous))
+                _restore_signals[signum] = previous
+    except ValueError:
+        # Not the main thread (e.g. the test client): there is no server restart to tell apart.
+        pass
+
+
+journal = None
+_slot_lock = None
+_restore_signals = {}
+
+
+def record_create(mode, game_id, fields):
+    if journal is not None:
+        journal.record_create(mode, game_id, fields)
+
+
+def record_move(mode, game_id, h, w):
+    if journal is not None:
+        journal.record_move(mode, game_id, h, w)
+
+
+def record_end(mode, game_id, game_status):
+    if journal is not None:
+        journal.record_end(mode, game_id, game_status)
+
+
+def open_journal(restorers, path=JOURNAL_PATH, archive_dir=JOURNAL_ARCHIVE_DIR):
+    global journal, _slot_lock, shutting_down
+    if not path:
+        return 0
+
+    shutting_down = False
+    watch_shutdown()
+    slot_path, _slot_lock = claim_slot(path)
+    games = live_games(slot_path)
+    orphans = orphan_slots(path, slot_path)
+    for orphan_path, _ in orphans:
+        for key, entry in live_games(orphan_path).items():
+            games.setdefault(key, entry)
+    path = slot_path
+    restored = 0
+    for (mode, game_id), entry in games.items():
+        restore = restorers.get(mode)
+        if restore is None:
+            continue
+        try:
+            restore(entry["create"]["fields"], entry["moves"])
+            restored += 1
+        except Exception as exc:
+            logger.error("could not restore game: %s", exc, extra=log.fields(mode=mode, game_id=game_id))
+    compact(path, games, archive_dir)
+    # Adopted games are in our file now. A crash before an orphan is emptied leaves them in both
+    # files, and the next start keeps one copy of each.
+    for orphan_path, lock in orphans:
+        compact(orphan_path, {}, archive_dir)
+        lock.close()
+    journal = GameJournal(path)
+    logger.info("restored in-progress games", extra=log.fields(restored=restored, path=path, adopted=len(orphans)))
+    return restored
+
+
+def close_journal():
+    global journal, _slot_lock
+    if journal is not None:
+        journal.close()
+        journal = None
+    if _slot_lock is not None:
+        _slot_lock.close()
+        _slot_lock = None
+    for signum, previous in _restore_signals.items():
+        signal.signal(signum, previous)
+    _restore_signals.clear()
@@ -0,0 +1,98 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+# Fraction of accepted moves logged at INFO; at DEBUG every move is logged with its board.
+LOG_MOVE_SAMPLE_RATE = float(os.environ.get("LOG_MOVE_SAMPLE_RATE", "0.01"))
+
+stats = {"dropped": 0}
+_sampler = random.Random()
+
+
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, as_json=False):
+        super().__init__()
+        self.as_json = as_json
+
+    def format(self, record):
+        fields = getattr(record, "fields", {})
+        board = getattr(record, "board", None)
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+        timestamp = f"{timestamp}.{int(record.msecs):03d}Z"
+        if self.as_json:
+            payload = {
+                "ts": timestamp,
+                "level": record.levelname,
+                "logger": record.name,
+                "event": record.getMessage(),
+                **fields,
+            }
+            if board is not None:
+                payload["board"] = board
+            if record.exc_info:
+                payload["exc"] = self.formatException(record.exc_info)
+            return json.dumps(payload, default=str)
+
+        line = f"{timestamp} {record.levelname} {record.name}: {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if board is not None:
+            line += "\n" + board
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Formatting happens on the listener thread, not in the event loop.
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            stats["dropped"] += 1
+
+
+def _configure():
+    logger = logging.getLogger("app")
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    logger.addHandler(DroppingQueueHandler(log_queue))
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(StructuredFormatter(as_json=LOG_FORMAT == "json"))
+    listener = logging.handlers.QueueListener(log_queue, output)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+_listener = _configure()
+
+
+def get_logger(name):
+    return logging.getLogger(f"app.{name}")
+
+
+def fields(**values):
+    return {"fields": values}
+
+
+def move(logger, game_id, status, render_board, **values):
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(status, extra={"fields": {"game_id": game_id, **values}, "board": render_board()})
+    elif LOG_MOVE_SAMPLE_RATE > 0 and _sampler.random() < LOG_MOVE_SAMPLE_RATE and logger.isEnabledFor(logging.INFO):
+        logger.info(status, extra={"fields": {"game_id": game_id, "sampled": LOG_MOVE_SAMPLE_RATE, **values}})
@@ -1,11 +1,51 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
-from .offline import router as offline_router
-from .online import router as online_router
-from .ai import router as ai_router
+from . import events, journal, ratings, tracing
+from .offline import router as offline_router, restore_session as restore_offline_session
+from .online import router as online_router, restore_session as restore_online_session
+from .ai import router as ai_router, restore_session as restore_ai_session
+from .events import router as events_router
+from .matchmaking import router as matchmaking_router
+from .multiplex import router as multiplex_router
+from .ratings import router as ratings_router
+from .ratelimit import router as ratelimit_router
+from .resume import router as resume_router
+from .tracing import router as tracing_router
+from .profiling import router as profiling_router
+
+
+@asynccontextmanager
+async def lifespan(app):
+    journal.open_journal(
+        {
+            "offline": restore_offline_session,
+            "online": restore_online_session,
+            "ai": restore_ai_session,
+        }
+    )
+    ratings.open_store()
+    events.open_stream()
+    try:
+        yield
+    finally:
+        events.close_stream()
+        ratings.close_store()
+        tracing.close()
+        journal.close_journal()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+# Ahead of the offline router so /ws/mux is not captured by /ws/{game_id}.
+app.include_router(multiplex_router)
 app.include_router(offline_router)
 app.include_router(online_router)
 app.include_router(ai_router)
+app.include_router(matchmaking_router)
+app.include_router(ratings_router)
+app.include_router(ratelimit_router)
+app.include_router(resume_router)
+app.include_router(events_router)
+app.include_router(tracing_router)
+app.include_router(profiling_router)
@@ -0,0 +1,443 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from json import JSONDecodeError
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError, field_validator
+
+from . import core
+from . import log
+from . import online
+from . import ratelimit
+from . import ratings
+
+
+router = APIRouter()
+logger = log.get_logger("matchmaking")
+
+MATCHMAKING_MODE = os.environ.get("MATCHMAKING_MODE", "rating")
+RATING_MAX = 4000.0
+BUCKET_WIDTH = 10.0
+BASE_TOLERANCE = 100.0
+TOLERANCE_GROWTH = 50.0
+MAX_TOLERANCE = 1000.0
+SWEEP_INTERVAL = 1.0
+MATCH_TTL = 60.0
+# A player queued over HTTP who stops polling for this long has left; their ticket is dropped
+# instead of being matched into a game nobody joins.
+POLL_TTL = 30.0
+QUEUE_TIME_SAMPLES = 10_000
+
+
+class MatchmakingPayload(core.BoardPayload):
+    player_id: str
+    # Only honoured in test mode (GAME_SEED); otherwise players could pick their own bracket.
+    rating: float | None = None
+
+    @field_validator("player_id", mode="before")
+    @classmethod
+    def validate_and_strip_id(cls, value):
+        return core.strip_id(value)
+
+    @field_validator("seed")
+    @classmethod
+    def reject_seed(cls, value):
+        if value is not None:
+            raise ValueError("matched games draw their own seed")
+        return value
+
+
+class FenwickTree:
+    def __init__(self, size):
+        self.size = size
+        self.tree = [0] * (size + 1)
+        self.total = 0
+        self.top_bit = 1 << (size.bit_length() - 1)
+
+    def add(self, index, delta):
+        self.total += delta
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, index):
+        total = 0
+        i = index + 1
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, k):
+        # Smallest index whose prefix count reaches k.
+        pos = 0
+        bit = self.top_bit
+        while bit:
+            nxt = pos + bit
+            if nxt <= self.size and self.tree[nxt] < k:
+                pos = nxt
+                k -= self.tree[nxt]
+            bit >>= 1
+        return pos
+
+
+class MatchQueue:
+    def __init__(self, mode, board_size, win_length):
+        self.mode = mode
+        self.board_size = board_size
+        self.win_length = win_length
+        # Every ticket sits in `order` (oldest first) and, in rating mode, in its rating bucket.
+        self.order = OrderedDict()
+        bucket_count = int(RATING_MAX // BUCKET_WIDTH) + 1
+        self.buckets = [None] * bucket_count
+        self.counts = FenwickTree(bucket_count)
+
+    def __len__(self):
+        return len(self.order)
+
+    def _insert(self, ticket):
+        self.order[ticket["player_id"]] = ticket
+        if self.mode == "rating":
+            bucket = ticket["bucket"]
+            if self.buckets[bucket] is None:
+                self.buckets[bucket] = OrderedDict()
+            self.buckets[bucket][ticket["player_id"]] = ticket
+            self.counts.add(bucket, 1)
+
+    def remove(self, player_id):
+        ticket = self.order.pop(player_id, None)
+        if ticket is not None and self.mode == "rating":
+            del self.buckets[ticket["bucket"]][player_id]
+            self.counts.add(ticket["bucket"], -1)
+        return ticket
+
+    def _oldest_in_bucket(self, bucket, exclude):
+        for player_id, ticket in self.buckets[bucket].items():
+            if player_id != exclude:
+                return ticket
+        return None
+
+    def _nearest(self, ticket, tolerance):
+        bucket = ticket["bucket"]
+        excluded = ticket["player_id"] in self.order
+        if excluded:
+            self.counts.add(bucket, -1)
+        try:
+            below = self.counts.prefix(bucket)
+            candidates = []
+            if below > 0:
+                candidates.append(self.counts.find(below))
+            if below < self.counts.total:
+                candidates.append(self.counts.find(below + 1))
+        finally:
+            if excluded:
+                self.counts.add(bucket, 1)
+
+        best = None
+        for candidate_bucket in candidates:
+            other = self._oldest_in_bucket(candidate_bucket, ticket["player_id"])
+            if other is None:
+                continue
+            distance = abs(other["rating"] - ticket["rating"])
+            if distance <= tolerance and (best is None or distance < abs(best["rating"] - ticket["rating"])):
+                best = other
+        return best
+
+    def enqueue(self, ticket):
+        if self.mode == "rating":
+            opponent = self._nearest(ticket, BASE_TOLERANCE)
+        else:
+            opponent = next(iter(self.order.values()), None)
+        if opponent is None:
+            self._insert(ticket)
+            return None
+        self.remove(opponent["player_id"])
+        return opponent
+
+    def sweep(self, now):
+        if self.mode != "rating":
+            return []
+        pairs = []
+        for ticket in list(self.order.values()):
+            if ticket["player_id"] not in self.order:
+                continue
+            waited = now - ticket["enqueued_at"]
+            if waited < SWEEP_INTERVAL:
+                break
+            tolerance = min(MAX_TOLERANCE, BASE_TOLERANCE + TOLERANCE_GROWTH * waited)
+            opponent = self._nearest(ticket, tolerance)
+            if opponent is not None:
+                self.remove(ticket["player_id"])
+                self.remove(opponent["player_id"])
+                pairs.append((ticket, opponent))
+        return pairs
+
+
+queues = {}
+waiting = {}
+matches = {}
+queue_times = deque(maxlen=QUEUE_TIME_SAMPLES)
+stats = {"enqueued": 0, "matched_games": 0, "cancelled": 0, "expired": 0}
+_sweeper = None
+
+
+def get_queue(board_size, win_length):
+    key = (board_size, win_length)
+    if key not in queues:
+        queues[key] = MatchQueue(MATCHMAKING_MODE, board_size, win_length)
+    return queues[key]
+
+
+async def requested_rating(payload):
+    # A stored rating may have to come from SQLite, which is read off the event loop.
+    if payload.rating is not None and core.GAME_SEED:
+        return payload.rating
+    return await asyncio.to_thread(ratings.rating_of, payload.player_id)
+
+
+def make_ticket(player_id, rating):
+    rating = min(max(rating, 0.0), RATING_MAX)
+    now = time.monotonic()
+    return {
+        "player_id": player_id,
+        "rating": rating,
+        "bucket": int(rating // BUCKET_WIDTH),
+        "enqueued_at": now,
+        # Last sign of life from an HTTP-queued player; a websocket ticket has its future instead.
+        "polled_at": now,
+        "future": None,
+    }
+
+
+def unavailable(ticket, now):
+    # Why a queued player can no longer be matched, or None.
+    if ticket["player_id"] in online.active_online_player_ids:
+        return "player joined another online game"
+    if ticket["future"] is None and now - ticket["polled_at"] > POLL_TTL:
+        return f"no poll for {POLL_TTL:g}s"
+    return None
+
+
+def expire(ticket, reason):
+    # The ticket is already out of its queue; its player learns why on the next poll or socket.
+    player_id = ticket["player_id"]
+    waiting.pop(player_id, None)
+    stats["expired"] += 1
+    result = {"status": "expired", "player_id": player_id, "reason": reason}
+    future = ticket["future"]
+    if future is not None and not future.done():
+        future.set_result(result)
+    else:
+        matches[player_id] = (result, time.monotonic())
+    logger.info("ticket expired", extra=log.fields(player_id=player_id, reason=reason))
+
+
+def start_game(queue, first, second):
+    # The player who waited longer plays X and starts.
+    now = time.monotonic()
+    game_id = f"mm-{uuid.uuid4().hex[:16]}"
+    online.create_session(
+        game_id,
+        first["player_id"],
+        second["player_id"],
+        first["player_id"],
+        queue.board_size,
+        queue.win_length,
+    )
+    stats["matched_games"] += 1
+    results = {}
+    for ticket, role, opponent in ((first, "X", second), (second, "O", first)):
+        waited = now - ticket["enqueued_at"]
+        queue_times.append(waited)
+        waiting.pop(ticket["player_id"], None)
+        match = {
+            "status": "matched",
+            "game_id": game_id,
+            "ws_path": f"/ws/online/{game_id}",
+            "player_id": ticket["player_id"],
+            "role": role,
+            "opponent": opponent["player_id"],
+            "waited_ms": round(waited * 1000, 1),
+        }
+        future = ticket["future"]
+        if future is not None and not future.done():
+            future.set_result(match)
+        else:
+            matches[ticket["player_id"]] = (match, now)
+        results[ticket["player_id"]] = match
+    return results
+
+
+def enqueue(payload, rating, future=None):
+    player_id = payload.player_id
+    if player_id in waiting:
+        raise HTTPException(status_code=400, detail="player is already queued")
+    if player_id in online.active_online_player_ids:
+        raise HTTPException(status_code=400, detail="player is already in an online game")
+
+    ensure_sweeper()
+    matches.pop(player_id, None)
+    queue = get_queue(payload.board_size, payload.win_length)
+    ticket = make_ticket(player_id, rating)
+    ticket["future"] = future
+    stats["enqueued"] += 1
+    while True:
+        opponent = queue.enqueue(ticket)
+        if opponent is None:
+            waiting[player_id] = queue
+            return None
+        # The opponent was checked when they queued; they may have started another game or
+        # stopped polling since.
+        reason = unavailable(opponent, ticket["enqueued_at"])
+        if reason is None:
+            return start_game(queue, opponent, ticket)[player_id]
+        expire(opponent, reason)
+
+
+def cancel(player_id):
+    queue = waiting.pop(player_id, None)
+    if queue is None:
+        return False
+    queue.remove(player_id)
+    stats["cancelled"] += 1
+    return True
+
+
+def sweep_once(now=None):
+    now = time.monotonic() if now is None else now
+    paired = 0
+    for queue in list(queues.values()):
+        for ticket in list(queue.order.values()):
+            reason = unavailable(ticket, now)
+            if reason is not None:
+                queue.remove(ticket["player_id"])
+                expire(ticket, reason)
+        for first, second in queue.sweep(now):
+            start_game(queue, first, second)
+            paired += 1
+    for player_id, (_, created_at) in list(matches.items()):
+        if now - created_at > MATCH_TTL:
+            del matches[player_id]
+    return paired
+
+
+async def sweep_forever():
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        try:
+            sweep_once()
+        except Exception as exc:
+            logger.exception("sweep failed: %s", exc)
+
+
+def ensure_sweeper():
+    global _sweeper
+    if _sweeper is None or _sweeper.done():
+        _sweeper = asyncio.get_running_loop().create_task(sweep_forever())
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return round(sorted_values[index] * 1000, 1)
+
+
+@router.post("/matchmaking")
+async def join_queue(payload: MatchmakingPayload):
+    match = enqueue(payload, await requested_rating(payload))
+    if match is not None:
+        return match
+    return {
+        "status": "waiting",
+        "poll_path": f"/matchmaking/{payload.player_id}",
+        "ws_path": f"/ws/matchmaking/{payload.player_id}",
+    }
+
+
+@router.get("/matchmaking/stats")
+async def matchmaking_stats():
+    samples = sorted(queue_times)
+    return {
+        "mode": MATCHMAKING_MODE,
+        "waiting": sum(len(queue) for queue in queues.values()),
+        "queues": {f"{size}x{size}/{k}": len(queue) for (size, k), queue in queues.items()},
+        **stats,
+        "queue_time_ms": {
+            "samples": len(samples),
+            "p50": percentile(samples, 0.50),
+            "p90": percentile(samples, 0.90),
+            "p99": percentile(samples, 0.99),
+        },
+    }
+
+
+@router.get("/matchmaking/{player_id}")
+async def queue_status(player_id: str):
+    player_id = player_id.strip()
+    if player_id in matches:
+        return matches.pop(player_id)[0]
+    queue = waiting.get(player_id)
+    if queue is not None:
+        queue.order[player_id]["polled_at"] = time.monotonic()
+        return {"status": "waiting", "poll_path": f"/matchmaking/{player_id}"}
+    raise HTTPException(status_code=404, detail="player is not queued")
+
+
+@router.delete("/matchmaking/{player_id}")
+async def leave_queue(player_id: str):
+    if not cancel(player_id.strip()):
+        raise HTTPException(status_code=404, detail="player is not queued")
+    return {"status": "cancelled"}
+
+
+@router.websocket("/ws/matchmaking/{queue_player_id}")
+async def websocket_matchmaking(websocket: WebSocket, queue_player_id: str):
+    await websocket.accept()
+    bucket = ratelimit.bucket_for(websocket)
+    player_id = None
+    try:
+        while True:
+            try:
+                raw = await ratelimit.receive_json(websocket, bucket)
+                payload = MatchmakingPayload(**{**raw, "player_id": queue_player_id}) if isinstance(raw, dict) else None
+            except (JSONDecodeError, ValidationError):
+                payload = None
+            if payload is None:
+                await websocket.send_json({"error": "Send {'board_size': 3} to join the queue."})
+                continue
+
+            future = asyncio.get_running_loop().create_future()
+            try:
+                match = enqueue(payload, await requested_rating(payload), future)
+            except HTTPException as exc:
+                await websocket.send_json({"error": exc.detail})
+                continue
+            player_id = payload.player_id
+            break
+
+        if match is None:
+            await websocket.send_json({"status": "waiting", "player_id": player_id})
+            receive = asyncio.ensure_future(websocket.receive())
+            done, _ = await asyncio.wait({future, receive}, return_when=asyncio.FIRST_COMPLETED)
+            if future not in done:
+                # The client left (or spoke out of turn) before a match was found.
+                future.cancel()
+                cancel(player_id)
+                return
+            receive.cancel()
+            match = future.result()
+
+        await websocket.send_json(match)
+        await websocket.close()
+    except WebSocketDisconnect:
+        if player_id is not None:
+            cancel(player_id)
+    except Exception as exc:
+        logger.exception("backend error: %s", exc, extra=log.fields(player_id=player_id))
+        if player_id is not None:
+            cancel(player_id)
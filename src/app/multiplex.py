@@ -0,0 +1,187 @@
+import asyncio
+from json import JSONDecodeError
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from starlette.websockets import WebSocketState
+
+from . import log, ratelimit
+from .ai import websocket_ai
+from .offline import websocket_game
+from .online import websocket_online
+
+
+router = APIRouter()
+logger = log.get_logger("ws-mux")
+
+HANDLERS = {
+    "offline": websocket_game,
+    "online": websocket_online,
+    "ai": websocket_ai,
+}
+MAX_CHANNELS = 4096
+stats = {"connections": 0, "channels_opened": 0, "frames_in": 0, "frames_out": 0}
+
+
+class GameChannel:
+    # Quacks like the WebSocket the per-game handlers expect, but rides on a shared connection.
+    def __init__(self, mux, game_id, resume_token=None):
+        self.mux = mux
+        self.game_id = game_id
+        # The open frame stands in for the query string of a dedicated socket.
+        self.query_params = {"resume_token": resume_token} if resume_token else {}
+        self.inbox = asyncio.Queue()
+        # The same per-game limit as a dedicated socket; the connection's bucket only caps the total.
+        self.bucket = ratelimit.TokenBucket()
+        self.kicked = False
+        self.rate_limited_upstream = True
+        self.client_state = WebSocketState.CONNECTING
+        # Set once the "closed" event is sent. client_state alone can't tell: it also turns
+        # DISCONNECTED when the client closes the channel, which still needs the event.
+        self.closed = False
+
+    async def accept(self):
+        self.client_state = WebSocketState.CONNECTED
+
+    async def receive_json(self):
+        message = await self.inbox.get()
+        if isinstance(message, WebSocketDisconnect):
+            self.client_state = WebSocketState.DISCONNECTED
+            raise message
+        return message
+
+    async def send_json(self, data):
+        if self.client_state == WebSocketState.DISCONNECTED:
+            raise RuntimeError(f"Channel {self.game_id} is closed.")
+        await self.mux.send({"game_id": self.game_id, "data": data})
+
+    async def close(self, code=1000, reason=None):
+        if self.closed:
+            return
+        self.closed = True
+        self.client_state = WebSocketState.DISCONNECTED
+        await self.mux.send({"game_id": self.game_id, "event": "closed", "code": code})
+
+    def disconnect(self, code):
+        self.inbox.put_nowait(WebSocketDisconnect(code))
+
+    async def deliver(self, data):
+        # Returns an error for the client, or None once the frame is queued or silently dropped.
+        if self.kicked:
+            return None
+        if self.bucket.allow():
+            ratelimit.stats["allowed"] += 1
+            self.inbox.put_nowait(data)
+            return None
+        action = ratelimit.reject(self.bucket)
+        if action == "close":
+            # Only this game is closed, as its own socket would have been; the others keep going.
+            self.kicked = True
+            self.closed = True
+            self.disconnect(ratelimit.POLICY_VIOLATION)
+            await self.mux.send({"game_id": self.game_id, "event": "closed", "code": ratelimit.POLICY_VIOLATION})
+            return None
+        return ratelimit.RATE_LIMITED_NOTE if action == "notify" else None
+
+
+class Multiplexer:
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.channels = {}
+        self.tasks = set()
+        self.send_lock = asyncio.Lock()
+
+    async def send(self, payload):
+        async with self.send_lock:
+            if self.websocket.client_state != WebSocketState.DISCONNECTED:
+                await self.websocket.send_json(payload)
+                stats["frames_out"] += 1
+
+    async def open(self, mode, game_id, resume_token=None):
+        handler = HANDLERS.get(mode)
+        if handler is None:
+            return f"mode must be one of {sorted(HANDLERS)}."
+        if not isinstance(game_id, str) or game_id.strip() == "":
+            return "game_id is required."
+        if game_id in self.channels:
+            return f"Channel {game_id} is already open on this connection."
+        if len(self.channels) >= MAX_CHANNELS:
+            return f"At most {MAX_CHANNELS} games per connection."
+
+        channel = GameChannel(self, game_id, resume_token)
+        self.channels[game_id] = channel
+        stats["channels_opened"] += 1
+        task = asyncio.create_task(self.run(handler, channel))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return None
+
+    async def run(self, handler, channel):
+        try:
+            await handler(channel, channel.game_id)
+        except Exception as exc:
+            logger.exception("backend error: %s", exc, extra=log.fields(game_id=channel.game_id))
+        finally:
+            if self.channels.get(channel.game_id) is channel:
+                del self.channels[channel.game_id]
+            await channel.close()
+
+    async def route(self, message):
+        if not isinstance(message, dict):
+            return "Invalid frame. Use {'game_id': '...', 'data': {...}}."
+        op = message.get("op")
+        game_id = message.get("game_id")
+        if op == "open":
+            return await self.open(message.get("mode"), game_id, message.get("resume_token"))
+
+        channel = self.channels.get(game_id)
+        if channel is None:
+            return f"No open channel for game_id {game_id!r}."
+        if op == "close":
+            channel.disconnect(1000)
+        elif "data" in message:
+            return await channel.deliver(message["data"])
+        else:
+            return "Frame needs an op ('open'/'close') or a data field."
+        return None
+
+    async def shutdown(self, code):
+        for channel in list(self.channels.values()):
+            channel.disconnect(code)
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+@router.websocket("/ws/mux")
+async def websocket_mux(websocket: WebSocket):
+    await websocket.accept()
+    bucket = ratelimit.bucket_for(websocket, ratelimit.WS_MUX_RATE_LIMIT, ratelimit.WS_MUX_RATE_BURST)
+    mux = Multiplexer(websocket)
+    stats["connections"] += 1
+    code = 1000
+    try:
+        while True:
+            try:
+                message = await ratelimit.receive_json(websocket, bucket)
+            except JSONDecodeError:
+                await mux.send({"error": "Invalid JSON frame."})
+                continue
+            stats["frames_in"] += 1
+            error = await mux.route(message)
+            if error is not None:
+                reply = {"error": error}
+                if isinstance(message, dict) and "game_id" in message:
+                    reply["game_id"] = message["game_id"]
+                await mux.send(reply)
+    except WebSocketDisconnect as exc:
+        code = exc.code
+    except Exception as exc:
+        logger.exception("backend error: %s", exc)
+    finally:
+        stats["connections"] -= 1
+        # Sessions see the same close code a dedicated socket would have delivered (1012 from a restart stays resumable).
+        await mux.shutdown(code)
+
+
+@router.get("/mux/stats")
+async def mux_stats():
+    return dict(stats)
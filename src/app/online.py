@@ -1,19 +1,29 @@
 import asyncio
+import random
 from json import JSONDecodeError
 from typing import Optional
 
 from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
-from pydantic import BaseModel, field_validator
-
+from pydantic import field_validator
+
+from . import core
+from . import events
+from . import journal
+from . import log
+from . import ratelimit
+from . import ratings
+from . import resume
 from . import tic_tac_toe_cli as game
+from . import tracing
 
 
 router = APIRouter()
+logger = log.get_logger("ws-online")
 active_online_games = {}
 active_online_player_ids = set()
 
 
-class OnlinePayload(BaseModel):
+class OnlinePayload(core.BoardPayload):
     game_id: str
     player_x: str
     player_o: str
@@ -22,94 +32,139 @@ class OnlinePayload(BaseModel):
     @field_validator("game_id", "player_x", "player_o", mode="before")
     @classmethod
     def validate_and_strip_id(cls, value):
-        if not isinstance(value, str):
-            raise ValueError("must be a string")
-        stripped = value.strip()
-        if stripped == "":
-            raise ValueError("must not be empty")
-        return stripped
+        return core.strip_id(value)
 
     @field_validator("starting_player", mode="before")
     @classmethod
     def validate_and_strip_optional_starting_player(cls, value):
         if value is None:
             return None
-        if not isinstance(value, str):
-            raise ValueError("must be a string")
-        stripped = value.strip()
-        if stripped == "":
-            raise ValueError("must not be empty")
-        return stripped
-
-
-def websocket_is_open(websocket):
-    return getattr(getattr(websocket, "client_state", None), "name", "") != "DISCONNECTED"
+        return core.strip_id(value)
 
 
-def current_board():
-    return [[game.table_game[h][w]["text"] for w in range(3)] for h in range(3)]
+class OnlineMode(core.SessionMode):
+    invalid_json_note = "Invalid JSON payload. Use JSON object."
+    invalid_payload_note = "Invalid payload. Use JSON object."
+    player_fields = ("player_x", "player_o")
+    register_fields = ("game_id", "player_x", "player_o", "starting_player")
 
-
-def ws_state_message(note=""):
-    state = game.is_winning()
-    payload = {
-        "board": current_board(),
-        "status": game.label["text"],
-        "game_status": state["status"],
-    }
-    if state["status"] == "win":
-        payload["winner"] = state["winner"]
-        payload["line_type"] = state["line_type"]
-        payload["cells"] = state["cells"]
-    if note:
-        payload["message"] = note
-    return payload
+    def precheck(self, session, raw, player_id=None):
+        if raw.get("player_id") != player_id:
+            return "player_id does not match this websocket connection."
+        if len(session["connections"]) < 2:
+            return "Both players must be connected before moves are accepted."
+        if session["roles"][player_id] != session["state"]["player"]:
+            return "Not your turn."
+        return None
+
+    def on_end(self, session, state):
+        ratings.record_online_result(session["player_x"], session["player_o"], state)
+
+    async def sweep(self, now):
+        await super().sweep(now)
+        # Live games where one player is still connected and the other did not come back in time.
+        for session in list(self.sessions.values()):
+            lapsed = [player_id for player_id, expires in session["dropped"].items() if expires <= now]
+            if not lapsed or session["finished"]:
+                continue
+            resume.stats["expired"] += len(lapsed)
+            session["finished"] = True
+            await close_all_connections(session, "A player disconnected. Game closed.")
+            cleanup_session(session["game_id"])
 
 
 async def send_json_safe(websocket, payload):
-    if websocket_is_open(websocket):
+    if core.websocket_is_open(websocket):
         await websocket.send_json(payload)
 
 
 async def broadcast(session, payload):
     for _, ws in list(session["connections"].items()):
-        if websocket_is_open(ws):
+        if core.websocket_is_open(ws):
             await ws.send_json(payload)
 
 
 async def close_all_connections(session, reason):
     await broadcast(session, {"message": reason})
     for _, ws in list(session["connections"].items()):
-        if websocket_is_open(ws):
+        if core.websocket_is_open(ws):
             await ws.close()
     session["connections"].clear()
 
 
-def cleanup_session(game_id):
-    if game_id in active_online_games:
-        session = active_online_games[game_id]
-        active_online_player_ids.discard(session["player_x"])
-        active_online_player_ids.discard(session["player_o"])
-        del active_online_games[game_id]
+def pass_turn(session, ticket):
+    # Synchronous, so it completes even in a handler that is being cancelled.
+    done = session["done"]
+    done.add(ticket)
+    while session["delivered"] in done:
+        done.remove(session["delivered"])
+        session["delivered"] += 1
+    session["advanced"].set()
+    session["advanced"] = asyncio.Event()
+
+
+async def deliver(session, payload, websocket=None):
+    # Moves are applied synchronously, so each one gets a ticket in the order it changed the
+    # board. A handler whose predecessor is still sending waits until that send completes: both
+    # sockets see every board in move order, and a slow socket only ever holds up its own game.
+    # Replies meant for one socket take a ticket too.
+    ticket = session["posted"]
+    session["posted"] += 1
+    try:
+        while session["delivered"] != ticket:
+            await session["advanced"].wait()
+        if websocket is None:
+            await broadcast(session, payload)
+        else:
+            await send_json_safe(websocket, payload)
+    finally:
+        # Also when cancelled while still waiting (a disconnect or shutdown): the ticket is handed
+        # on, or every later send in the game would wait for it forever.
+        pass_turn(session, ticket)
 
 
-@router.post("/online")
-async def online(payload: OnlinePayload):
-    game_id = payload.game_id
-    player_x = payload.player_x
-    player_o = payload.player_o
-    starting_player = payload.starting_player or player_x
+def cleanup_session(game_id, resumable=False):
+    MODE.finish(game_id, resumable)
 
-    if player_x == player_o:
-        raise HTTPException(status_code=400, detail="player_x and player_o must be different")
-    if starting_player not in {player_x, player_o}:
-        raise HTTPException(status_code=400, detail="starting_player must be player_x or player_o")
-    if game_id in active_online_games:
-        raise HTTPException(status_code=400, detail="game_id must be unique")
-    if player_x in active_online_player_ids or player_o in active_online_player_ids:
-        raise HTTPException(status_code=400, detail="player ids must be unique")
 
+async def drop_player(game_id, player_id, websocket, code=None):
+    session = active_online_games.get(game_id)
+    if session is None or session["finished"]:
+        return
+    if player_id is None or session["connections"].get(player_id) is not websocket:
+        # This socket never joined the game, so the players who did are unaffected.
+        return
+    del session["connections"][player_id]
+
+    if code is not None and resume.should_hold(code):
+        resume.stats["held"] += 1
+        if not session["connections"]:
+            MODE.suspend(session)
+            return
+        session["dropped"][player_id] = resume.deadline()
+        resume.ensure_sweeper()
+        await deliver(
+            session,
+            {"message": f"Opponent disconnected. Waiting {resume.RESUME_GRACE_SECONDS:g}s for them to reconnect."},
+        )
+        return
+
+    if session["connections"]:
+        await close_all_connections(session, "A player disconnected. Game closed.")
+    cleanup_session(game_id, resumable=journal.is_resumable_close(code))
+
+
+def register_session(
+    game_id,
+    player_x,
+    player_o,
+    starting_player,
+    board_size=game.DEFAULT_SIZE,
+    win_length=game.DEFAULT_WIN_LENGTH,
+    seed=None,
+):
     starting_role = "X" if starting_player == player_x else "O"
+    seed = core.session_seed(game_id, seed)
 
     active_online_games[game_id] = {
         "game_id": game_id,
@@ -118,23 +173,80 @@ async def online(payload: OnlinePayload):
         "starting_player": starting_player,
         "starting_role": starting_role,
         "roles": {player_x: "X", player_o: "O"},
-        "state": game.create_game_state(player_choice=starting_role),
+        "seed": seed,
+        "state": game.create_game_state(
+            player_choice=starting_role, size=board_size, win_length=win_length, rng=random.Random(seed)
+        ),
         "connections": {},
-        "lock": asyncio.Lock(),
+        # Players who dropped mid-game, with the deadline for coming back.
+        "dropped": {},
+        "joining": asyncio.Lock(),
+        # Orders outgoing messages; see deliver().
+        "posted": 0,
+        "delivered": 0,
+        "done": set(),
+        "advanced": asyncio.Event(),
         "finished": False,
     }
     active_online_player_ids.add(player_x)
     active_online_player_ids.add(player_o)
-    return {"ws_path": f"/ws/online/{game_id}"}
+    return active_online_games[game_id]
+
+
+MODE = OnlineMode("online", active_online_games, active_online_player_ids, logger, register_session)
+
+
+def restore_session(fields, moves):
+    session = register_session(**fields)
+    game.replay_moves(session["state"], moves)
+
+
+def create_session(game_id, player_x, player_o, starting_player, board_size, win_length, seed=None):
+    session = register_session(game_id, player_x, player_o, starting_player, board_size, win_length, seed)
+    fields = {
+        "game_id": game_id,
+        "player_x": player_x,
+        "player_o": player_o,
+        "starting_player": starting_player,
+        "board_size": board_size,
+        "win_length": win_length,
+        "seed": session["seed"],
+    }
+    journal.record_create("online", game_id, fields)
+    events.emit("created", "online", game_id, fields=fields)
+    return session
+
+
+@router.post("/online")
+async def online(payload: OnlinePayload):
+    game_id = payload.game_id
+    player_x = payload.player_x
+    player_o = payload.player_o
+    starting_player = payload.starting_player or player_x
+    board_size = payload.board_size
+    win_length = payload.win_length
+
+    if player_x == player_o:
+        raise HTTPException(status_code=400, detail="player_x and player_o must be different")
+    if starting_player not in {player_x, player_o}:
+        raise HTTPException(status_code=400, detail="starting_player must be player_x or player_o")
+    if game_id in active_online_games or game_id in MODE.suspended:
+        raise HTTPException(status_code=400, detail="game_id must be unique")
+    if player_x in active_online_player_ids or player_o in active_online_player_ids:
+        raise HTTPException(status_code=400, detail="player ids must be unique")
+
+    session = create_session(game_id, player_x, player_o, starting_player, board_size, win_length, payload.seed)
+    return {"ws_path": f"/ws/online/{game_id}", **core.seed_reply(session, payload.seed)}
 
 
 @router.websocket("/ws/online/{game_id}")
 async def websocket_online(websocket: WebSocket, game_id: str):
     await websocket.accept()
-    session = active_online_games.get(game_id)
+    bucket = ratelimit.bucket_for(websocket)
+    token = resume.requested_token(websocket)
     player_id = None
 
-    if session is None:
+    if game_id not in active_online_games and game_id not in MODE.suspended:
         await websocket.send_json({"error": "Game not found."})
         await websocket.close()
         return
@@ -142,7 +254,7 @@ async def websocket_online(websocket: WebSocket, game_id: str):
     try:
         while True:
             try:
-                join_payload = await websocket.receive_json()
+                join_payload = await ratelimit.receive_json(websocket, bucket)
             except JSONDecodeError:
                 await send_json_safe(websocket, {"error": "Invalid JSON join payload."})
                 continue
@@ -157,13 +269,30 @@ async def websocket_online(websocket: WebSocket, game_id: str):
                 continue
 
             player_id = raw_player_id.strip()
+            # Looked up after the join payload: the game may have been suspended or revived meanwhile.
+            session = active_online_games.get(game_id)
+            if session is None and game_id in MODE.suspended:
+                if player_id not in MODE.suspended_players(game_id):
+                    await send_json_safe(websocket, {"error": "Unknown player_id for this game."})
+                    continue
+                session, _, expires = MODE.revive(game_id, token, player_id)
+                if session is None:
+                    await websocket.send_json({"error": "Invalid resume token."})
+                    await websocket.close()
+                    return
+                session["dropped"] = {dropped_id: expires for dropped_id in session["resume_tokens"]}
+                resume.ensure_sweeper()
+            if session is None:
+                await websocket.send_json({"error": "Game not found."})
+                await websocket.close()
+                return
             if player_id not in session["roles"]:
                 await send_json_safe(websocket, {"error": "Unknown player_id for this game."})
                 continue
 
             break
 
-        async with session["lock"]:
+        async with session["joining"]:
             if session["finished"]:
                 await websocket.send_json({"error": "Game already finished."})
                 await websocket.close()
@@ -174,26 +303,43 @@ async def websocket_online(websocket: WebSocket, game_id: str):
                 await websocket.close()
                 return
 
+            resumed = player_id in session["dropped"]
+            if resumed:
+                if not resume.token_matches(session["resume_tokens"].get(player_id), token):
+                    resume.stats["rejected_tokens"] += 1
+                    await websocket.send_json({"error": "Invalid resume token."})
+                    await websocket.close()
+                    return
+                del session["dropped"][player_id]
+                resume.stats["resumed"] += 1
+
             session["connections"][player_id] = websocket
 
+        events.emit(
+            "connected", "online", game_id, player_id=player_id, role=session["roles"][player_id], resumed=resumed
+        )
+        state = session["state"]
         await send_json_safe(
             websocket,
             {
                 "message": "Connected.",
                 "player_id": player_id,
                 "role": session["roles"][player_id],
+                "resume_token": MODE.issue_token(session, player_id),
             },
         )
 
         if len(session["connections"]) < 2:
             await send_json_safe(websocket, {"message": "Waiting for the other player to connect."})
+        elif resumed:
+            logger.info("player reconnected", extra=log.fields(game_id=game_id, player_id=player_id))
+            await deliver(session, core.state_message(state, "Both players connected. Game resumed."))
         else:
-            game.bind_state(session["state"])
-            print(f"[ws-online {game_id}] both connected")
-            game.print_board()
-            await broadcast(
+            logger.info("both players connected", extra=log.fields(game_id=game_id))
+            await deliver(
                 session,
-                ws_state_message(
+                core.state_message(
+                    state,
                     f"Both players connected. {session['starting_player']} "
                     f"({session['starting_role']}) starts. Send "
                     "{'player_id': '...', 'row': 0, 'col': 0}."
@@ -201,81 +347,40 @@ async def websocket_online(websocket: WebSocket, game_id: str):
             )
 
         while True:
-            game.bind_state(session["state"])
             try:
-                raw = await websocket.receive_json()
+                raw = await ratelimit.receive_json(websocket, bucket)
             except JSONDecodeError:
-                await send_json_safe(websocket, ws_state_message("Invalid JSON payload. Use JSON object."))
+                await deliver(session, core.state_message(state, MODE.invalid_json_note), websocket)
                 continue
 
-            async with session["lock"]:
-                note = ""
-                should_end = False
-
-                if not isinstance(raw, dict):
-                    note = "Invalid payload. Use JSON object."
-                else:
-                    msg_player_id = raw.get("player_id")
-                    h = raw.get("row")
-                    w = raw.get("col")
-
-                    if msg_player_id != player_id:
-                        note = "player_id does not match this websocket connection."
-                    elif len(session["connections"]) < 2:
-                        note = "Both players must be connected before moves are accepted."
-                    elif session["roles"][player_id] != game.player:
-                        note = "Not your turn."
-                    elif type(h) is not int or type(w) is not int:
-                        note = "Invalid payload. row and col must be integers."
-                    elif not (0 <= h <= 2 and 0 <= w <= 2):
-                        note = "Coordinates must be between 0 and 2."
-                    else:
-                        before = game.table_game[h][w]["text"]
-                        before_label = game.label["text"]
-                        game.next(h, w)
-                        if before != game.table_game[h][w]["text"] or before_label != game.label["text"]:
-                            print(f"[ws-online {game_id}] {game.label['text']}")
-                            game.print_board()
-                            note = "Move accepted."
-                            state = game.is_winning()
-                            if state["status"] == "win":
-                                note = f"Win details: type={state['line_type']}, cells={state['cells']}"
-                            if state["status"] == "tie":
-                                note = "Game over: tie."
-                        else:
-                            note = "Move ignored. Cell is occupied or game already finished."
-
-                game.sync_state(session["state"])
-                response = ws_state_message(note)
-                state = game.is_winning()
-                if state["status"] in {"win", "tie"}:
-                    session["finished"] = True
-                    should_end = True
-
-            await broadcast(session, response)
+            trace = tracing.begin("online.message", bucket, game_id=game_id, player_id=player_id)
+            # No suspension between playing the move and taking a delivery ticket (online has no
+            # after_move hook): the session's state is only ever touched by one handler at a time.
+            if isinstance(raw, dict):
+                note, _ = await MODE.play_move(session, raw, trace, player_id)
+            else:
+                note = MODE.invalid_payload_note
+
+            started = tracing.now()
+            response = core.state_message(state, note)
+            trace.record("render", started)
+            should_end = core.is_finished(state) and not session["finished"]
+            if should_end:
+                session["finished"] = True
+
+            started = tracing.now()
+            await deliver(session, response)
+            trace.record("send", started)
+            trace.finish()
             if should_end:
                 await close_all_connections(session, "Game finished.")
                 cleanup_session(game_id)
                 break
 
-    except WebSocketDisconnect:
-        current_session = active_online_games.get(game_id)
-        if current_session is not None and not current_session["finished"]:
-            if player_id is not None and current_session["connections"].get(player_id) is websocket:
-                del current_session["connections"][player_id]
-            if current_session["connections"]:
-                await close_all_connections(current_session, "A player disconnected. Game closed.")
-            cleanup_session(game_id)
+    except WebSocketDisconnect as exc:
+        await drop_player(game_id, player_id, websocket, exc.code)
     except Exception as exc:
-        print(f"[ws-online {game_id}] backend error: {exc}")
-
-        current_session = active_online_games.get(game_id)
-        if current_session is not None and not current_session["finished"]:
-            if player_id is not None and current_session["connections"].get(player_id) is websocket:
-                del current_session["connections"][player_id]
-            if current_session["connections"]:
-                await close_all_connections(current_session, "A player disconnected. Game closed.")
-            cleanup_session(game_id)
-        else:
-            if websocket_is_open(websocket):
-                await websocket.close()
+        logger.exception("backend error: %s", exc, extra=log.fields(game_id=game_id))
+        await drop_player(game_id, player_id, websocket)
+        if core.websocket_is_open(websocket):
+            await websocket.close()
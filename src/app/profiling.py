@@ -0,0 +1,122 @@
+import asyncio
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from . import log
+
+
+router = APIRouter()
+logger = log.get_logger("profiling")
+
+# Admin endpoints (this one and /debug/slow-moves) are disabled unless a token is configured.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+MAX_PROFILE_SECONDS = 60.0
+MIN_INTERVAL_MS = 1.0
+MAX_STACK_DEPTH = 128
+
+_running = threading.Lock()
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse(frame):
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(frame_label(frame))
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+
+class StackSampler:
+    # Samples other threads' stacks from a daemon thread: the sampled code runs unmodified,
+    # so the cost is one sys._current_frames() walk per interval.
+    def __init__(self, thread_ids, interval):
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (self.thread_ids is not None and ident not in self.thread_ids):
+                    continue
+                stack = collapse(frame)
+                if self.thread_ids is None:
+                    stack = f"{names.get(ident, ident)};{stack}"
+                self.stacks[stack] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def require_admin(token):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if token is None or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="admin token required")
+
+
+@router.get("/admin/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = 10.0,
+    interval_ms: float = 5.0,
+    all_threads: bool = False,
+    x_admin_token: str | None = Header(default=None),
+):
+    require_admin(x_admin_token)
+    if not (0 < seconds <= MAX_PROFILE_SECONDS) or interval_ms < MIN_INTERVAL_MS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"seconds must be in (0, {MAX_PROFILE_SECONDS:g}] and interval_ms >= {MIN_INTERVAL_MS:g}",
+        )
+    if not _running.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="a profile is already running")
+
+    try:
+        # By default only the event loop thread is sampled: that is where /ws/* handlers run.
+        sampler = StackSampler(None if all_threads else {threading.get_ident()}, interval_ms / 1000)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            sampler.stop()
+        elapsed = time.perf_counter() - started
+    finally:
+        _running.release()
+
+    logger.info(
+        "profile finished",
+        extra=log.fields(seconds=round(elapsed, 2), samples=sampler.samples, stacks=len(sampler.stacks)),
+    )
+    return PlainTextResponse(
+        sampler.collapsed(),
+        headers={
+            "Content-Disposition": 'attachment; filename="profile.collapsed"',
+            "X-Profile-Samples": str(sampler.samples),
+        },
+    )
@@ -0,0 +1,110 @@
+import json
+import os
+import time
+
+from fastapi import APIRouter, WebSocketDisconnect
+
+from . import log
+
+
+router = APIRouter()
+logger = log.get_logger("ratelimit")
+
+WS_RATE_LIMIT = float(os.environ.get("WS_RATE_LIMIT", "20"))
+WS_RATE_BURST = float(os.environ.get("WS_RATE_BURST", "40"))
+WS_MUX_RATE_LIMIT = float(os.environ.get("WS_MUX_RATE_LIMIT", "2000"))
+WS_MUX_RATE_BURST = float(os.environ.get("WS_MUX_RATE_BURST", "4000"))
+ABUSE_WINDOW = float(os.environ.get("WS_ABUSE_WINDOW", "10"))
+ABUSE_REJECTIONS = int(os.environ.get("WS_ABUSE_REJECTIONS", "200"))
+POLICY_VIOLATION = 1008
+# Pre-encoded so an over-limit frame costs no board rendering or serialization.
+RATE_LIMITED_NOTE = "Rate limit exceeded. Slow down."
+RATE_LIMITED_TEXT = json.dumps({"error": RATE_LIMITED_NOTE})
+
+stats = {"allowed": 0, "rejected": 0, "abuse_disconnects": 0}
+
+
+class TokenBucket:
+    def __init__(self, rate=WS_RATE_LIMIT, burst=WS_RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.window_start = self.updated
+        self.window_rejections = 0
+        # perf_counter_ns stamps around the last json.loads, picked up by tracing.begin.
+        self.parse_started = 0
+        self.parse_ended = 0
+
+    def allow(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        if now - self.window_start > ABUSE_WINDOW:
+            self.window_start = now
+            self.window_rejections = 0
+        self.window_rejections += 1
+        return False
+
+
+def bucket_for(websocket, rate=WS_RATE_LIMIT, burst=WS_RATE_BURST):
+    # Multiplexed channels carry their own per-game bucket, checked by the mux before a frame
+    # is queued to the channel.
+    if getattr(websocket, "rate_limited_upstream", False):
+        return None
+    return TokenBucket(rate, burst)
+
+
+def reject(bucket):
+    # Counts a dropped frame; returns "close" for an abusive client, "notify" for the first drop
+    # of a window (the client is told once) and None after that.
+    stats["rejected"] += 1
+    if bucket.window_rejections >= ABUSE_REJECTIONS:
+        stats["abuse_disconnects"] += 1
+        logger.warning("closing abusive connection", extra=log.fields(rejected=bucket.window_rejections))
+        return "close"
+    if bucket.window_rejections == 1:
+        return "notify"
+    return None
+
+
+async def receive_json(websocket, bucket):
+    if bucket is None:
+        return await websocket.receive_json()
+
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+
+        if bucket.allow():
+            stats["allowed"] += 1
+            text = message.get("text")
+            if text is None:
+                text = message["bytes"].decode("utf-8")
+            bucket.parse_started = time.perf_counter_ns()
+            data = json.loads(text)
+            bucket.parse_ended = time.perf_counter_ns()
+            return data
+
+        action = reject(bucket)
+        if action == "close":
+            await websocket.close(code=POLICY_VIOLATION)
+            raise WebSocketDisconnect(POLICY_VIOLATION)
+        if action == "notify":
+            # Tell the client once per window; after that over-limit frames are dropped silently.
+            await websocket.send_text(RATE_LIMITED_TEXT)
+
+
+@router.get("/ratelimit/stats")
+async def ratelimit_stats():
+    return {
+        "rate": WS_RATE_LIMIT,
+        "burst": WS_RATE_BURST,
+        "mux_rate": WS_MUX_RATE_LIMIT,
+        "mux_burst": WS_MUX_RATE_BURST,
+        **stats,
+    }
@@ -0,0 +1,373 @@
+import asyncio
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from fastapi import APIRouter, HTTPException
+
+from . import log
+
+
+router = APIRouter()
+logger = log.get_logger("ratings")
+
+# Ratings outlive restarts; RATINGS_DB_PATH=:memory: keeps a throwaway store per worker.
+RATINGS_DB_PATH = os.environ.get(
+    "RATINGS_DB_PATH", str(Path(__file__).resolve().parent.parent / "data" / "ratings.sqlite3")
+)
+FLUSH_EVERY = int(os.environ.get("RATINGS_FLUSH_EVERY", "256"))
+FLUSH_INTERVAL = float(os.environ.get("RATINGS_FLUSH_INTERVAL", "1.0"))
+DEFAULT_RATING = 1500.0
+K_FACTOR = 32.0
+AI_RATINGS = {"easy": 1000.0, "medium": 1400.0, "hard": 1900.0}
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS players (
+        player_id TEXT PRIMARY KEY,
+        rating REAL NOT NULL,
+        games INTEGER NOT NULL,
+        wins INTEGER NOT NULL,
+        losses INTEGER NOT NULL,
+        draws INTEGER NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS players_by_rating ON players (rating DESC, player_id)",
+    # Players per whole Elo point (the floor of the rating), kept by triggers in the transaction
+    # that writes the rows, so every worker sharing the file sees the same counts. A rank or an
+    # offset then sums a few thousand buckets and scans one bucket's slice of the index.
+    """
+    CREATE TABLE IF NOT EXISTS rating_buckets (
+        bucket INTEGER PRIMARY KEY,
+        players INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS rating_buckets_insert AFTER INSERT ON players BEGIN
+        INSERT INTO rating_buckets VALUES (CAST(new.rating AS INTEGER) - (new.rating < CAST(new.rating AS INTEGER)), 1)
+            ON CONFLICT (bucket) DO UPDATE SET players = players + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS rating_buckets_update AFTER UPDATE OF rating ON players BEGIN
+        UPDATE rating_buckets SET players = players - 1
+            WHERE bucket = CAST(old.rating AS INTEGER) - (old.rating < CAST(old.rating AS INTEGER));
+        INSERT INTO rating_buckets VALUES (CAST(new.rating AS INTEGER) - (new.rating < CAST(new.rating AS INTEGER)), 1)
+            ON CONFLICT (bucket) DO UPDATE SET players = players + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS rating_buckets_delete AFTER DELETE ON players BEGIN
+        UPDATE rating_buckets SET players = players - 1
+            WHERE bucket = CAST(old.rating AS INTEGER) - (old.rating < CAST(old.rating AS INTEGER));
+    END
+    """,
+)
+
+
+def expected_score(rating, opponent_rating):
+    return 1.0 / (1.0 + 10.0 ** ((opponent_rating - rating) / 400.0))
+
+
+class RatingStore:
+    def __init__(self, path, flush_every=FLUSH_EVERY, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.flush_every = max(1, flush_every)
+        self.flush_interval = flush_interval
+        self.updates = 0
+        self.flushes = 0
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+        self._fill_buckets()
+        # Rows with unsaved results: player_id -> [rating, games, wins, losses, draws] as this
+        # worker sees them, and the change since the last flush, which is all a flush writes.
+        # Other workers sharing the file add their own changes to the same rows.
+        self._cache = {}
+        self._changes = {}
+        # Results handed over by the event loop, applied on the flusher thread (or by the next read).
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop, name="rating-store", daemon=True)
+        self._flusher.start()
+
+    def _fill_buckets(self):
+        # A file written before rating_buckets existed; workers starting together fill it once.
+        self._conn.execute("BEGIN IMMEDIATE")
+        if self._conn.execute("SELECT 1 FROM rating_buckets LIMIT 1").fetchone() is None:
+            self._conn.execute(
+                """
+                INSERT INTO rating_buckets
+                SELECT CAST(rating AS INTEGER) - (rating < CAST(rating AS INTEGER)), COUNT(*) FROM players GROUP BY 1
+                """
+            )
+        self._conn.commit()
+
+    def _read(self, player_id):
+        found = self._conn.execute(
+            "SELECT rating, games, wins, losses, draws FROM players WHERE player_id = ?", (player_id,)
+        ).fetchone()
+        return [DEFAULT_RATING, 0, 0, 0, 0] if found is None else list(found)
+
+    def _row(self, player_id):
+        row = self._cache.get(player_id)
+        if row is None:
+            row = self._cache[player_id] = self._read(player_id)
+        return row
+
+    def _apply(self, player_id, row, score, delta):
+        change = self._changes.get(player_id)
+        if change is None:
+            change = self._changes[player_id] = [0.0, 0, 0, 0, 0]
+        column = 2 if score == 1.0 else 3 if score == 0.0 else 4
+        for target in (row, change):
+            target[0] += delta
+            target[1] += 1
+            target[column] += 1
+
+    def rating(self, player_id):
+        with self._lock:
+            self._drain_locked()
+            # Only rows with unsaved results are cached; a plain read must not pin a stale copy.
+            row = self._cache.get(player_id)
+            return (row or self._read(player_id))[0]
+
+    def record_game(self, player_a, player_b, score_a):
+        with self._lock:
+            self._drain_locked()
+            return self._record_game(player_a, player_b, score_a)
+
+    def record_vs_fixed(self, player_id, opponent_rating, score):
+        with self._lock:
+            self._drain_locked()
+            return self._record_vs_fixed(player_id, opponent_rating, score)
+
+    def queue_game(self, player_a, player_b, score_a):
+        # For the event loop: reading the players' rows may hit SQLite, so the update is applied
+        # on the flusher thread. Reads apply anything still queued first.
+        self._queue(self._record_game, player_a, player_b, score_a)
+
+    def queue_vs_fixed(self, player_id, opponent_rating, score):
+        self._queue(self._record_vs_fixed, player_id, opponent_rating, score)
+
+    def _queue(self, method, *args):
+        self._pending.append((method, args))
+        if len(self._pending) >= self.flush_every:
+            self._wakeup.set()
+
+    def _drain_locked(self):
+        while self._pending:
+            method, args = self._pending.popleft()
+            method(*args)
+
+    def _record_game(self, player_a, player_b, score_a):
+        row_a = self._row(player_a)
+        row_b = self._row(player_b)
+        delta = K_FACTOR * (score_a - expected_score(row_a[0], row_b[0]))
+        self._apply(player_a, row_a, score_a, delta)
+        self._apply(player_b, row_b, 1.0 - score_a, -delta)
+        self._mark_updated()
+        return row_a[0], row_b[0]
+
+    def _record_vs_fixed(self, player_id, opponent_rating, score):
+        row = self._row(player_id)
+        self._apply(player_id, row, score, K_FACTOR * (score - expected_score(row[0], opponent_rating)))
+        self._mark_updated()
+        return row[0]
+
+    def _mark_updated(self):
+        self.updates += 1
+        if len(self._changes) >= self.flush_every:
+            self._wakeup.set()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._drain_locked()
+        if not self._changes:
+            return
+        now = time.time()
+        # Changes are added to whatever the row holds now, so a result another worker flushed
+        # since this one read the row is kept rather than overwritten.
+        self._conn.executemany(
+            """
+            INSERT INTO players (player_id, rating, games, wins, losses, draws, updated_at)
+            VALUES (?1, ?7 + ?2, ?3, ?4, ?5, ?6, ?8)
+            ON CONFLICT (player_id) DO UPDATE SET
+                rating = rating + ?2,
+                games = games + ?3,
+                wins = wins + ?4,
+                losses = losses + ?5,
+                draws = draws + ?6,
+                updated_at = ?8
+            """,
+            [(player_id, *change, DEFAULT_RATING, now) for player_id, change in self._changes.items()],
+        )
+        self._conn.commit()
+        self._changes.clear()
+        # Flushed rows live in SQLite; the cache only has to hold unsaved updates.
+        self._cache.clear()
+        self.flushes += 1
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as exc:
+                logger.error("flush failed: %s", exc)
+
+    def _count_players(self):
+        return self._conn.execute("SELECT COALESCE(SUM(players), 0) FROM rating_buckets").fetchone()[0]
+
+    def leaderboard(self, limit=10, offset=0):
+        with self._lock:
+            self._flush_locked()
+            # The bucket holding the offset-th player and the number of players above it; the
+            # index scan then starts at that bucket instead of stepping over every row before it.
+            found = self._conn.execute(
+                """
+                SELECT bucket, through - players FROM (
+                    SELECT bucket, players, SUM(players) OVER (ORDER BY bucket DESC) AS through FROM rating_buckets
+                ) WHERE through > ? ORDER BY bucket DESC LIMIT 1
+                """,
+                (offset,),
+            ).fetchone()
+            if found is None:
+                return []
+            bucket, above = found
+            rows = self._conn.execute(
+                """
+                SELECT player_id, rating, games, wins, losses, draws FROM players
+                WHERE rating < ? ORDER BY rating DESC, player_id LIMIT ? OFFSET ?
+                """,
+                (bucket + 1, limit, offset - above),
+            ).fetchall()
+        return [
+            {
+                "rank": offset + i + 1,
+                "player_id": player_id,
+                "rating": round(rating, 1),
+                "games": games,
+                "wins": wins,
+                "losses": losses,
+                "draws": draws,
+            }
+            for i, (player_id, rating, games, wins, losses, draws) in enumerate(rows)
+        ]
+
+    def player(self, player_id):
+        with self._lock:
+            self._flush_locked()
+            found = self._conn.execute(
+                "SELECT rating, games, wins, losses, draws FROM players WHERE player_id = ?", (player_id,)
+            ).fetchone()
+            if found is None:
+                return None
+            rating = found[0]
+            bucket = math.floor(rating)
+            above = self._conn.execute(
+                "SELECT COALESCE(SUM(players), 0) FROM rating_buckets WHERE bucket > ?", (bucket,)
+            ).fetchone()[0]
+            # The rest of the player's own bucket: two bounded index ranges, so only the slice of
+            # the bucket above the player and the exact ties before them are stepped over.
+            within = self._conn.execute(
+                """
+                SELECT (SELECT COUNT(*) FROM players WHERE rating > ? AND rating < ?)
+                     + (SELECT COUNT(*) FROM players WHERE rating = ? AND player_id < ?)
+                """,
+                (rating, bucket + 1, rating, player_id),
+            ).fetchone()[0]
+            total = self._count_players()
+        return {
+            "player_id": player_id,
+            "rating": round(rating, 1),
+            "rank": 1 + above + within,
+            "players": total,
+            "games": found[1],
+            "wins": found[2],
+            "losses": found[3],
+            "draws": found[4],
+        }
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self._flusher.join()
+        with self._lock:
+            self._flush_locked()
+            self._conn.close()
+
+
+store = None
+
+
+def open_store(path=RATINGS_DB_PATH):
+    global store
+    if store is None:
+        store = RatingStore(path)
+    return store
+
+
+def close_store():
+    global store
+    if store is not None:
+        store.close()
+        store = None
+
+
+def rating_of(player_id):
+    # May read SQLite; async callers run it with asyncio.to_thread.
+    return open_store().rating(player_id)
+
+
+def record_online_result(player_x, player_o, state):
+    if state["status"] == "win":
+        score_x = 1.0 if state["winner"] == "X" else 0.0
+    elif state["status"] == "tie":
+        score_x = 0.5
+    else:
+        return
+    open_store().queue_game(player_x, player_o, score_x)
+
+
+def record_ai_result(player_id, player_choice, difficulty, state):
+    if state["status"] == "win":
+        score = 1.0 if state["winner"] == player_choice else 0.0
+    elif state["status"] == "tie":
+        score = 0.5
+    else:
+        return
+    open_store().queue_vs_fixed(player_id, AI_RATINGS[difficulty], score)
+
+
+@router.get("/ratings/leaderboard")
+async def leaderboard(limit: int = 10, offset: int = 0):
+    if not (1 <= limit <= 100) or offset < 0:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100 and offset >= 0")
+    # SQLite work stays off the event loop; the store's own lock serializes it with the flusher.
+    return {"players": await asyncio.to_thread(open_store().leaderboard, limit, offset)}
+
+
+@router.get("/ratings/{player_id}")
+async def player_rating(player_id: str):
+    found = await asyncio.to_thread(open_store().player, player_id.strip())
+    if found is None:
+        raise HTTPException(status_code=404, detail="player has no rated games")
+    return found
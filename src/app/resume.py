@@ -0,0 +1,111 @@
+import asyncio
+import hmac
+import os
+import secrets
+import sys
+import time
+
+from fastapi import APIRouter
+
+from . import journal, log, ratelimit
+
+
+router = APIRouter()
+logger = log.get_logger("resume")
+
+# How long a dropped client has to come back with its resume token; 0 ends games on any drop.
+RESUME_GRACE_SECONDS = float(os.environ.get("RESUME_GRACE_SECONDS", "60"))
+SWEEP_INTERVAL = 1.0
+# A clean close or a rate-limit kick ends the game; any other drop is held for the grace period.
+# 1001 (going away) stays resumable: browsers send it on a page reload as well as on a closed
+# tab, and a reload is the drop resume tokens exist for. A tab that never comes back costs the
+# opponent one grace period.
+FINAL_CLOSE_CODES = {1000, ratelimit.POLICY_VIOLATION}
+
+# Counted per player: a held drop ends up either resumed or expired.
+stats = {"held": 0, "resumed": 0, "expired": 0, "rejected_tokens": 0}
+modes = []
+_sweeper = None
+
+
+class Suspended:
+    # An ongoing game with nobody connected: register_session's arguments, the cells and whose
+    # turn it is. Search trees, locks and label dicts are rebuilt on resume.
+    __slots__ = ("fields", "cells", "player", "tokens", "expires", "size")
+
+    def __init__(self, fields, cells, player, tokens, expires):
+        self.fields = fields
+        self.cells = cells
+        self.player = player
+        self.tokens = tokens
+        self.expires = expires
+        self.size = (
+            sys.getsizeof(self)
+            + sys.getsizeof(fields)
+            + sum(sys.getsizeof(value) for value in fields)
+            + sys.getsizeof(cells)
+            + sys.getsizeof(tokens)
+            + sum(sys.getsizeof(pair) + sys.getsizeof(pair[1]) for pair in tokens)
+        )
+
+    def player_for(self, token):
+        for player_id, expected in self.tokens:
+            if token_matches(expected, token):
+                return player_id
+        return None
+
+
+def new_token():
+    return secrets.token_urlsafe(16)
+
+
+def token_matches(expected, token):
+    return isinstance(token, str) and expected is not None and hmac.compare_digest(expected, token)
+
+
+def requested_token(websocket):
+    return getattr(websocket, "query_params", {}).get("resume_token")
+
+
+def should_hold(code):
+    # Journal-resumable closes (worker restart) are restored from the journal instead.
+    return RESUME_GRACE_SECONDS > 0 and code not in FINAL_CLOSE_CODES and not journal.is_resumable_close(code)
+
+
+def deadline():
+    return time.monotonic() + RESUME_GRACE_SECONDS
+
+
+async def sweep_once(now=None):
+    now = time.monotonic() if now is None else now
+    for mode in modes:
+        await mode.sweep(now)
+
+
+async def sweep_forever():
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        try:
+            await sweep_once()
+        except Exception as exc:
+            logger.exception("sweep failed: %s", exc)
+
+
+def ensure_sweeper():
+    global _sweeper
+    if _sweeper is None or _sweeper.done():
+        _sweeper = asyncio.get_running_loop().create_task(sweep_forever())
+
+
+@router.get("/resume/stats")
+async def resume_stats():
+    suspended = [entry for mode in modes for entry in mode.suspended.values()]
+    settled = stats["resumed"] + stats["expired"]
+    return {
+        "grace_seconds": RESUME_GRACE_SECONDS,
+        **stats,
+        "resume_rate": round(stats["resumed"] / settled, 3) if settled else None,
+        "suspended": {mode.name: len(mode.suspended) for mode in modes},
+        "suspended_bytes": sum(entry.size for entry in suspended),
+        "suspended_bytes_per_game": round(sum(entry.size for entry in suspended) / len(suspended)) if suspended else 0,
+    }
@@ -1,92 +1,315 @@
-from tkinter import *
+import argparse
+import asyncio
+import json
 import random
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
 
-def next(h, w):
-    global player
-    # خاصنا نتحققو من text ديال الزر
-    if table_game[h][w]["text"] == "" and is_winning() == False:
-
-        table_game[h][w].config(text=player)
-
-        if is_winning() == False:
-            # تبديل اللاعب (خاص = ماشي ==)
-            if player == players[0]:
-                player = players[1]
-            else:
-                player = players[0]
-            label.config(text=(player + " turn"))
-
-        elif is_winning() == True:
-            label.config(text=(player + " wins"))
-
-        elif is_winning() == 'tie':
-            label.config(text="the players tied")
-
-def is_winning():
-    # فحص السطور
-    for h in range(3):
-        if table_game[h][0]["text"] == table_game[h][1]["text"] == table_game[h][2]["text"] and table_game[h][0]["text"] != "":
-            return True
-
-    # فحص الأعمدة
-    for w in range(3):
-        if table_game[0][w]["text"] == table_game[1][w]["text"] == table_game[2][w]["text"] and table_game[0][w]["text"] != "":
-            return True
-
-    # فحص الأقطار
-    if table_game[0][0]["text"] == table_game[1][1]["text"] == table_game[2][2]["text"] and table_game[0][0]["text"] != "":
-        return True
-
-    if table_game[0][2]["text"] == table_game[1][1]["text"] == table_game[2][0]["text"] and table_game[0][2]["text"] != "":
-        return True
-
-    # فحص التعادل
-    i = 0
-    for h in range(3):
-        for w in range(3):
-            if table_game[h][w]["text"] != "":
-                i += 1
-
-    if i == 9:
-        return "tie"
-
-    return False
-
-def start_new_game():
-    global player
-    player = random.choice(players)
-    label.config(text=player + " turn")
-    for h in range(3):
-        for w in range(3):
-            table_game[h][w].config(text="")
-
-window = Tk()
-window.title("Tic_Tac_Toe_game")
-
-players = ["X", "O"]
-player = random.choice(players)
-
-label = Label(window, text=(player + " turn"), font=('consolas', 40), fg="black")
-label.pack(side="top")
-
-restart_button = Button(window, text="restart", font=('consolas', 20), fg="green", command=start_new_game)
-restart_button.pack(side="top")
-
-buttons_game = Frame(window)
-buttons_game.pack()
-
-table_game = [[None]*3 for _ in range(3)]
-
-for h in range(3):
-    for w in range(3):
-        table_game[h][w] = Button(
-            buttons_game,
-            text="",
-            font=('consolas', 60),
-            width=4,
-            height=1,
-            command=lambda h=h, w=w: next(h, w)
-        )
-        table_game[h][w].grid(row=h, column=w)
-
-window.mainloop()
+import websockets
+
+from . import tic_tac_toe_cli as game
+
+
+# Plays against a running server over the same HTTP + websocket protocol as the web client:
+#   python -m app.tic_tac_toe ai --difficulty medium
+#   python -m app.tic_tac_toe online --player-id alice --opponent bob
+#   python -m app.tic_tac_toe online --join --game-id <id> --player-id bob
+#   python -m app.tic_tac_toe ai --bench --games 500 --concurrency 100
+DEFAULT_URL = "http://127.0.0.1:8000"
+MODES = ("offline", "online", "ai")
+INPUT_HELP = "Invalid input. Use '<row> <col>' or 'quit'."
+
+
+class ClientError(Exception):
+    pass
+
+
+def post(url, path, body):
+    request = urllib.request.Request(
+        url + path, data=json.dumps(body).encode(), headers={"Content-Type": "application/json"}
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as exc:
+        try:
+            detail = json.loads(exc.read()).get("detail", exc.reason)
+        except ValueError:
+            detail = exc.reason
+        raise ClientError(f"POST {path} failed ({exc.code}): {detail}") from None
+    except urllib.error.URLError as exc:
+        raise ClientError(f"cannot reach {url}: {exc.reason}") from None
+
+
+def websocket_url(url, ws_path, resume_token=None):
+    if resume_token:
+        ws_path += "?" + urllib.parse.urlencode({"resume_token": resume_token})
+    return "ws" + url[len("http"):] + ws_path
+
+
+def create_body(args, game_id, player_id, opponent, seed):
+    body = {"game_id": game_id, "board_size": args.board_size, "win_length": args.win_length}
+    if seed is not None:
+        body["seed"] = seed
+    if args.mode == "offline":
+        body.update(player_id=player_id, player_choice=args.player_choice, starting_player=args.starting_player)
+    elif args.mode == "ai":
+        body.update(player_id=player_id, difficulty=args.difficulty, engine=args.engine)
+    else:
+        body.update(player_x=player_id, player_o=opponent, starting_player=args.starting_player)
+    return body
+
+
+def empty_cells(rows):
+    return [(h, w) for h, row in enumerate(rows) for w, value in enumerate(row) if value == ""]
+
+
+async def play_seat(url, ws_path, choose, player_id=None, resume_token=None, show=None, latencies=None):
+    # Plays one socket until the game ends; returns the final state message, or None if the
+    # game ended any other way. choose(data) returns the next (row, col), or None to quit.
+    role = None
+    last = None
+    sent_at = None
+    async with websockets.connect(websocket_url(url, ws_path, resume_token), max_queue=None) as ws:
+        if player_id is not None:
+            try:
+                await ws.send(json.dumps({"player_id": player_id}))
+            except websockets.ConnectionClosed:
+                # The server refused the game before the join; its error is still queued below.
+                pass
+        async for frame in ws:
+            data = json.loads(frame)
+            if sent_at is not None and latencies is not None:
+                latencies.append(time.perf_counter() - sent_at)
+            sent_at = None
+            role = data.get("role", role)
+            if "error" in data and last is None:
+                # Nothing was played yet: the game is missing, taken or the token was refused.
+                raise ClientError(data["error"])
+            if show is not None:
+                show(data)
+            if "error" in data:
+                # The move was dropped (rate limit); choose again from the last board.
+                data = last
+            elif "board" not in data:
+                continue
+            last = data
+            if data["game_status"] != "ongoing":
+                return data
+            # Offline games take both sides' moves and AI games answer with the AI's move already
+            # played, so only online seats wait for their turn.
+            if role is not None and data["status"] != f"{role} turn":
+                continue
+            move = await choose(data)
+            if move is None:
+                return None
+            payload = {"row": move[0], "col": move[1]}
+            if player_id is not None:
+                payload["player_id"] = player_id
+            await ws.send(json.dumps(payload))
+            sent_at = time.perf_counter()
+    return None
+
+
+def show_message(data):
+    if "error" in data:
+        print(f"error: {data['error']}")
+        return
+    if "board" in data:
+        print(game.rows_text(data["board"]))
+        print()
+    if "message" in data:
+        print(data["message"])
+    if "role" in data:
+        print(f"You play {data['role']}.")
+    if "status" in data:
+        print(data["status"])
+    if "resume_token" in data:
+        print(f"(reconnect with --resume-token {data['resume_token']})")
+
+
+async def prompt_move(data):
+    size = len(data["board"])
+    while True:
+        try:
+            user_input = (await asyncio.to_thread(input, "> ")).strip().lower()
+        except EOFError:
+            return None
+        if user_input == "quit":
+            print("Bye.")
+            return None
+        parts = user_input.split()
+        if len(parts) != 2 or not all(p.isdigit() for p in parts):
+            print(INPUT_HELP)
+            continue
+        h, w = int(parts[0]), int(parts[1])
+        if not (0 <= h < size and 0 <= w < size):
+            print(f"Coordinates must be between 0 and {size - 1}.")
+            continue
+        return h, w
+
+
+async def play_interactive(args):
+    game_id = args.game_id or f"cli-{uuid.uuid4().hex[:12]}"
+    player_id = args.player_id or f"cli-{uuid.uuid4().hex[:12]}"
+    if args.join:
+        if args.game_id is None:
+            raise ClientError("--join needs --game-id")
+        ws_path = {"offline": "/ws/", "online": "/ws/online/", "ai": "/ws/ai/"}[args.mode] + game_id
+    else:
+        if args.mode == "online" and args.opponent is None:
+            raise ClientError("online games need --opponent (the other player's id)")
+        body = create_body(args, game_id, player_id, args.opponent, args.seed)
+        created = await asyncio.to_thread(post, args.url, f"/{args.mode}", body)
+        ws_path = created["ws_path"]
+        seed = created.get("seed")
+        print(f"Created {args.mode} game {game_id}" + (f" (seed {seed})." if seed is not None else "."))
+        if args.mode == "online":
+            print(
+                f"{args.opponent} joins with: python -m app.tic_tac_toe online --join "
+                f"--game-id {game_id} --player-id {args.opponent}"
+            )
+    print(f"Commands: '<row> <col>' (0-{args.board_size - 1}), 'quit'")
+    final = await play_seat(
+        args.url,
+        ws_path,
+        prompt_move,
+        player_id if args.mode == "online" else None,
+        args.resume_token,
+        show_message,
+    )
+    if final is not None:
+        print("Game over.")
+
+
+def timed_post(url, path, body):
+    # Timed on the worker thread, so waiting for a free thread is not counted.
+    began = time.perf_counter()
+    created = post(url, path, body)
+    return time.perf_counter() - began, created
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {"samples": 0}
+    result = {"samples": len(samples)}
+    for name, fraction in (("p50", 0.50), ("p90", 0.90), ("p99", 0.99), ("max", 1.0)):
+        result[name] = round(samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000, 2)
+    return result
+
+
+async def bench(args):
+    # Every game runs start to finish with bots on every seat picking random empty cells;
+    # --concurrency games are in flight at once.
+    run_id = uuid.uuid4().hex[:8]
+    limit = asyncio.Semaphore(args.concurrency)
+    timings = {"create": [], "start": [], "move": []}
+    results = {}
+    failures = []
+
+    async def one(index):
+        game_id = f"bench-{run_id}-{index}"
+        rng = random.Random(f"{args.seed or 0}:{index}")
+        # Per game, so a bench run against a server in test mode (GAME_SEED) replays exactly.
+        seed = None if args.seed is None else random.Random(f"{args.seed}:{index}:server").getrandbits(63)
+        started = None
+
+        async def choose(data):
+            nonlocal started
+            if started is not None:
+                timings["start"].append(time.perf_counter() - started)
+                started = None
+            return rng.choice(empty_cells(data["board"]))
+
+        async with limit:
+            try:
+                players = [f"{game_id}-x", f"{game_id}-o"] if args.mode == "online" else [None]
+                body = create_body(args, game_id, f"{game_id}-x", f"{game_id}-o", seed)
+                elapsed, created = await asyncio.to_thread(timed_post, args.url, f"/{args.mode}", body)
+                timings["create"].append(elapsed)
+                started = time.perf_counter()
+                finals = await asyncio.wait_for(
+                    asyncio.gather(
+                        *(play_seat(args.url, created["ws_path"], choose, player, latencies=timings["move"]) for player in players)
+                    ),
+                    args.timeout,
+                )
+                final = finals[0]
+                if final is None:
+                    raise ClientError("connection closed before the game finished")
+                outcome = final.get("winner") or final["game_status"]
+                results[outcome] = results.get(outcome, 0) + 1
+            except Exception as exc:
+                failures.append(f"{game_id}: {exc!r}")
+
+    began = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(args.games)))
+    elapsed = time.perf_counter() - began
+
+    finished = sum(results.values())
+    moves = len(timings["move"])
+    print(
+        f"mode={args.mode} games={args.games} concurrency={args.concurrency} "
+        f"board={args.board_size}x{args.board_size} win_length={args.win_length} url={args.url}"
+    )
+    print(
+        f"finished={finished} failed={len(failures)} in {elapsed:.1f}s "
+        f"({finished / elapsed:.0f} games/s, {moves / elapsed:.0f} moves/s)"
+    )
+    print("results: " + ", ".join(f"{outcome}={count}" for outcome, count in sorted(results.items())))
+    print(f"{'ms':8} {'samples':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+    for name, samples in timings.items():
+        stats = percentiles(samples)
+        print(f"{name:8} {stats['samples']:>8} " + " ".join(f"{stats.get(key, '-'):>8}" for key in ("p50", "p90", "p99", "max")))
+    for failure in failures[:10]:
+        print(failure)
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Headless tic-tac-toe client for a running server: play offline, online or AI games "
+        "from the terminal, or load-test the server with --bench."
+    )
+    parser.add_argument("mode", choices=MODES)
+    parser.add_argument("--url", default=DEFAULT_URL, help="http:// base URL of the server")
+    parser.add_argument("--game-id")
+    parser.add_argument("--player-id")
+    parser.add_argument("--opponent", help="online: the other player's id")
+    parser.add_argument("--join", action="store_true", help="connect to an existing game instead of creating one")
+    parser.add_argument("--resume-token", help="reconnect to a dropped game")
+    parser.add_argument("--player-choice", choices=("X", "O"), default="X", help="offline: your mark")
+    parser.add_argument("--starting-player", help="offline: X or O; online: a player id")
+    parser.add_argument("--difficulty", choices=("easy", "medium", "hard"), default="hard")
+    parser.add_argument("--engine", choices=("auto", "search", "mcts"), default="auto")
+    parser.add_argument("--board-size", type=int, default=game.DEFAULT_SIZE)
+    parser.add_argument("--win-length", type=int)
+    parser.add_argument("--seed", type=int, help="the game's seed; with --bench, each game's seed is derived from it")
+    parser.add_argument("--bench", action="store_true", help="play --games bot games and report latencies")
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=60.0, help="bench: seconds one game may take")
+    args = parser.parse_args()
+    args.url = args.url.rstrip("/")
+    if args.win_length is None:
+        args.win_length = game.default_win_length(args.board_size)
+
+    try:
+        if args.bench:
+            sys.exit(asyncio.run(bench(args)))
+        asyncio.run(play_interactive(args))
+    except ClientError as exc:
+        sys.exit(str(exc))
+    except OSError as exc:
+        sys.exit(f"cannot reach {args.url}: {exc}")
+    except KeyboardInterrupt:
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,15 @@
 import random
 
 
-def make_cell():
-    return {"text": ""}
+DEFAULT_SIZE = 3
+DEFAULT_WIN_LENGTH = 3
+MAX_BOARD_SIZE = 19
 
-
-def set_cell(cell, text):
-    cell["text"] = text
+EMPTY = 0
+MARKS = ("", "X", "O")
+MARK_CODES = {"X": 1, "O": 2}
+# Checked in this order so a move completing several lines reports the same one as a full scan would.
+DIRECTIONS = (("row", 0, 1), ("col", 1, 0), ("diag", 1, 1), ("diag", 1, -1))
 
 
 def make_label(text=""):
@@ -17,150 +20,206 @@ def set_label(current_label, text):
     current_label["text"] = text
 
 
-def create_game_state(player_choice=None):
+def ongoing_status():
+    return {
+        "status": "ongoing",
+        "winner": None,
+        "line_type": None,
+        "cells": [],
+    }
+
+
+def default_win_length(size):
+    return min(size, 5)
+
+
+def validate_dimensions(size, win_length):
+    if not (DEFAULT_SIZE <= size <= MAX_BOARD_SIZE):
+        raise ValueError(f"board_size must be between {DEFAULT_SIZE} and {MAX_BOARD_SIZE}")
+    if not (DEFAULT_WIN_LENGTH <= win_length <= size):
+        raise ValueError(f"win_length must be between {DEFAULT_WIN_LENGTH} and board_size")
+
+
+def create_board(size=DEFAULT_SIZE, win_length=DEFAULT_WIN_LENGTH):
+    validate_dimensions(size, win_length)
+    return {
+        "size": size,
+        "win_length": win_length,
+        "cells": bytearray(size * size),
+        "filled": 0,
+        "status": ongoing_status(),
+    }
+
+
+def reset_board(current_board):
+    cells = current_board["cells"]
+    cells[:] = bytes(len(cells))
+    current_board["filled"] = 0
+    current_board["status"] = ongoing_status()
+
+
+def place(current_board, h, w, text):
+    if current_board["status"]["status"] != "ongoing":
+        return False
+    size = current_board["size"]
+    cells = current_board["cells"]
+    index = h * size + w
+    if cells[index] != EMPTY:
+        return False
+
+    code = MARK_CODES[text]
+    cells[index] = code
+    current_board["filled"] += 1
+    current_board["status"] = status_after_move(current_board, h, w, code)
+    return True
+
+
+def status_after_move(current_board, h, w, code):
+    size = current_board["size"]
+    cells = current_board["cells"]
+    win_length = current_board["win_length"]
+
+    # Only the four lines through the last move can have changed.
+    for line_type, dh, dw in DIRECTIONS:
+        start_h, start_w = h, w
+        while 0 <= start_h - dh < size and 0 <= start_w - dw < size and cells[(start_h - dh) * size + start_w - dw] == code:
+            start_h -= dh
+            start_w -= dw
+
+        run = []
+        ch, cw = start_h, start_w
+        while 0 <= ch < size and 0 <= cw < size and cells[ch * size + cw] == code:
+            run.append((ch, cw))
+            ch += dh
+            cw += dw
+
+        if len(run) >= win_length:
+            return {
+                "status": "win",
+                "winner": MARKS[code],
+                "line_type": line_type,
+                "cells": run,
+            }
+
+    if current_board["filled"] == size * size:
+        return {
+            "status": "tie",
+            "winner": None,
+            "line_type": None,
+            "cells": [],
+        }
+
+    return current_board["status"]
+
+
+def create_game_state(player_choice=None, size=DEFAULT_SIZE, win_length=DEFAULT_WIN_LENGTH, rng=None):
+    # rng is the session's random.Random; the module's shared generator is only for the CLI.
     local_players = ["X", "O"]
-    local_player = player_choice if player_choice in local_players else random.choice(local_players)
+    local_player = player_choice if player_choice in local_players else (rng or random).choice(local_players)
     return {
         "players": local_players,
         "player": local_player,
         "label": make_label(local_player + " turn"),
-        "table_game": [[make_cell() for _ in range(3)] for _ in range(3)],
+        "board": create_board(size, win_length),
     }
 
 
-def bind_state(state):
-    global players, player, label, table_game
-    players = state["players"]
-    player = state["player"]
-    label = state["label"]
-    table_game = state["table_game"]
+def replay_moves(state, moves):
+    for h, w in moves:
+        next(state, h, w)
 
 
-def sync_state(state):
-    state["players"] = players
+def load_position(state, cells, player):
+    # Restores a suspended game. Only ongoing games are suspended, so there is no status to recompute.
+    current_board = state["board"]
+    current_board["cells"][:] = cells
+    current_board["filled"] = sum(1 for value in cells if value != EMPTY)
     state["player"] = player
-    state["label"] = label
-    state["table_game"] = table_game
-
-
-def print_board():
-    for h in range(3):
-        row = []
-        for w in range(3):
-            value = table_game[h][w]["text"] if table_game[h][w]["text"] != "" else " "
-            row.append(value)
-        print(" " + " | ".join(row))
-        if h < 2:
-            print("---+---+---")
-    print()
+    set_label(state["label"], player + " turn")
 
 
-def board_state_text():
-    rows = []
-    for h in range(3):
-        row = []
-        for w in range(3):
-            value = table_game[h][w]["text"] if table_game[h][w]["text"] != "" else " "
-            row.append(value)
-        rows.append(" " + " | ".join(row))
-        if h < 2:
-            rows.append("---+---+---")
-    return "\n".join(rows)
+# Every function below takes the game state it acts on: sessions each own their state,
+# so games running side by side in one process never share anything mutable.
+def board_size(state):
+    return state["board"]["size"]
 
 
-def next(h, w):
-    global player
-    game_status = is_winning()
-    if table_game[h][w]["text"] == "" and game_status["status"] == "ongoing":
-        set_cell(table_game[h][w], player)
-        game_status = is_winning()
+def in_bounds(state, h, w):
+    size = state["board"]["size"]
+    return 0 <= h < size and 0 <= w < size
 
-        if game_status["status"] == "ongoing":
-            if player == players[0]:
-                player = players[1]
-            else:
-                player = players[0]
-            set_label(label, player + " turn")
 
-        elif game_status["status"] == "win":
-            set_label(label, game_status["winner"] + " wins")
+def cell_text(state, h, w):
+    current_board = state["board"]
+    return MARKS[current_board["cells"][h * current_board["size"] + w]]
 
-        elif game_status["status"] == "tie":
-            set_label(label, "the players tied")
 
+def board_rows(state):
+    size = state["board"]["size"]
+    cells = state["board"]["cells"]
+    return [[MARKS[cells[h * size + w]] for w in range(size)] for h in range(size)]
 
-def is_winning():
-    for h in range(3):
-        if table_game[h][0]["text"] == table_game[h][1]["text"] == table_game[h][2]["text"] and table_game[h][0]["text"] != "":
-            return {
-                "status": "win",
-                "winner": table_game[h][0]["text"],
-                "line_type": "row",
-                "cells": [(h, 0), (h, 1), (h, 2)],
-            }
 
-    for w in range(3):
-        if table_game[0][w]["text"] == table_game[1][w]["text"] == table_game[2][w]["text"] and table_game[0][w]["text"] != "":
-            return {
-                "status": "win",
-                "winner": table_game[0][w]["text"],
-                "line_type": "col",
-                "cells": [(0, w), (1, w), (2, w)],
-            }
+def print_board(state):
+    print(board_state_text(state))
+    print()
 
-    if table_game[0][0]["text"] == table_game[1][1]["text"] == table_game[2][2]["text"] and table_game[0][0]["text"] != "":
-        return {
-            "status": "win",
-            "winner": table_game[0][0]["text"],
-            "line_type": "diag",
-            "cells": [(0, 0), (1, 1), (2, 2)],
-        }
 
-    if table_game[0][2]["text"] == table_game[1][1]["text"] == table_game[2][0]["text"] and table_game[0][2]["text"] != "":
-        return {
-            "status": "win",
-            "winner": table_game[0][2]["text"],
-            "line_type": "diag",
-            "cells": [(0, 2), (1, 1), (2, 0)],
-        }
+def board_state_text(state):
+    return rows_text(board_rows(state))
 
-    i = 0
-    for h in range(3):
-        for w in range(3):
-            if table_game[h][w]["text"] != "":
-                i += 1
 
-    if i == 9:
-        return {
-            "status": "tie",
-            "winner": None,
-            "line_type": None,
-            "cells": [],
-        }
+def rows_text(rows):
+    # Also renders the boards the server sends to app.tic_tac_toe.
+    separator = "+".join(["---"] * len(rows))
+    lines = []
+    for h, row in enumerate(rows):
+        lines.append(" " + " | ".join(value if value != "" else " " for value in row))
+        if h < len(rows) - 1:
+            lines.append(separator)
+    return "\n".join(lines)
 
-    return {
-        "status": "ongoing",
-        "winner": None,
-        "line_type": None,
-        "cells": [],
-    }
 
+def next(state, h, w):
+    # Returns False when the move is ignored: the cell is taken or the game is over.
+    if not place(state["board"], h, w, state["player"]):
+        return False
+
+    game_status = is_winning(state)
+    if game_status["status"] == "ongoing":
+        players = state["players"]
+        if state["player"] == players[0]:
+            state["player"] = players[1]
+        else:
+            state["player"] = players[0]
+        set_label(state["label"], state["player"] + " turn")
 
-def start_new_game():
-    global player
-    player = random.choice(players)
-    set_label(label, player + " turn")
-    for h in range(3):
-        for w in range(3):
-            set_cell(table_game[h][w], "")
+    elif game_status["status"] == "win":
+        set_label(state["label"], game_status["winner"] + " wins")
+
+    elif game_status["status"] == "tie":
+        set_label(state["label"], "the players tied")
+    return True
+
+
+def is_winning(state):
+    return state["board"]["status"]
+
+
+def start_new_game(state, rng=None):
+    state["player"] = (rng or random).choice(state["players"])
+    set_label(state["label"], state["player"] + " turn")
+    reset_board(state["board"])
 
 
 def main():
+    state = create_game_state()
+    size = board_size(state)
     print("Tic_Tac_Toe_game (CLI)")
-    print("Commands: '<row> <col>' (0-2), 'quit'")
+    print(f"Commands: '<row> <col>' (0-{size - 1}), 'quit'")
     print()
-    print(label["text"])
-    print_board()
+    print(state["label"]["text"])
+    print_board(state)
 
     while True:
         user_input = input("> ").strip().lower()
@@ -175,34 +234,24 @@ def main():
             continue
 
         h, w = int(parts[0]), int(parts[1])
-        if not (0 <= h <= 2 and 0 <= w <= 2):
-            print("Coordinates must be between 0 and 2.")
+        if not in_bounds(state, h, w):
+            print(f"Coordinates must be between 0 and {size - 1}.")
             continue
 
-        before = table_game[h][w]["text"]
-        before_label = label["text"]
-        next(h, w)
-        if before != table_game[h][w]["text"] or before_label != label["text"]:
-            print(label["text"])
-            print_board()
-            state = is_winning()
-            if state["status"] == "win":
-                print(f"Win details: type={state['line_type']}, cells={state['cells']}")
+        if next(state, h, w):
+            print(state["label"]["text"])
+            print_board(state)
+            game_status = is_winning(state)
+            if game_status["status"] == "win":
+                print(f"Win details: type={game_status['line_type']}, cells={game_status['cells']}")
                 print("Game over.")
                 break
-            if state["status"] == "tie":
+            if game_status["status"] == "tie":
                 print("Game over.")
                 break
         else:
             print("Move ignored. Cell is occupied or game already finished.")
 
 
-_initial_state = create_game_state()
-players = _initial_state["players"]
-player = _initial_state["player"]
-label = _initial_state["label"]
-table_game = _initial_state["table_game"]
-
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,214 @@
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from collections import deque
+
+from fastapi import APIRouter, Header
+
+from . import log
+from . import profiling
+
+
+router = APIRouter()
+logger = log.get_logger("tracing")
+
+TRACING_ENABLED = os.environ.get("TRACING", "1") != "0"
+# Head sampling for export; traces slower than TRACE_SLOW_MS are always exported.
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_SLOW_MS = float(os.environ.get("TRACE_SLOW_MS", "50"))
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH", "")
+TRACE_EXPORT_URL = os.environ.get("TRACE_EXPORT_URL", "")
+TRACE_EXPORT_INTERVAL = 1.0
+TRACE_EXPORT_BATCH = 512
+RECENT_TRACES = 1000
+SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "ft_transcendence")
+
+now = time.perf_counter_ns
+# perf_counter has no epoch; this offset turns it into the unix nanoseconds OTLP expects.
+_EPOCH_OFFSET_NS = time.time_ns() - time.perf_counter_ns()
+_sampler = random.Random()
+
+recent = deque(maxlen=RECENT_TRACES)
+stats = {"traces": 0, "exported": 0, "export_errors": 0, "dropped": 0}
+
+
+class Trace:
+    __slots__ = ("name", "attributes", "start", "end", "spans")
+
+    def __init__(self, name, attributes, start):
+        self.name = name
+        self.attributes = attributes
+        self.start = start
+        self.end = 0
+        self.spans = []
+
+    def record(self, name, started):
+        self.spans.append((name, started, now()))
+
+    def finish(self):
+        self.end = now()
+        stats["traces"] += 1
+        recent.append(self)
+        duration_ms = (self.end - self.start) / 1e6
+        if duration_ms >= TRACE_SLOW_MS or _sampler.random() < TRACE_SAMPLE_RATE:
+            exporter.submit(self)
+
+    def summary(self):
+        return {
+            "name": self.name,
+            **self.attributes,
+            "duration_ms": round((self.end - self.start) / 1e6, 3),
+            "stages_ms": {name: round((end - start) / 1e6, 3) for name, start, end in self.spans},
+        }
+
+
+class _NoopTrace:
+    def record(self, name, started):
+        pass
+
+    def finish(self):
+        pass
+
+
+NOOP_TRACE = _NoopTrace()
+
+
+def begin(name, bucket=None, **attributes):
+    if not TRACING_ENABLED:
+        return NOOP_TRACE
+    # The rate-limited reader stamps when the frame was parsed, so parsing becomes the first span.
+    parse_started = getattr(bucket, "parse_started", 0)
+    if parse_started:
+        trace = Trace(name, attributes, parse_started)
+        trace.spans.append(("parse", parse_started, bucket.parse_ended))
+        return trace
+    return Trace(name, attributes, now())
+
+
+def _attributes(values):
+    return [{"key": key, "value": {"stringValue": str(value)}} for key, value in values.items()]
+
+
+def to_otlp(traces):
+    spans = []
+    for trace in traces:
+        trace_id = os.urandom(16).hex()
+        root_id = os.urandom(8).hex()
+        spans.append(
+            {
+                "traceId": trace_id,
+                "spanId": root_id,
+                "name": trace.name,
+                "kind": 2,
+                "startTimeUnixNano": str(trace.start + _EPOCH_OFFSET_NS),
+                "endTimeUnixNano": str(trace.end + _EPOCH_OFFSET_NS),
+                "attributes": _attributes(trace.attributes),
+            }
+        )
+        for name, start, end in trace.spans:
+            spans.append(
+                {
+                    "traceId": trace_id,
+                    "spanId": os.urandom(8).hex(),
+                    "parentSpanId": root_id,
+                    "name": name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(start + _EPOCH_OFFSET_NS),
+                    "endTimeUnixNano": str(end + _EPOCH_OFFSET_NS),
+                }
+            )
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": _attributes({"service.name": SERVICE_NAME})},
+                "scopeSpans": [{"scope": {"name": "app.tracing"}, "spans": spans}],
+            }
+        ]
+    }
+
+
+class SpanExporter:
+    def __init__(self, path=TRACE_EXPORT_PATH, url=TRACE_EXPORT_URL):
+        self.path = path
+        self.url = url
+        self._queue = queue.Queue(TRACE_EXPORT_BATCH * 8)
+        self._thread = None
+        self._closed = threading.Event()
+
+    @property
+    def enabled(self):
+        return bool(self.path or self.url)
+
+    def submit(self, trace):
+        if not self.enabled:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._export_loop, name="span-exporter", daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            stats["dropped"] += 1
+
+    def _drain(self):
+        batch = []
+        while len(batch) < TRACE_EXPORT_BATCH:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _export(self, batch):
+        # One OTLP/JSON request per line: the format the collector's otlpjsonfile receiver reads.
+        body = json.dumps(to_otlp(batch), separators=(",", ":"))
+        try:
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(body + "\n")
+            if self.url:
+                request = urllib.request.Request(
+                    self.url, data=body.encode(), headers={"Content-Type": "application/json"}, method="POST"
+                )
+                urllib.request.urlopen(request, timeout=5).close()
+            stats["exported"] += len(batch)
+        except OSError as exc:
+            stats["export_errors"] += 1
+            logger.warning("span export failed: %s", exc)
+
+    def _export_loop(self):
+        while not self._closed.is_set():
+            self._closed.wait(TRACE_EXPORT_INTERVAL)
+            batch = self._drain()
+            while batch:
+                self._export(batch)
+                batch = self._drain()
+
+    def close(self):
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+exporter = SpanExporter()
+
+
+def close():
+    exporter.close()
+
+
+@router.get("/debug/slow-moves")
+async def slow_moves(limit: int = 20, x_admin_token: str | None = Header(default=None)):
+    # The summaries carry live game and player ids.
+    profiling.require_admin(x_admin_token)
+    traces = sorted(list(recent), key=lambda trace: trace.end - trace.start, reverse=True)
+    return {
+        "window": len(recent),
+        "stats": dict(stats),
+        "slowest": [trace.summary() for trace in traces[: max(1, min(limit, RECENT_TRACES))]],
+    }
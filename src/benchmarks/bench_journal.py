@@ -0,0 +1,62 @@
+import argparse
+import os
+import tempfile
+import time
+
+from app import tic_tac_toe_cli as game
+from app.journal import GameJournal
+
+
+MOVES = [(1, 1), (0, 0), (2, 2), (0, 2), (0, 1), (2, 1), (1, 0), (1, 2), (2, 0)]
+
+
+def play_moves(games, journal=None):
+    for i in range(games):
+        game_id = f"bench-{i}"
+        state = game.create_game_state(player_choice="X")
+        if journal is not None:
+            journal.record_create("offline", game_id, {"game_id": game_id})
+        for h, w in MOVES:
+            game.next(state, h, w)
+            if journal is not None:
+                journal.record_move("offline", game_id, h, w)
+        if journal is not None:
+            journal.record_end("offline", game_id, game.is_winning(state)["status"])
+
+
+def run(games, fsync_every, fsync_interval):
+    moves = games * len(MOVES)
+
+    start = time.perf_counter()
+    play_moves(games)
+    baseline = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "journal.log")
+        journal = GameJournal(path, fsync_every=fsync_every, fsync_interval=fsync_interval)
+        start = time.perf_counter()
+        play_moves(games, journal)
+        journaled = time.perf_counter() - start
+        start = time.perf_counter()
+        journal.close()
+        closing = time.perf_counter() - start
+        size = os.path.getsize(path)
+
+    print(f"games={games} moves={moves} fsync_every={fsync_every} fsync_interval={fsync_interval}s")
+    print(f"engine only:   {baseline * 1e6 / moves:8.2f} us/move")
+    print(f"with journal:  {journaled * 1e6 / moves:8.2f} us/move")
+    print(f"overhead:      {(journaled - baseline) * 1e6 / moves:8.2f} us/move")
+    print(f"records={journal.records} fsyncs={journal.fsyncs} final_flush={closing * 1e3:.2f} ms size={size} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the per-move cost of the game journal.")
+    parser.add_argument("--games", type=int, default=20_000)
+    parser.add_argument("--fsync-every", type=int, default=64)
+    parser.add_argument("--fsync-interval", type=float, default=0.05)
+    args = parser.parse_args()
+    run(args.games, args.fsync_every, args.fsync_interval)
+
+
+if __name__ == "__main__":
+    main()
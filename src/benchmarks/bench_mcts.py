@@ -0,0 +1,78 @@
+import argparse
+import time
+
+from training.mcts import MCTS, wins_at
+from training.tictactoe_model import minimax_action
+
+
+MODEL_VALUES = (0, 1, -1)
+
+
+def playout_rate(size, win_length, time_limit_ms, rollouts_per_leaf):
+    cells = bytearray(size * size)
+    centre = (size // 2) * size + size // 2
+    cells[centre] = 1
+    tree = MCTS(cells, size, win_length, 2, rollouts_per_leaf=rollouts_per_leaf)
+    result = tree.search(time_limit_ms)
+    return result.playouts / (result.elapsed_ms / 1000), result.nodes
+
+
+def play_vs_minimax(games, time_limit_ms, rollouts_per_leaf):
+    wins = draws = losses = 0
+    reused = 0
+    for game_index in range(games):
+        cells = bytearray(9)
+        mcts_code = 1 if game_index % 2 == 0 else 2
+        code = 1
+        tree = None
+        winner = 0
+        for _ in range(9):
+            if code == mcts_code:
+                if tree is None:
+                    tree = MCTS(cells, 3, 3, code, rollouts_per_leaf=rollouts_per_leaf)
+                else:
+                    tree.sync(cells, code)
+                result = tree.search(time_limit_ms)
+                reused += result.reused_visits
+                action = result.action
+                tree.advance(action)
+            else:
+                board = tuple(MODEL_VALUES[value] for value in cells)
+                action = minimax_action(board, 1 if code == 1 else -1)
+            cells[action] = code
+            if wins_at(cells, 3, 3, action, code):
+                winner = code
+                break
+            code = 3 - code
+
+        if winner == mcts_code:
+            wins += 1
+        elif winner == 0:
+            draws += 1
+        else:
+            losses += 1
+    return wins, draws, losses, reused
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure MCTS playout throughput and strength.")
+    parser.add_argument("--games", type=int, default=50)
+    parser.add_argument("--think-ms", type=float, default=50)
+    parser.add_argument("--rollouts-per-leaf", type=int, default=4)
+    args = parser.parse_args()
+
+    for size, win_length in ((3, 3), (9, 5), (15, 5)):
+        rate, nodes = playout_rate(size, win_length, 1000, args.rollouts_per_leaf)
+        print(f"{size}x{size} k={win_length}: {rate:10.0f} playouts/s ({nodes} nodes after 1s)")
+
+    start = time.perf_counter()
+    wins, draws, losses, reused = play_vs_minimax(args.games, args.think_ms, args.rollouts_per_leaf)
+    elapsed = time.perf_counter() - start
+    print(
+        f"vs minimax_action on 3x3 over {args.games} games ({args.think_ms} ms/move): "
+        f"W={wins} D={draws} L={losses}, reused visits={reused}, {elapsed:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
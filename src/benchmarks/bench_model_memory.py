@@ -0,0 +1,103 @@
+import argparse
+import multiprocessing
+import sys
+import time
+
+from training.qtable import DEFAULT_MODEL_PATH, DEFAULT_TABLE_PATH, load_table
+from training.tictactoe_model import load_model
+
+
+MODES = ("none", "pickle", "mapped")
+LOOKUP_SAMPLE = 512
+LOOKUP_ROUNDS = 20
+
+
+def memory_kb(pid):
+    # Pss splits each shared page between the processes mapping it, so summing it over the
+    # workers gives what they cost the host together; Rss counts shared pages in every worker.
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                values[key] = int(rest.split()[0])
+    return values
+
+
+def worker(mode, ready, release, results):
+    model = None
+    if mode == "pickle":
+        model = load_model(str(DEFAULT_MODEL_PATH))
+    elif mode == "mapped":
+        model = load_table(str(DEFAULT_TABLE_PATH))
+
+    lookup_ns = 0.0
+    if model is not None:
+        # Touch every row, the way a long-running worker eventually does, without keeping the keys.
+        total = 0.0
+        for key in model.q:
+            total += sum(model.q[key])
+        # Then time the AI router's lookup: a membership test and a greedy pick.
+        sample = [key for key, _ in zip(model.q, range(LOOKUP_SAMPLE))]
+        start = time.perf_counter()
+        for _ in range(LOOKUP_ROUNDS):
+            for board, player in sample:
+                if (board, player) in model.q:
+                    model.sample_action(board, player, 0.0)
+        lookup_ns = (time.perf_counter() - start) / (LOOKUP_ROUNDS * len(sample)) * 1e9
+    results.put(lookup_ns)
+    ready.release()
+    release.wait()
+
+
+def measure(mode, workers):
+    context = multiprocessing.get_context("spawn")
+    ready = context.Semaphore(0)
+    release = context.Event()
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(mode, ready, release, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.acquire()
+    # Every worker is alive and holds its model while the kernel's accounting is read.
+    usage = [memory_kb(process.pid) for process in processes]
+    lookups = [results.get() for _ in processes]
+    release.set()
+    for process in processes:
+        process.join()
+    return {
+        "pss_kb": sum(entry["Pss"] for entry in usage),
+        "rss_kb": sum(entry["Rss"] for entry in usage),
+        "lookup_ns": min(lookups),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare what the pickled and the mapped Q-table cost across N worker processes."
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+    if not sys.platform.startswith("linux"):
+        sys.exit("needs /proc/<pid>/smaps_rollup (Linux)")
+
+    print(f"{'workers':>7} {'model':>7} {'total Pss':>11} {'model cost':>11} {'per worker':>11}")
+    lookups = None
+    for workers in sorted(args.workers):
+        results = {mode: measure(mode, workers) for mode in MODES}
+        baseline = results["none"]["pss_kb"]
+        for mode in MODES[1:]:
+            cost = results[mode]["pss_kb"] - baseline
+            print(
+                f"{workers:>7} {mode:>7} {results[mode]['pss_kb'] / 1024:>8.1f} MB {cost / 1024:>8.2f} MB "
+                f"{cost / workers / 1024:>8.2f} MB"
+            )
+        if lookups is None:
+            # Timed with the fewest workers: on a small host, more workers mostly measure CPU contention.
+            lookups = {mode: results[mode]["lookup_ns"] for mode in MODES[1:]}
+    print("lookup + greedy pick: " + ", ".join(f"{mode} {ns / 1000:.2f} us" for mode, ns in lookups.items()))
+
+
+if __name__ == "__main__":
+    main()
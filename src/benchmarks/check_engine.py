@@ -0,0 +1,171 @@
+import argparse
+import json
+import statistics
+import sys
+import time
+
+from app import core
+from app import tic_tac_toe_cli as game
+from training.tictactoe_model import WIN_LINES, terminal, winner
+
+
+MODEL_VALUES = (0, 1, -1)
+MOVES = [(1, 1), (0, 0), (2, 2), (0, 2), (0, 1), (2, 1), (1, 0), (1, 2), (2, 0)]
+
+
+def line_type(line):
+    if line[1] - line[0] == 1:
+        return "row"
+    if line[1] - line[0] == 3:
+        return "col"
+    return "diag"
+
+
+def expected_after(cells, player, index):
+    # What next() must produce when `player` plays `index`, derived from the model's reference rules.
+    after = list(cells)
+    after[index] = game.MARK_CODES[player]
+    board = tuple(MODEL_VALUES[value] for value in after)
+    won = winner(board)
+    if won:
+        code = 1 if won == 1 else 2
+        # A move completing two lines reports the first one in row, col, diag order.
+        line = next(line for line in WIN_LINES if index in line and all(after[i] == code for i in line))
+        status = {
+            "status": "win",
+            "winner": game.MARKS[code],
+            "line_type": line_type(line),
+            "cells": [divmod(i, 3) for i in line],
+        }
+        return after, player, f"{player} wins", status
+    if terminal(board):
+        return after, player, "the players tied", {"status": "tie", "winner": None, "line_type": None, "cells": []}
+    other = "O" if player == "X" else "X"
+    return after, other, f"{other} turn", game.ongoing_status()
+
+
+def snapshot(state):
+    return bytes(state["board"]["cells"]), state["player"], state["label"]["text"], dict(game.is_winning(state))
+
+
+def check_exhaustive():
+    failures = []
+    seen = set()
+    checked = 0
+    stack = [(starting, ()) for starting in ("X", "O")]
+    while stack:
+        starting, moves = stack.pop()
+        state = game.create_game_state(player_choice=starting)
+        game.replay_moves(state, moves)
+        cells, player, label, status = snapshot(state)
+        if (cells, player) in seen:
+            continue
+        seen.add((cells, player))
+
+        for index in range(9):
+            h, w = divmod(index, 3)
+            child = game.create_game_state(player_choice=starting)
+            game.replay_moves(child, moves + ((h, w),))
+            got = snapshot(child)
+            if cells[index] != 0 or status["status"] != "ongoing":
+                want = (cells, player, label, status)
+            else:
+                after, next_player, next_label, next_status = expected_after(cells, player, index)
+                want = (bytes(after), next_player, next_label, next_status)
+            checked += 1
+            if got != want:
+                failures.append({"start": starting, "moves": list(moves), "move": (h, w), "got": got, "want": want})
+            elif got[3]["status"] == "ongoing":
+                stack.append((starting, moves + ((h, w),)))
+    return len(seen), checked, failures
+
+
+def bench(fn, number, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(number)
+        timings.append((time.perf_counter() - start) / number * 1e9)
+    return {"min_ns": round(min(timings), 1), "median_ns": round(statistics.median(timings), 1), "rounds": repeat}
+
+
+def bench_next(number):
+    # One op is a full 9-move game, reset in place.
+    state = game.create_game_state(player_choice="X")
+    next_move = game.next
+    for _ in range(number):
+        game.reset_board(state["board"])
+        state["player"] = "X"
+        for h, w in MOVES:
+            next_move(state, h, w)
+
+
+def make_ongoing_state():
+    state = game.create_game_state(player_choice="X")
+    game.replay_moves(state, MOVES[:4])
+    return state
+
+
+def bench_is_winning(number):
+    state = make_ongoing_state()
+    is_winning = game.is_winning
+    for _ in range(number):
+        is_winning(state)
+
+
+def bench_state_message(**extra):
+    # core.state_message serializes state for every mode; the AI adds its move as an extra field.
+    def run(number):
+        state = make_ongoing_state()
+        message = core.state_message
+        for _ in range(number):
+            message(state, "Move accepted.", **extra)
+
+    return run
+
+
+def run_benchmarks(number, repeat):
+    results = {
+        "next (9-move game)": bench(bench_next, number, repeat),
+        "is_winning": bench(bench_is_winning, number * 10, repeat),
+        "state_message": bench(bench_state_message(), number, repeat),
+        "state_message (ai_move)": bench(bench_state_message(ai_move={"row": 2, "col": 2}), number, repeat),
+    }
+    results["next (9-move game)"]["per_move_ns"] = round(results["next (9-move game)"]["min_ns"] / len(MOVES), 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check the engine against the model's reference rules on every 3x3 position, then time it."
+    )
+    parser.add_argument("--skip-check", action="store_true")
+    parser.add_argument("--skip-bench", action="store_true")
+    parser.add_argument("--number", type=int, default=20_000, help="operations per timing round")
+    parser.add_argument("--repeat", type=int, default=5, help="timing rounds; min and median are reported")
+    parser.add_argument("--json", help="write benchmark results to this file for comparison across releases")
+    args = parser.parse_args()
+
+    if not args.skip_check:
+        start = time.perf_counter()
+        positions, checked, failures = check_exhaustive()
+        elapsed = time.perf_counter() - start
+        print(f"{positions} reachable positions, {checked} transitions checked in {elapsed:.1f}s")
+        for failure in failures[:10]:
+            print(f"MISMATCH {failure}")
+        if failures:
+            print(f"{len(failures)} mismatches")
+            sys.exit(1)
+
+    if not args.skip_bench:
+        results = run_benchmarks(args.number, args.repeat)
+        for name, result in results.items():
+            extra = f"  ({result['per_move_ns']} ns/move)" if "per_move_ns" in result else ""
+            print(f"{name:28} min {result['min_ns']:10.1f} ns  median {result['median_ns']:10.1f} ns{extra}")
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import hashlib
+import itertools
+import os
+import random
+import time
+
+# Test mode must be on before the AI router reads its search budgets; suspends log at INFO.
+os.environ.setdefault("GAME_SEED", "simulate")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app import ai
+from app import tic_tac_toe_cli as game
+
+
+CONFIGS = list(
+    itertools.product(("easy", "medium", "hard"), ("auto", "search", "mcts"), ((3, 3), (6, 4)))
+)
+
+
+def play(index, seed, resume_at=None):
+    # One AI game against a seeded random opponent; returns every move in order.
+    difficulty, engine, (size, win_length) = CONFIGS[index % len(CONFIGS)]
+    game_id = f"sim-{index}"
+    session = ai.register_session(
+        game_id, f"sim-player-{index}", "X", "O", "X", difficulty, engine, size, win_length, seed=seed
+    )
+    opponent = random.Random(f"{seed}:opponent")
+    moves = []
+    try:
+        while game.is_winning(session["state"])["status"] == "ongoing":
+            if resume_at is not None and len(moves) == resume_at:
+                # Drop the session the way a disconnect does and bring it back from the compact entry.
+                ai.MODE.suspend(session)
+                session, _, _ = ai.MODE.revive(game_id, None, session["player_id"])
+            state = session["state"]
+            if state["player"] == session["player_choice"]:
+                empties = [i for i, value in enumerate(state["board"]["cells"]) if value == game.EMPTY]
+                h, w = divmod(opponent.choice(empties), size)
+                game.next(state, h, w)
+                moves.append((h, w))
+            else:
+                ai_move = ai.apply_ai_turn(session)
+                moves.append((ai_move["row"], ai_move["col"]))
+    finally:
+        ai.MODE.finish(game_id)
+    return moves
+
+
+def digest(games):
+    return hashlib.sha256(repr(games).encode()).hexdigest()[:16]
+
+
+async def run(args):
+    seeds = [random.Random(f"{args.seed}:{index}").getrandbits(63) for index in range(args.games)]
+    start = time.perf_counter()
+    straight = [play(index, seed) for index, seed in enumerate(seeds)]
+    elapsed = time.perf_counter() - start
+    print(f"{args.games} games, {sum(map(len, straight))} moves in {elapsed:.1f}s: digest {digest(straight)}")
+    if args.resume_at < 0:
+        return True
+
+    resumed = [play(index, seed, args.resume_at) for index, seed in enumerate(seeds)]
+    differ = [index for index, (a, b) in enumerate(zip(straight, resumed)) if a != b]
+    print(f"suspended and resumed at ply {args.resume_at}: digest {digest(resumed)}, {len(differ)} games differ")
+    for index in differ[:5]:
+        print(f"  game {index} {CONFIGS[index % len(CONFIGS)]}: {straight[index]} != {resumed[index]}")
+    return not differ
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Play seeded AI games in-process and print a digest of every move; the same --seed "
+        "gives the same digest on any host."
+    )
+    parser.add_argument("--games", type=int, default=36)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--resume-at", type=int, default=3, help="also replay each game with a suspend at this ply; negative to skip")
+    args = parser.parse_args()
+    if not asyncio.run(run(args)):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import urllib.request
+
+import websockets
+
+from app import tic_tac_toe_cli as game
+
+
+def expected_boards(board_size, win_length, seed):
+    # Every board the game can legally show, indexed by the number of marks on it.
+    rng = random.Random(seed)
+    cells = [divmod(index, board_size) for index in range(board_size * board_size)]
+    rng.shuffle(cells)
+    state = game.create_game_state(player_choice="X", size=board_size, win_length=win_length)
+    boards = [(game.board_rows(state), state["label"]["text"])]
+    moves = []
+    for h, w in cells:
+        game.next(state, h, w)
+        moves.append((h, w))
+        boards.append((game.board_rows(state), state["label"]["text"]))
+        if game.is_winning(state)["status"] != "ongoing":
+            break
+    return moves, boards
+
+
+class Player:
+    def __init__(self, run, game_id, role, player_id, moves, boards):
+        self.run = run
+        self.game_id = game_id
+        self.role = role
+        self.player_id = player_id
+        self.moves = moves
+        self.boards = boards
+        self.last_seen = -1
+        self.sent = set()
+        self.final = None
+
+    def check(self, data):
+        board = data.get("board")
+        if board is None:
+            return None
+        index = sum(value != "" for row in board for value in row)
+        if index >= len(self.boards) or (board, data["status"]) != self.boards[index]:
+            self.run.fail("corrupt", self.game_id, self.role, f"unexpected board after {index} moves: {board}")
+            return None
+        if index < self.last_seen:
+            self.run.fail("out_of_order", self.game_id, self.role, f"board went back from {self.last_seen} to {index} moves")
+        self.last_seen = max(self.last_seen, index)
+        self.run.boards_checked += 1
+        if data["game_status"] != "ongoing":
+            self.final = index
+        return index
+
+    def react(self, data):
+        # Returns the move to send, if any: our own move when it is our turn, and now and then
+        # the opponent's pending move out of turn so the rejection path runs under load too.
+        index = self.check(data)
+        if index is None or data["game_status"] != "ongoing" or index >= len(self.moves):
+            return None
+        if data["status"] == f"{self.role} turn":
+            if index in self.sent:
+                return None
+            self.sent.add(index)
+            return self.moves[index]
+        if self.run.rng.random() < self.run.noise:
+            self.run.noise_sent += 1
+            return self.moves[index]
+        return None
+
+
+class StressRun:
+    def __init__(self, url, games, per_connection, board_size, win_length, seed, noise):
+        self.url = url
+        self.games = games
+        self.per_connection = per_connection
+        self.board_size = board_size
+        self.win_length = win_length
+        self.seed = seed
+        self.noise = noise
+        self.rng = random.Random(seed)
+        self.failures = {"corrupt": 0, "out_of_order": 0, "errors": 0}
+        self.examples = []
+        self.boards_checked = 0
+        self.moves_sent = 0
+        self.noise_sent = 0
+        self.closed = 0
+
+    def fail(self, kind, game_id, role, detail):
+        self.failures[kind] += 1
+        if len(self.examples) < 10:
+            self.examples.append(f"{kind} {game_id} {role}: {detail}")
+
+    def create_games(self):
+        http_url = "http" + self.url[2:]
+        games = []
+        for index in range(self.games):
+            game_id = f"stress-{self.seed}-{index}"
+            body = {
+                "game_id": game_id,
+                "player_x": f"{game_id}-x",
+                "player_o": f"{game_id}-o",
+                "board_size": self.board_size,
+                "win_length": self.win_length,
+            }
+            request = urllib.request.Request(
+                f"{http_url}/online", data=json.dumps(body).encode(), headers={"Content-Type": "application/json"}
+            )
+            urllib.request.urlopen(request).close()
+            moves, boards = expected_boards(self.board_size, self.win_length, f"{self.seed}:{index}")
+            games.append((game_id, moves, boards))
+        return games
+
+    async def connection(self, players):
+        # One multiplexed socket carries many players; X and O of a game never share a socket.
+        async with websockets.connect(f"{self.url}/ws/mux", max_queue=None) as ws:
+            by_game = {player.game_id: player for player in players}
+            for player in players:
+                await ws.send(json.dumps({"op": "open", "mode": "online", "game_id": player.game_id}))
+                await ws.send(json.dumps({"game_id": player.game_id, "data": {"player_id": player.player_id}}))
+            open_channels = len(players)
+            async for frame in ws:
+                message = json.loads(frame)
+                player = by_game.get(message.get("game_id"))
+                if "error" in message or player is None:
+                    self.fail("errors", message.get("game_id"), "-", message.get("error", message))
+                    continue
+                if message.get("event") == "closed":
+                    open_channels -= 1
+                    self.closed += 1
+                    if player.final is None:
+                        self.fail("corrupt", player.game_id, player.role, "channel closed before the game finished")
+                    if open_channels == 0:
+                        return
+                    continue
+                move = player.react(message["data"])
+                if move is not None:
+                    self.moves_sent += 1
+                    data = {"player_id": player.player_id, "row": move[0], "col": move[1]}
+                    await ws.send(json.dumps({"game_id": player.game_id, "data": data}))
+
+    async def run(self, timeout):
+        games = await asyncio.to_thread(self.create_games)
+        connections = max(2, -(-self.games // self.per_connection))
+        groups = [[] for _ in range(connections)]
+        for index, (game_id, moves, boards) in enumerate(games):
+            slot = index % connections
+            groups[slot].append(Player(self, game_id, "X", f"{game_id}-x", moves, boards))
+            groups[(slot + 1) % connections].append(Player(self, game_id, "O", f"{game_id}-o", moves, boards))
+
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(self.connection(group)) for group in groups]
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        elapsed = time.perf_counter() - started
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                self.fail("errors", "-", "-", repr(result))
+        return elapsed, connections, len(pending)
+
+
+async def serve_in_process():
+    # Quiet the per-game INFO lines; the script reports its own totals.
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    import uvicorn
+    from app.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning", ws_max_queue=4096))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return f"ws://127.0.0.1:{port}", server, task
+
+
+async def main_async(args):
+    server = None
+    url = args.url
+    if url is None:
+        url, server, server_task = await serve_in_process()
+    run = StressRun(url, args.games, args.per_connection, args.board_size, args.win_length, args.seed, args.noise)
+    try:
+        elapsed, connections, stuck = await run.run(args.timeout)
+    finally:
+        if server is not None:
+            from app import online
+
+            leaked = len(online.active_online_games)
+            server.should_exit = True
+            await server_task
+    print(
+        f"games={args.games} connections={connections} board={args.board_size}x{args.board_size} "
+        f"win_length={args.win_length} seed={args.seed}"
+    )
+    print(
+        f"moves={run.moves_sent} (out of turn {run.noise_sent}) boards checked={run.boards_checked} "
+        f"in {elapsed:.1f}s ({run.moves_sent / elapsed:.0f} moves/s)"
+    )
+    failures = dict(run.failures)
+    failures["stuck_connections"] = stuck
+    failures["unclosed_channels"] = 2 * args.games - run.closed
+    if server is not None:
+        failures["leaked_sessions"] = leaked
+    print(" ".join(f"{name}={count}" for name, count in failures.items()))
+    for example in run.examples:
+        print(example)
+    return 1 if any(failures.values()) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Play thousands of concurrent online games and check every board against each game's own moves."
+    )
+    parser.add_argument("--url", help="ws:// base URL of a running server; by default one is started in-process")
+    parser.add_argument("--games", type=int, default=2000)
+    parser.add_argument("--per-connection", type=int, default=100, help="games per multiplexed socket")
+    parser.add_argument("--board-size", type=int, default=game.DEFAULT_SIZE)
+    parser.add_argument("--win-length", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--noise", type=float, default=0.1, help="chance of an out-of-turn move when waiting")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args()
+    if args.win_length is None:
+        args.win_length = game.default_win_length(args.board_size)
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import pytest
+
+from app import tic_tac_toe_cli as game
+from benchmarks.check_engine import check_exhaustive, line_type
+from training.tictactoe_model import WIN_LINES
+
+
+def play(moves, starting="X", size=3, win_length=3):
+    state = game.create_game_state(player_choice=starting, size=size, win_length=win_length)
+    game.replay_moves(state, moves)
+    return state
+
+
+@pytest.mark.parametrize("line", WIN_LINES)
+def test_every_line_wins(line):
+    # O's two marks come from outside the line; two marks never complete one.
+    others = [index for index in range(9) if index not in line][:2]
+    order = [line[0], others[0], line[1], others[1], line[2]]
+    state = play([divmod(index, 3) for index in order])
+
+    status = game.is_winning(state)
+    assert status["status"] == "win"
+    assert status["winner"] == "X"
+    assert status["line_type"] == line_type(line)
+    assert sorted(status["cells"]) == sorted(divmod(index, 3) for index in line)
+    assert state["label"]["text"] == "X wins"
+
+
+def test_full_board_without_a_line_is_a_tie():
+    state = play([(0, 0), (1, 1), (2, 2), (0, 1), (2, 1), (2, 0), (0, 2), (1, 2), (1, 0)])
+    assert game.is_winning(state) == {"status": "tie", "winner": None, "line_type": None, "cells": []}
+    assert state["label"]["text"] == "the players tied"
+
+
+def test_moves_after_the_end_or_on_taken_cells_are_ignored():
+    state = play([(0, 0)])
+    assert not game.next(state, 0, 0)
+    assert state["player"] == "O"
+
+    state = play([(0, 0), (1, 0), (0, 1), (1, 1), (0, 2)])
+    cells = bytes(state["board"]["cells"])
+    assert not game.next(state, 2, 2)
+    assert bytes(state["board"]["cells"]) == cells
+    assert state["label"]["text"] == "X wins"
+
+
+@pytest.mark.parametrize("line_name, moves", [
+    ("row", [(2, 1), (0, 0), (2, 2), (0, 1), (2, 3), (4, 4), (2, 4)]),
+    ("col", [(0, 3), (0, 0), (1, 3), (0, 1), (2, 3), (4, 4), (3, 3)]),
+    ("diag", [(0, 4), (0, 0), (1, 3), (0, 1), (2, 2), (4, 4), (3, 1)]),
+])
+def test_win_length_on_larger_boards(line_name, moves):
+    state = play(moves[:-1], size=5, win_length=4)
+    assert game.is_winning(state)["status"] == "ongoing"
+    game.next(state, *moves[-1])
+    status = game.is_winning(state)
+    assert (status["status"], status["winner"], status["line_type"]) == ("win", "X", line_name)
+    assert len(status["cells"]) == 4
+
+
+def test_every_transition_matches_the_reference_rules():
+    positions, checked, failures = check_exhaustive()
+    assert positions == 9040
+    assert checked == 9 * positions
+    assert failures == []
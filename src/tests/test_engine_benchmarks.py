@@ -0,0 +1,21 @@
+import pytest
+
+from benchmarks.check_engine import bench_is_winning, bench_next, bench_state_message
+
+pytest.importorskip("pytest_benchmark")
+
+
+def test_next_full_game(benchmark):
+    benchmark(bench_next, 100)
+
+
+def test_is_winning(benchmark):
+    benchmark(bench_is_winning, 1000)
+
+
+def test_state_message(benchmark):
+    benchmark(bench_state_message(), 100)
+
+
+def test_state_message_with_ai_move(benchmark):
+    benchmark(bench_state_message(ai_move={"row": 2, "col": 2}), 100)
@@ -0,0 +1,63 @@
+import asyncio
+import random
+
+from app import online
+
+
+class FakeSocket:
+    def __init__(self, delays=None):
+        self.received = []
+        self.delays = delays
+        self.gate = None
+
+    async def send_json(self, payload):
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.delays is not None:
+            await asyncio.sleep(self.delays.random() / 1000)
+        self.received.append(payload)
+
+
+def make_session(game_id, *sockets):
+    session = online.register_session(game_id, f"{game_id}-x", f"{game_id}-o", f"{game_id}-x")
+    session["connections"] = dict(zip(session["roles"], sockets))
+    return session
+
+
+def test_broadcasts_arrive_in_ticket_order():
+    async def scenario():
+        rng = random.Random(1)
+        sockets = FakeSocket(rng), FakeSocket(rng)
+        session = make_session("order", *sockets)
+        await asyncio.gather(*(online.deliver(session, {"n": n}) for n in range(200)))
+        return sockets
+
+    try:
+        sockets = asyncio.run(scenario())
+    finally:
+        online.cleanup_session("order")
+    for ws in sockets:
+        assert [message["n"] for message in ws.received] == list(range(200))
+
+
+def test_a_sender_cancelled_while_waiting_does_not_block_the_game():
+    async def scenario():
+        slow, other = FakeSocket(), FakeSocket()
+        slow.gate = asyncio.Event()
+        session = make_session("cancel", slow, other)
+        first = asyncio.create_task(online.deliver(session, {"n": 0}))
+        waiting = asyncio.create_task(online.deliver(session, {"n": 1}))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        later = asyncio.create_task(online.deliver(session, {"n": 2}))
+        slow.gate.set()
+        await asyncio.wait_for(asyncio.gather(first, later), timeout=1)
+        return slow, other, session
+
+    try:
+        slow, other, session = asyncio.run(scenario())
+    finally:
+        online.cleanup_session("cancel")
+    assert [message["n"] for message in slow.received] == [0, 2]
+    assert session["delivered"] == session["posted"] == 3
@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import argparse
+import json
+from array import array
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .tictactoe_model import (
+    Board,
+    RLQModel,
+    apply_action,
+    board_index,
+    empty_board,
+    load_model,
+    minimax_action,
+    minimax_value,
+    save_games,
+    terminal,
+    winner,
+)
+
+ROOT = Path(__file__).resolve().parent
+DEFAULT_MODEL_PATH = ROOT / "models" / "final_model.pkl"
+POSITIONS = 3**9
+FINISHED_STATUSES = {"win", "tie"}
+# The tables and the model only cover the classic board; journals also hold NxN games since 030.
+BOARD_SIZE = 3
+WIN_LENGTH = 3
+
+
+@dataclass
+class FinishedGame:
+    mode: str
+    first_player: int
+    actions: List[int]
+
+
+@dataclass
+class GameStats:
+    games: int = 0
+    results_by_mode: Dict[str, List[int]] = field(default_factory=dict)
+    openings: array = field(default_factory=lambda: array("I", bytes(4 * 9)))
+    replies: array = field(default_factory=lambda: array("I", bytes(4 * 81)))
+    # Indexed by board_index(board) * 2 + (player == -1): positions seen with that side to move.
+    visits: array = field(default_factory=lambda: array("I", bytes(4 * POSITIONS * 2)))
+    action_counts: array = field(default_factory=lambda: array("I", bytes(4 * POSITIONS * 2 * 9)))
+
+    def add(self, game: FinishedGame) -> None:
+        board = empty_board()
+        player = game.first_player
+        for action in game.actions:
+            slot = board_index(board) * 2 + (player == -1)
+            self.visits[slot] += 1
+            self.action_counts[slot * 9 + action] += 1
+            board = apply_action(board, action, player)
+            player = -player
+
+        # 0: X won, 1: O won, 2: tie.
+        result = {1: 0, -1: 1}.get(winner(board), 2)
+        self.results_by_mode.setdefault(game.mode, [0, 0, 0])[result] += 1
+        if game.actions:
+            self.openings[game.actions[0]] += 1
+        if len(game.actions) > 1:
+            self.replies[game.actions[0] * 9 + game.actions[1]] += 1
+        self.games += 1
+
+    def consume(self, games: Iterable[FinishedGame]) -> Iterator[FinishedGame]:
+        for game in games:
+            self.add(game)
+            yield game
+
+
+def board_from_index(index: int) -> Board:
+    cells = []
+    for _ in range(9):
+        index, digit = divmod(index, 3)
+        cells.append(-1 if digit == 2 else digit)
+    return tuple(cells)
+
+
+def iter_records(paths: Iterable[str]) -> Iterator[dict]:
+    for path in paths:
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and "op" in record:
+                    yield record
+
+
+def _first_player(mode: str, fields: dict) -> int:
+    starting = fields.get("starting_player")
+    if mode == "online":
+        starting = "X" if starting == fields.get("player_x") else "O"
+    return 1 if starting == "X" else -1
+
+
+def board_shape(fields: dict) -> Tuple[int, int]:
+    # Journals written before 030 have no dimensions: those games were all 3x3.
+    return fields.get("board_size", BOARD_SIZE), fields.get("win_length", WIN_LENGTH)
+
+
+def iter_finished_games(
+    records: Iterable[dict], modes: Optional[set] = None, skipped: Optional[Dict[str, int]] = None
+) -> Iterator[FinishedGame]:
+    # Only games still in flight are buffered, so memory follows concurrency rather than journal size.
+    # Games on any other board than 3x3 with three in a row are left out; skipped counts them by shape.
+    in_flight: Dict[Tuple[str, str], FinishedGame] = {}
+    for record in records:
+        mode = record.get("mode")
+        key = (mode, record.get("game_id"))
+        op = record["op"]
+        if op == "create":
+            if modes is not None and mode not in modes:
+                continue
+            fields = record.get("fields") or {}
+            size, win_length = board_shape(fields)
+            if (size, win_length) != (BOARD_SIZE, WIN_LENGTH):
+                if skipped is not None:
+                    shape = f"{size}x{size}/{win_length}"
+                    skipped[shape] = skipped.get(shape, 0) + 1
+                continue
+            in_flight[key] = FinishedGame(mode=mode, first_player=_first_player(mode, fields), actions=[])
+        elif op == "move":
+            game = in_flight.get(key)
+            if game is not None:
+                game.actions.append(3 * record["row"] + record["col"])
+        elif op == "end":
+            game = in_flight.pop(key, None)
+            if game is not None and record.get("game_status") in FINISHED_STATUSES:
+                yield game
+
+
+def model_deviations(stats: GameStats, model: RLQModel) -> Tuple[int, int, int, List[Tuple[int, Board, int, int, int]]]:
+    positions = 0
+    differs = 0
+    suboptimal = 0
+    worst: List[Tuple[int, Board, int, int, int]] = []
+    for slot, visits in enumerate(stats.visits):
+        if visits == 0:
+            continue
+        board = board_from_index(slot // 2)
+        player = -1 if slot % 2 else 1
+        if terminal(board):
+            continue
+
+        positions += 1
+        chosen = model.choose_action(board, player)
+        reference = minimax_action(board, player)
+        if chosen != reference:
+            differs += 1
+        best = minimax_value(board, player)
+        if -minimax_value(apply_action(board, chosen, player), -player) < best:
+            suboptimal += 1
+            worst.append((visits, board, player, chosen, reference))
+
+    worst.sort(key=lambda item: item[0], reverse=True)
+    return positions, differs, suboptimal, worst
+
+
+def render(board: Board) -> str:
+    symbols = {1: "X", -1: "O", 0: "."}
+    return "/".join("".join(symbols[board[3 * r + c]] for c in range(3)) for r in range(3))
+
+
+def report(stats: GameStats, model: Optional[RLQModel], top: int, skipped: Optional[Dict[str, int]] = None) -> None:
+    print(f"Finished games: {stats.games}")
+    if skipped:
+        print("Skipped games on other boards: " + ", ".join(f"{shape}={count}" for shape, count in sorted(skipped.items())))
+    for mode, (x_wins, o_wins, ties) in sorted(stats.results_by_mode.items()):
+        total = x_wins + o_wins + ties
+        print(
+            f"  {mode:8s} games={total:8d} X={x_wins / total:6.1%} O={o_wins / total:6.1%} tie={ties / total:6.1%}"
+        )
+
+    print("Opening moves:")
+    for action in sorted(range(9), key=lambda a: stats.openings[a], reverse=True):
+        if stats.openings[action]:
+            print(f"  ({action // 3}, {action % 3}) {stats.openings[action]}")
+
+    replies = sorted(range(81), key=lambda i: stats.replies[i], reverse=True)[:top]
+    print("Most common two-move openings:")
+    for i in replies:
+        if stats.replies[i]:
+            first, second = divmod(i, 9)
+            print(f"  ({first // 3}, {first % 3}) -> ({second // 3}, {second % 3}) {stats.replies[i]}")
+
+    if model is None:
+        return
+
+    positions, differs, suboptimal, worst = model_deviations(stats, model)
+    print(f"Model vs minimax over {positions} reached positions:")
+    print(f"  differs from minimax_action: {differs}")
+    print(f"  minimax-suboptimal choices:  {suboptimal}")
+    for visits, board, player, chosen, reference in worst[:top]:
+        side = "X" if player == 1 else "O"
+        print(f"  {render(board)} {side} to move, seen {visits}x: model={chosen} minimax={reference}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Aggregate statistics over finished-game journals (run as: python -m training.analytics)."
+    )
+    parser.add_argument("journals", nargs="+", help="journal files written with GAME_JOURNAL_PATH")
+    parser.add_argument("--modes", default="offline,online,ai", help="comma separated game modes to include")
+    parser.add_argument("--model", default=str(DEFAULT_MODEL_PATH), help="model to compare against minimax")
+    parser.add_argument("--no-model", action="store_true", help="skip the model deviation report")
+    parser.add_argument("--export-games", help="write the games in the format read by load_games")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    stats = GameStats()
+    modes = {m.strip() for m in args.modes.split(",") if m.strip()}
+    skipped: Dict[str, int] = {}
+    games = stats.consume(iter_finished_games(iter_records(args.journals), modes, skipped))
+    recorded = ((game.first_player, game.actions) for game in games)
+    if args.export_games:
+        count = save_games(recorded, args.export_games)
+        print(f"Exported {count} games to {args.export_games}")
+    else:
+        for _ in recorded:
+            pass
+
+    model = None
+    if not args.no_model and Path(args.model).exists():
+        model = load_model(args.model)
+    report(stats, model, args.top, skipped)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .qtable import DEFAULT_MODEL_PATH, load_table
+from .search import TranspositionTable, best_move
+from .tictactoe_model import (
+    Board,
+    RLQModel,
+    StateKey,
+    apply_action,
+    empty_board,
+    legal_actions,
+    load_model,
+    minimax_value,
+    terminal,
+)
+
+LOAD_ROUNDS = 5
+WORST_KEPT = 50
+# metric -> (higher is better, default allowed regression, relative or absolute)
+THRESHOLDS = {
+    "optimal_fraction": (True, 0.0, "absolute"),
+    "mean_ns": (False, 0.25, "relative"),
+    "p99_ns": (False, 0.50, "relative"),
+    "load_ms": (False, 0.50, "relative"),
+    "size_bytes": (False, 0.25, "relative"),
+}
+
+
+ENGINE_CODES = {0: 0, 1: 1, -1: 2}
+
+
+@dataclass
+class ModelReport:
+    path: str
+    positions: int
+    # choose_action's own choices; a position missing from the table counts as a miss.
+    optimal: int
+    optimal_fraction: float
+    # Informational: how the optimal fraction splits between games X and O open.
+    optimal_by_opener: Dict[str, float]
+    # choose_action over every position, whether the table has it or not.
+    mean_ns: float
+    p99_ns: float
+    load_ms: float
+    size_bytes: int
+    # Positions the table has, where choose_action is not optimal.
+    worst: List[Tuple[str, int, int]]
+    # Informational, and None in reports written before they existed: the share of positions
+    # the table has, and the optimal fraction as the server plays, searching the positions it lacks.
+    coverage: Optional[float] = None
+    served_optimal_fraction: Optional[float] = None
+
+
+def reachable_positions() -> List[StateKey]:
+    # Every non-terminal position with the side to move; games may start with either X or O.
+    seen = set()
+    stack: List[StateKey] = [(empty_board(), 1), (empty_board(), -1)]
+    while stack:
+        key = stack.pop()
+        if key in seen:
+            continue
+        seen.add(key)
+        board, player = key
+        for action in legal_actions(board):
+            child = apply_action(board, action, player)
+            if not terminal(child):
+                stack.append((child, -player))
+    return sorted(seen)
+
+
+def opener(board: Board, player: int) -> str:
+    # X opened if the marks are level with X to move, or X is one ahead with O to move.
+    return "X" if board.count(1) - board.count(-1) == (0 if player == 1 else 1) else "O"
+
+
+def load(path: str) -> RLQModel:
+    return load_table(path) if path.endswith(".qtab") else load_model(path)
+
+
+def close(model: RLQModel) -> None:
+    # Mapped tables hold a file mapping; pickled models have nothing to release.
+    if hasattr(model, "close"):
+        model.close()
+
+
+def render(board: Board) -> str:
+    symbols = {1: "X", -1: "O", 0: "."}
+    return "/".join("".join(symbols[board[3 * r + c]] for c in range(3)) for r in range(3))
+
+
+def served_action(model: RLQModel, board: Board, player: int, table: TranspositionTable) -> int:
+    # Mirrors app/ai.py: a position missing from the table is searched. The hard AI's opening
+    # book is left out; it answers the same whatever the model.
+    if (board, player) in model.q:
+        return model.choose_action(board, player)
+    cells = [ENGINE_CODES[value] for value in board]
+    return best_move(cells, 3, 3, ENGINE_CODES[player], float("inf"), table=table).action
+
+
+def evaluate(path: str, positions: List[StateKey], rounds: int = 5) -> ModelReport:
+    model = None
+    load_ms = float("inf")
+    for _ in range(LOAD_ROUNDS):
+        if model is not None:
+            close(model)
+        started = time.perf_counter()
+        model = load(path)
+        load_ms = min(load_ms, (time.perf_counter() - started) * 1000)
+    try:
+        return measure(model, path, positions, rounds, load_ms)
+    finally:
+        close(model)
+
+
+def is_optimal(board: Board, player: int, action: int) -> bool:
+    return -minimax_value(apply_action(board, action, player), -player) == minimax_value(board, player)
+
+
+def measure(model: RLQModel, path: str, positions: List[StateKey], rounds: int, load_ms: float) -> ModelReport:
+    table = TranspositionTable(bits=16)
+    covered = optimal = served = 0
+    counts = {"X": [0, 0], "O": [0, 0]}
+    worst = []
+    for board, player in positions:
+        side = counts[opener(board, player)]
+        side[1] += 1
+        if (board, player) in model.q:
+            covered += 1
+            chosen = model.choose_action(board, player)
+            if is_optimal(board, player, chosen):
+                optimal += 1
+                served += 1
+                side[0] += 1
+            elif len(worst) < WORST_KEPT:
+                worst.append((render(board), player, chosen))
+        elif is_optimal(board, player, served_action(model, board, player, table)):
+            served += 1
+
+    # Each call is timed on its own; the fastest of the rounds per position drops scheduler noise.
+    # A pickled model fills in zero rows for the positions it lacks, so this runs after scoring.
+    choose_action = model.choose_action
+    timer = time.perf_counter_ns
+    best = [float("inf")] * len(positions)
+    for _ in range(rounds):
+        for index, (board, player) in enumerate(positions):
+            started = timer()
+            choose_action(board, player)
+            elapsed = timer() - started
+            if elapsed < best[index]:
+                best[index] = elapsed
+    best.sort()
+
+    return ModelReport(
+        path=path,
+        positions=len(positions),
+        optimal=optimal,
+        optimal_fraction=optimal / len(positions),
+        optimal_by_opener={side: hits / total for side, (hits, total) in counts.items() if total},
+        mean_ns=sum(best) / len(best),
+        p99_ns=best[min(len(best) - 1, int(0.99 * len(best)))],
+        load_ms=load_ms,
+        size_bytes=os.path.getsize(path),
+        worst=worst,
+        coverage=covered / len(positions),
+        served_optimal_fraction=served / len(positions),
+    )
+
+
+def compare(candidate: ModelReport, baseline: ModelReport, allowed: Dict[str, float]) -> List[Tuple[str, float, float, bool]]:
+    # (metric, baseline, candidate, passed) per gated metric the baseline has.
+    rows = []
+    for metric, (higher_is_better, _, kind) in THRESHOLDS.items():
+        old = getattr(baseline, metric)
+        new = getattr(candidate, metric)
+        if old is None:
+            continue
+        margin = allowed[metric] if kind == "absolute" else abs(old) * allowed[metric]
+        passed = new >= old - margin if higher_is_better else new <= old + margin
+        rows.append((metric, old, new, passed))
+    return rows
+
+
+def read_report(path: str) -> ModelReport:
+    with open(path) as f:
+        payload = json.load(f)
+    payload["worst"] = [tuple(entry) for entry in payload.get("worst", [])]
+    return ModelReport(**payload)
+
+
+def print_report(report: ModelReport, top: int) -> None:
+    print(f"{report.path}: {report.size_bytes} bytes, loads in {report.load_ms:.1f} ms")
+    print(
+        f"  optimal choices {report.optimal}/{report.positions} ({report.optimal_fraction:.2%}; "
+        + ", ".join(f"{side} opens {fraction:.2%}" for side, fraction in report.optimal_by_opener.items())
+        + ")"
+    )
+    if report.coverage is not None:
+        print(
+            f"  the table has {report.coverage:.2%} of positions; "
+            f"as served, searching the rest: {report.served_optimal_fraction:.2%} optimal"
+        )
+    print(f"  choose_action mean {report.mean_ns / 1000:.2f} us p99 {report.p99_ns / 1000:.2f} us")
+    for board, player, chosen in report.worst[:top]:
+        print(f"  suboptimal: {board} {'X' if player == 1 else 'O'} to move, model plays {chosen}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Check a Q-model, alone and as the server serves it, against minimax on every reachable "
+        "position and gate it against a baseline (run as: python -m training.evaluate)."
+    )
+    parser.add_argument("model", nargs="?", default=str(DEFAULT_MODEL_PATH), help="a pickled model or a .qtab table")
+    parser.add_argument(
+        "--baseline",
+        help="a report written with --json, or a model file evaluated in this run (compares latency on the same host)",
+    )
+    parser.add_argument("--json", help="write the candidate's report here, for use as a later --baseline")
+    parser.add_argument("--rounds", type=int, default=5, help="timing rounds per position")
+    parser.add_argument("--top", type=int, default=10, help="suboptimal positions to list")
+    for metric, (_, default, kind) in THRESHOLDS.items():
+        unit = "fraction points" if kind == "absolute" else "relative"
+        parser.add_argument(
+            f"--max-{metric.replace('_', '-')}-regression",
+            dest=metric,
+            type=float,
+            default=default,
+            help=f"allowed regression ({unit}, default {default:g})",
+        )
+    args = parser.parse_args()
+
+    positions = reachable_positions()
+    baseline: Optional[ModelReport] = None
+    if args.baseline and args.baseline.endswith(".json"):
+        baseline = read_report(args.baseline)
+    elif args.baseline:
+        baseline = evaluate(args.baseline, positions, args.rounds)
+        print_report(baseline, args.top)
+    candidate = evaluate(args.model, positions, args.rounds)
+    print_report(candidate, args.top)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(asdict(candidate), f, indent=2)
+    if baseline is None:
+        return
+
+    allowed = {metric: getattr(args, metric) for metric in THRESHOLDS}
+    rows = compare(candidate, baseline, allowed)
+    print(f"{'metric':18} {'baseline':>14} {'candidate':>14}")
+    for metric, old, new, passed in rows:
+        print(f"{metric:18} {old:>14.4f} {new:>14.4f}  {'ok' if passed else 'REGRESSED'}")
+    if not all(passed for *_, passed in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+from __future__ import annotations
+
+import math
+import random
+import time
+from array import array
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+EMPTY = 0
+DRAW = 3
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+NEIGHBOURHOOD = 2
+
+
+@dataclass
+class MCTSResult:
+    action: int
+    playouts: int
+    nodes: int
+    elapsed_ms: float
+    win_rate: float
+    reused_visits: int
+
+
+def wins_at(cells: Sequence[int], size: int, win_length: int, index: int, code: int) -> bool:
+    h, w = divmod(index, size)
+    for dh, dw in DIRECTIONS:
+        run = 1
+        ch, cw = h + dh, w + dw
+        while 0 <= ch < size and 0 <= cw < size and cells[ch * size + cw] == code:
+            run += 1
+            ch += dh
+            cw += dw
+        ch, cw = h - dh, w - dw
+        while 0 <= ch < size and 0 <= cw < size and cells[ch * size + cw] == code:
+            run += 1
+            ch -= dh
+            cw -= dw
+        if run >= win_length:
+            return True
+    return False
+
+
+class MCTS:
+    def __init__(
+        self,
+        cells: Sequence[int],
+        size: int,
+        win_length: int,
+        to_move: int,
+        exploration: float = 1.4,
+        rollouts_per_leaf: int = 1,
+        max_nodes: int = 200_000,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.size = size
+        self.win_length = win_length
+        self.exploration = exploration
+        self.rollouts_per_leaf = max(1, rollouts_per_leaf)
+        self.max_nodes = max_nodes
+        self.rng = rng if rng is not None else random.Random()
+        self.reset(cells, to_move)
+
+    def reset(self, cells: Sequence[int], to_move: int) -> None:
+        self.root_cells = bytearray(cells)
+        self.to_move = to_move
+        # Node storage is a set of parallel arrays; children of a node are contiguous.
+        self.parents = array("i", [-1])
+        self.moves = array("h", [-1])
+        self.movers = array("b", [3 - to_move])
+        self.outcomes = array("b", [EMPTY])
+        self.visits = array("I", [0])
+        self.scores = array("d", [0.0])
+        self.first_child = array("i", [-1])
+        self.child_counts = array("H", [0])
+        self.root = 0
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def _add_node(self, parent: int, move: int, mover: int, outcome: int) -> None:
+        self.parents.append(parent)
+        self.moves.append(move)
+        self.movers.append(mover)
+        self.outcomes.append(outcome)
+        self.visits.append(0)
+        self.scores.append(0.0)
+        self.first_child.append(-1)
+        self.child_counts.append(0)
+
+    def _candidates(self, cells: bytearray, filled: int) -> List[int]:
+        size = self.size
+        if size == 3 or filled == 0:
+            empties = [i for i, value in enumerate(cells) if value == EMPTY]
+            return empties if size == 3 else [(size // 2) * size + size // 2]
+
+        result = []
+        for index, value in enumerate(cells):
+            if value != EMPTY:
+                continue
+            h, w = divmod(index, size)
+            near = False
+            for ch in range(max(0, h - NEIGHBOURHOOD), min(size, h + NEIGHBOURHOOD + 1)):
+                row = ch * size
+                for cw in range(max(0, w - NEIGHBOURHOOD), min(size, w + NEIGHBOURHOOD + 1)):
+                    if cells[row + cw] != EMPTY:
+                        near = True
+                        break
+                if near:
+                    break
+            if near:
+                result.append(index)
+        return result or [i for i, value in enumerate(cells) if value == EMPTY]
+
+    def _expand(self, node: int, cells: bytearray, filled: int) -> None:
+        mover = 3 - self.movers[node]
+        full = filled + 1 == len(cells)
+        self.first_child[node] = len(self.parents)
+        moves = self._candidates(cells, filled)
+        for move in moves:
+            cells[move] = mover
+            if wins_at(cells, self.size, self.win_length, move, mover):
+                outcome = mover
+            else:
+                outcome = DRAW if full else EMPTY
+            cells[move] = EMPTY
+            self._add_node(node, move, mover, outcome)
+        self.child_counts[node] = len(moves)
+
+    def _select_child(self, node: int) -> int:
+        first = self.first_child[node]
+        count = self.child_counts[node]
+        visits = self.visits
+        scores = self.scores
+        log_parent = math.log(visits[node] or 1)
+        exploration = self.exploration
+        best = first
+        best_value = -1.0
+        for child in range(first, first + count):
+            n = visits[child]
+            if n == 0:
+                return child
+            value = scores[child] / n + exploration * math.sqrt(log_parent / n)
+            if value > best_value:
+                best_value = value
+                best = child
+        return best
+
+    def _rollout(self, cells: bytearray, filled: int, to_move: int) -> int:
+        size = self.size
+        win_length = self.win_length
+        empties = [i for i, value in enumerate(cells) if value == EMPTY]
+        self.rng.shuffle(empties)
+        placed = []
+        winner = DRAW
+        code = to_move
+        for index in empties:
+            cells[index] = code
+            placed.append(index)
+            if wins_at(cells, size, win_length, index, code):
+                winner = code
+                break
+            code = 3 - code
+        for index in placed:
+            cells[index] = EMPTY
+        return winner
+
+    def _playout(self) -> int:
+        cells = bytearray(self.root_cells)
+        filled = sum(1 for value in cells if value != EMPTY)
+        node = self.root
+        while self.first_child[node] >= 0 and self.outcomes[node] == EMPTY:
+            node = self._select_child(node)
+            cells[self.moves[node]] = self.movers[node]
+            filled += 1
+
+        outcome = self.outcomes[node]
+        batch = 1
+        if outcome == EMPTY and filled < len(cells):
+            if self.visits[node] > 0 or node == self.root:
+                self._expand(node, cells, filled)
+                node = self._select_child(node)
+                cells[self.moves[node]] = self.movers[node]
+                filled += 1
+                outcome = self.outcomes[node]
+            if outcome == EMPTY:
+                # Several rollouts from one leaf amortise the walk down the tree.
+                batch = self.rollouts_per_leaf
+                results = [self._rollout(cells, filled, 3 - self.movers[node]) for _ in range(batch)]
+            else:
+                results = [outcome] * batch
+        else:
+            results = [outcome if outcome != EMPTY else DRAW]
+
+        x_score = sum(1.0 if r == 1 else (0.5 if r == DRAW else 0.0) for r in results)
+        root = self.root
+        while True:
+            self.visits[node] += batch
+            self.scores[node] += x_score if self.movers[node] == 1 else batch - x_score
+            if node == root:
+                return batch
+            node = self.parents[node]
+
+    def search(self, time_limit_ms: float = 200.0, max_playouts: Optional[int] = None) -> MCTSResult:
+        start = time.perf_counter()
+        deadline = start + time_limit_ms / 1000.0
+        reused = self.visits[self.root]
+        playouts = 0
+        while True:
+            playouts += self._playout()
+            if max_playouts is not None and playouts >= max_playouts:
+                break
+            if time.perf_counter() >= deadline or len(self.parents) >= self.max_nodes:
+                break
+
+        return MCTSResult(
+            action=self.best_action(),
+            playouts=playouts,
+            nodes=len(self.parents),
+            elapsed_ms=(time.perf_counter() - start) * 1000,
+            win_rate=self._root_win_rate(),
+            reused_visits=reused,
+        )
+
+    def best_action(self) -> int:
+        root = self.root
+        first = self.first_child[root]
+        if first < 0:
+            return self._candidates(self.root_cells, sum(1 for v in self.root_cells if v != EMPTY))[0]
+        best = first
+        for child in range(first, first + self.child_counts[root]):
+            if self.outcomes[child] == self.to_move:
+                return self.moves[child]
+            if self.visits[child] > self.visits[best]:
+                best = child
+        return self.moves[best]
+
+    def _root_win_rate(self) -> float:
+        root = self.root
+        if self.visits[root] == 0:
+            return 0.5
+        return 1.0 - self.scores[root] / self.visits[root]
+
+    def advance(self, action: int) -> bool:
+        self.root_cells[action] = self.to_move
+        self.to_move = 3 - self.to_move
+        first = self.first_child[self.root]
+        if first >= 0:
+            for child in range(first, first + self.child_counts[self.root]):
+                if self.moves[child] == action:
+                    self.root = child
+                    if len(self.parents) > self.max_nodes // 2:
+                        self._compact()
+                    return True
+        self.reset(self.root_cells, self.to_move)
+        return False
+
+    def sync(self, cells: Sequence[int], to_move: int) -> bool:
+        placed = [i for i, value in enumerate(cells) if value != self.root_cells[i]]
+        if any(self.root_cells[i] != EMPTY for i in placed) or len(placed) > 2:
+            self.reset(cells, to_move)
+            return False
+        if len(placed) == 2 and cells[placed[0]] != self.to_move:
+            placed.reverse()
+        for index in placed:
+            if cells[index] != self.to_move or not self.advance(index):
+                self.reset(cells, to_move)
+                return False
+        if self.to_move != to_move:
+            self.reset(cells, to_move)
+            return False
+        return True
+
+    def trim(self, keep_nodes: int) -> None:
+        # For trees held between moves: keeps only the subtree under the root, and not even that
+        # once it holds more than keep_nodes.
+        if self.root != 0:
+            self._compact()
+        if len(self.parents) > keep_nodes:
+            self.reset(self.root_cells, self.to_move)
+
+    def _compact(self) -> None:
+        old_moves = self.moves
+        old_movers = self.movers
+        old_outcomes = self.outcomes
+        old_visits = self.visits
+        old_scores = self.scores
+        old_first = self.first_child
+        old_counts = self.child_counts
+        old_root = self.root
+        self.reset(self.root_cells, self.to_move)
+        self.visits[0] = old_visits[old_root]
+        self.scores[0] = old_scores[old_root]
+        queue = [(old_root, 0)]
+        for old_node, new_node in queue:
+            first = old_first[old_node]
+            if first < 0:
+                continue
+            count = old_counts[old_node]
+            self.first_child[new_node] = len(self.parents)
+            self.child_counts[new_node] = count
+            for child in range(first, first + count):
+                self._add_node(new_node, old_moves[child], old_movers[child], old_outcomes[child])
+                self.visits[-1] = old_visits[child]
+                self.scores[-1] = old_scores[child]
+                queue.append((child, len(self.parents) - 1))
+        self.root = 0
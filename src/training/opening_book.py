@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import argparse
+import mmap
+from operator import mul
+from pathlib import Path
+from typing import Callable, Optional, Sequence
+
+from .tictactoe_model import Board, minimax_action, terminal
+
+ROOT = Path(__file__).resolve().parent
+DEFAULT_BOOK_PATH = ROOT / "models" / "opening_book.bin"
+MAGIC = b"TTTBOOK1"
+POSITIONS = 3**9
+NO_MOVE = 0xFF
+# Engine cells are already base-3 digits (0 empty, 1 X, 2 O), so the index needs no translation.
+POWERS = tuple(3**i for i in range(9))
+MODEL_VALUES = (0, 1, -1)
+
+
+def book_slot(cells: Sequence[int], code: int) -> int:
+    return sum(map(mul, cells, POWERS)) * 2 + (code == 2)
+
+
+class OpeningBook:
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[: len(MAGIC)] != MAGIC or len(self._mm) != len(MAGIC) + 1 + POSITIONS * 2:
+            self._mm.close()
+            raise TypeError(f"Unsupported opening book format: {path}")
+        self.plies = self._mm[len(MAGIC)]
+        self._offset = len(MAGIC) + 1
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, cells: Sequence[int], code: int) -> Optional[int]:
+        move = self._mm[self._offset + book_slot(cells, code)]
+        if move == NO_MOVE:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return move
+
+    def close(self) -> None:
+        self._mm.close()
+
+
+def build_book(path: str, plies: int = 4, choose: Optional[Callable[[Board, int], int]] = None) -> int:
+    choose = choose or minimax_action
+    table = bytearray([NO_MOVE]) * (POSITIONS * 2)
+    entries = 0
+
+    def visit(cells: bytearray, code: int, depth: int) -> None:
+        nonlocal entries
+        slot = book_slot(cells, code)
+        if depth >= plies or table[slot] != NO_MOVE:
+            return
+        board = tuple(MODEL_VALUES[value] for value in cells)
+        if terminal(board):
+            return
+        table[slot] = choose(board, 1 if code == 1 else -1)
+        entries += 1
+        for index in range(9):
+            if cells[index] == 0:
+                cells[index] = code
+                visit(cells, 3 - code, depth + 1)
+                cells[index] = 0
+
+    for first in (1, 2):
+        visit(bytearray(9), first, 0)
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(bytes([plies]))
+        f.write(table)
+    return entries
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Build the 3x3 opening book (run as: python -m training.opening_book)."
+    )
+    parser.add_argument("--plies", type=int, default=4, help="positions with fewer marks than this are covered")
+    parser.add_argument("--output", default=str(DEFAULT_BOOK_PATH))
+    args = parser.parse_args()
+
+    entries = build_book(args.output, args.plies)
+    print(f"Wrote {entries} book positions to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from pathlib import Path
 
-from tictactoe_model import (
+from .tictactoe_model import (
     apply_action,
     empty_board,
     legal_actions,
@@ -72,7 +72,7 @@ def play_human(model) -> None:
 def main() -> None:
     if not DEFAULT_MODEL_PATH.exists():
         raise FileNotFoundError(
-            "Final model not found at training/models/final_model.pkl. Run training/training_ai.py first."
+            "Final model not found at training/models/final_model.pkl. Run python -m training.training_ai first."
         )
     model = load_model(str(DEFAULT_MODEL_PATH))
     play_human(model)
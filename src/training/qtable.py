@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections.abc import Mapping
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional, Sequence
+
+from .tictactoe_model import Board, RLQModel, StateKey, board_index, load_model
+
+ROOT = Path(__file__).resolve().parent
+DEFAULT_MODEL_PATH = ROOT / "models" / "final_model.pkl"
+DEFAULT_TABLE_PATH = ROOT / "models" / "final_model.qtab"
+MAGIC = b"TTTQTAB1"
+# magic, row count, CRC32 of the pickle it was built from; then a uint16 row number per
+# (position, player) slot, then 9 float64 per row.
+HEADER = struct.Struct("<8sII4x")
+POSITIONS = 3**9
+ACTIONS = 9
+NO_ROW = 0xFFFF
+DIGIT_VALUES = (0, 1, -1)
+# Both sections are little-endian and the float rows start 8-byte aligned.
+ROWS_OFFSET = HEADER.size + POSITIONS * 2 * 2
+ZERO_ROW = (0.0,) * ACTIONS
+
+
+def state_slot(board: Board, player: int) -> int:
+    # Same slot as opening_book.book_slot for the engine's cells: model values -1 map to digit 2.
+    return board_index(board) * 2 + (player == -1)
+
+
+def slot_state(slot: int) -> StateKey:
+    index, side = divmod(slot, 2)
+    board = []
+    for _ in range(9):
+        index, digit = divmod(index, 3)
+        board.append(DIGIT_VALUES[digit])
+    return tuple(board), (-1 if side else 1)
+
+
+def file_crc(path: str) -> int:
+    with open(path, "rb") as f:
+        return zlib.crc32(f.read())
+
+
+def write_table(model: RLQModel, path: str, source_crc: int = 0) -> int:
+    index = array("H", [NO_ROW]) * (POSITIONS * 2)
+    rows = array("d")
+    for (board, player), qvals in model.q.items():
+        if len(rows) // ACTIONS >= NO_ROW:
+            raise ValueError(f"Q-table has more than {NO_ROW} states")
+        index[state_slot(board, player)] = len(rows) // ACTIONS
+        rows.extend(qvals)
+    if sys.byteorder != "little":
+        index.byteswap()
+        rows.byteswap()
+
+    # Written beside the target and renamed over it: workers that already mapped the old
+    # file keep reading it until they restart.
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(rows) // ACTIONS, source_crc))
+        f.write(index.tobytes())
+        f.write(rows.tobytes())
+    os.replace(tmp_path, path)
+    return len(rows) // ACTIONS
+
+
+class QTableView(Mapping):
+    # A read-only StateKey -> Q row mapping over a memory-mapped table. Every process that maps
+    # the file shares the same page-cache pages, so the model costs its size once per host
+    # rather than once per worker; rows are memoryview slices, never copied into Python lists.
+    def __init__(self, path: str) -> None:
+        if sys.byteorder != "little":
+            raise TypeError("Mapped Q-tables are read on little-endian hosts only")
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._rows, self.source_crc = (
+            HEADER.unpack_from(self._mm) if len(self._mm) >= HEADER.size else (b"", 0, 0)
+        )
+        if magic != MAGIC or len(self._mm) != ROWS_OFFSET + self._rows * ACTIONS * 8:
+            self._mm.close()
+            raise TypeError(f"Unsupported Q-table format: {path}")
+        self._view = memoryview(self._mm)
+        self._index = self._view[HEADER.size : ROWS_OFFSET].cast("H")
+        self._values = self._view[ROWS_OFFSET:].cast("d")
+
+    def __getitem__(self, key: StateKey) -> Sequence[float]:
+        row = self._index[state_slot(*key)]
+        if row == NO_ROW:
+            raise KeyError(key)
+        start = row * ACTIONS
+        return self._values[start : start + ACTIONS]
+
+    def get(self, key: StateKey, default: Optional[Sequence[float]] = None) -> Optional[Sequence[float]]:
+        row = self._index[state_slot(*key)]
+        if row == NO_ROW:
+            return default
+        start = row * ACTIONS
+        return self._values[start : start + ACTIONS]
+
+    def __contains__(self, key: object) -> bool:
+        return self._index[state_slot(*key)] != NO_ROW
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def __iter__(self) -> Iterator[StateKey]:
+        for slot, row in enumerate(self._index):
+            if row != NO_ROW:
+                yield slot_state(slot)
+
+    def close(self) -> None:
+        self._index.release()
+        self._values.release()
+        self._view.release()
+        self._mm.close()
+
+
+@dataclass
+class MappedQModel(RLQModel):
+    q: QTableView
+
+    def _qvals(self, key: StateKey) -> Sequence[float]:
+        # Read-only: states the table lacks score zero instead of being inserted.
+        return self.q.get(key, ZERO_ROW)
+
+    def close(self) -> None:
+        self.q.close()
+
+
+def load_table(path: str) -> MappedQModel:
+    return MappedQModel(q=QTableView(path))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Convert the pickled Q-model to the mapped table the AI router shares across workers "
+        "(run as: python -m training.qtable)."
+    )
+    parser.add_argument("--model", default=str(DEFAULT_MODEL_PATH))
+    parser.add_argument("--output", default=str(DEFAULT_TABLE_PATH))
+    args = parser.parse_args()
+
+    rows = write_table(load_model(args.model), args.output, file_crc(args.model))
+    print(f"Wrote {rows} states ({os.path.getsize(args.output)} bytes) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
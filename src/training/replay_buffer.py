@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import argparse
+import mmap
+import random
+import struct
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from .tictactoe_model import (
+    Board,
+    RecordedGame,
+    RLQModel,
+    _update_q,
+    apply_action,
+    empty_board,
+    load_games,
+    terminal,
+    winner,
+)
+
+MAGIC = b"TTTRB1\0\0"
+# board[9], player, action, reward, done
+RECORD = struct.Struct("<9bbBbB")
+Transition = Tuple[Board, int, int, float, Board, bool]
+
+
+def iter_transitions(games: Iterable[RecordedGame]) -> Iterator[Tuple[Board, int, int, int, bool]]:
+    for first_player, actions in games:
+        board = empty_board()
+        player = first_player
+        for action in actions:
+            if not 0 <= action < 9 or terminal(board) or board[action] != 0:
+                break
+            next_board = apply_action(board, action, player)
+            done = terminal(next_board)
+            reward = 0
+            if done:
+                w = winner(next_board)
+                reward = 1 if w == player else (-1 if w == -player else 0)
+            yield board, player, action, reward, done
+            board = next_board
+            player = -player
+
+
+def write_replay_buffer(games: Iterable[RecordedGame], path: str) -> int:
+    count = 0
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        for board, player, action, reward, done in iter_transitions(games):
+            f.write(RECORD.pack(*board, player, action, reward, done))
+            count += 1
+    return count
+
+
+class ReplayBuffer:
+    def __init__(self, path: str) -> None:
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[: len(MAGIC)] != MAGIC:
+            self.close()
+            raise TypeError(f"Unsupported replay buffer format: {path}")
+        self._count = (len(self._mm) - len(MAGIC)) // RECORD.size
+
+    def __len__(self) -> int:
+        return self._count
+
+    def transition(self, index: int) -> Transition:
+        fields = RECORD.unpack_from(self._mm, len(MAGIC) + index * RECORD.size)
+        board = fields[:9]
+        player, action, reward, done = fields[9:]
+        return board, player, action, float(reward), apply_action(board, action, player), bool(done)
+
+    def sample(self, batch_size: int, rng: random.Random) -> List[Transition]:
+        return [self.transition(rng.randrange(self._count)) for _ in range(batch_size)]
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+
+def train_from_replay(
+    model: RLQModel,
+    buffer: ReplayBuffer,
+    batches: int,
+    batch_size: int = 256,
+    alpha: float = 0.1,
+    gamma: float = 0.99,
+    seed: int = 7,
+    log_every: int = 1_000,
+) -> RLQModel:
+    if len(buffer) == 0:
+        return model
+
+    rng = random.Random(seed)
+    for batch in range(1, batches + 1):
+        for board, player, action, reward, next_board, done in buffer.sample(batch_size, rng):
+            _update_q(
+                model=model,
+                board=board,
+                player=player,
+                action=action,
+                reward=reward,
+                next_board=next_board,
+                next_player=-player,
+                done=done,
+                alpha=alpha,
+                gamma=gamma,
+            )
+        if log_every and batch % log_every == 0:
+            print(f"[batch={batch}] samples={batch * batch_size} states={len(model.q)}")
+    return model
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Build a memory-mapped replay buffer from recorded games (run as: python -m training.replay_buffer)."
+    )
+    parser.add_argument("games", help="games file written by python -m training.analytics --export-games")
+    parser.add_argument("output", help="replay buffer to write")
+    args = parser.parse_args(argv)
+
+    count = write_replay_buffer(load_games(args.games), args.output)
+    print(f"Wrote {count} transitions to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
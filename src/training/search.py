@@ -0,0 +1,364 @@
+from __future__ import annotations
+
+import random
+import time
+from array import array
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+EMPTY = 0
+WIN_SCORE = 1 << 28
+# Scores beyond this are forced wins; they are stored relative to the node so they stay valid at any ply.
+MATE_BOUND = WIN_SCORE - 1024
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+EXACT, LOWER, UPPER = 0, 1, 2
+# Larger boards only consider cells within this distance of an existing mark.
+NEIGHBOURHOOD = 2
+# A window's weight stops growing at 4**8: a 19x19 board has fewer than 4 * 19 * 19 windows, so
+# the heuristic stays below 4 * 361 * 4**8 (about 95M), clear of MATE_BOUND and of the table's
+# 32-bit values. Nothing changes for win lengths up to 8.
+WINDOW_WEIGHTS = tuple(4 ** min(marks, 8) for marks in range(64))
+CHECK_CLOCK_EVERY = 32
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+@dataclass
+class SearchResult:
+    action: int
+    value: int
+    depth: int
+    nodes: int
+    complete: bool
+    elapsed_ms: float
+
+
+class TranspositionTable:
+    def __init__(self, bits: int = 18) -> None:
+        self.size = 1 << bits
+        self.mask = self.size - 1
+        self.keys = array("Q", bytes(8 * self.size))
+        self.values = array("i", bytes(4 * self.size))
+        self.depths = array("b", bytes(self.size))
+        self.flags = array("B", bytes(self.size))
+        self.moves = array("h", bytes(2 * self.size))
+        self.generations = array("B", bytes(self.size))
+        self.generation = 1
+        self.hits = 0
+        self.stores = 0
+
+    def new_search(self) -> None:
+        self.generation = self.generation % 255 + 1
+
+    def clear(self) -> None:
+        # Probe and store ignore a slot whose generation is 0, so this empties the table as
+        # allocating a new one would, at the cost of one byte per slot.
+        self.generations = array("B", bytes(self.size))
+        self.generation = 1
+
+    def probe(self, key: int) -> int:
+        slot = key & self.mask
+        if self.generations[slot] and self.keys[slot] == key:
+            self.hits += 1
+            return slot
+        return -1
+
+    def store(self, key: int, depth: int, value: int, flag: int, move: int) -> None:
+        slot = key & self.mask
+        # Depth-preferred replacement, but entries left over from earlier searches always yield.
+        if (
+            self.generations[slot] == self.generation
+            and self.keys[slot] != key
+            and self.depths[slot] > depth
+        ):
+            return
+        self.keys[slot] = key
+        self.values[slot] = value
+        self.depths[slot] = min(depth, 127)
+        self.flags[slot] = flag
+        self.moves[slot] = move
+        self.generations[slot] = self.generation
+        self.stores += 1
+
+
+@lru_cache(maxsize=32)
+def zobrist_keys(size: int, win_length: int) -> Tuple[Tuple[int, ...], Tuple[int, ...], int]:
+    rng = random.Random(size * 1_000 + win_length)
+    cells = size * size
+    x_keys = tuple(rng.getrandbits(64) for _ in range(cells))
+    o_keys = tuple(rng.getrandbits(64) for _ in range(cells))
+    return x_keys, o_keys, rng.getrandbits(64)
+
+
+@lru_cache(maxsize=32)
+def centre_order(size: int) -> Tuple[int, ...]:
+    centre = (size - 1) / 2
+    return tuple(
+        sorted(range(size * size), key=lambda i: (abs(i // size - centre) + abs(i % size - centre), i))
+    )
+
+
+@lru_cache(maxsize=32)
+def windows(size: int, win_length: int) -> Tuple[Tuple[int, ...], ...]:
+    found = []
+    for h in range(size):
+        for w in range(size):
+            for dh, dw in DIRECTIONS:
+                end_h = h + dh * (win_length - 1)
+                end_w = w + dw * (win_length - 1)
+                if 0 <= end_h < size and 0 <= end_w < size:
+                    found.append(tuple((h + dh * i) * size + w + dw * i for i in range(win_length)))
+    return tuple(found)
+
+
+def _to_table(value: int, ply: int) -> int:
+    if value >= MATE_BOUND:
+        return value + ply
+    if value <= -MATE_BOUND:
+        return value - ply
+    return value
+
+
+def _from_table(value: int, ply: int) -> int:
+    if value >= MATE_BOUND:
+        return value - ply
+    if value <= -MATE_BOUND:
+        return value + ply
+    return value
+
+
+class Searcher:
+    def __init__(
+        self,
+        cells: Sequence[int],
+        size: int,
+        win_length: int,
+        table: Optional[TranspositionTable] = None,
+    ) -> None:
+        self.cells = bytearray(cells)
+        self.size = size
+        self.win_length = win_length
+        self.table = table if table is not None else TranspositionTable(bits=16)
+        self.x_keys, self.o_keys, self.side_key = zobrist_keys(size, win_length)
+        self.filled = sum(1 for value in self.cells if value != EMPTY)
+        self.key = 0
+        for index, value in enumerate(self.cells):
+            if value == 1:
+                self.key ^= self.x_keys[index]
+            elif value == 2:
+                self.key ^= self.o_keys[index]
+        self.order = centre_order(size)
+        self.windows = windows(size, win_length)
+        self.nodes = 0
+        self.deadline = 0.0
+        self.node_limit = 0
+
+    def _place(self, index: int, code: int) -> None:
+        self.cells[index] = code
+        self.filled += 1
+        self.key ^= (self.x_keys if code == 1 else self.o_keys)[index]
+
+    def _remove(self, index: int, code: int) -> None:
+        self.cells[index] = EMPTY
+        self.filled -= 1
+        self.key ^= (self.x_keys if code == 1 else self.o_keys)[index]
+
+    def _wins(self, index: int, code: int) -> bool:
+        size = self.size
+        cells = self.cells
+        h, w = divmod(index, size)
+        for dh, dw in DIRECTIONS:
+            run = 1
+            ch, cw = h + dh, w + dw
+            while 0 <= ch < size and 0 <= cw < size and cells[ch * size + cw] == code:
+                run += 1
+                ch += dh
+                cw += dw
+            ch, cw = h - dh, w - dw
+            while 0 <= ch < size and 0 <= cw < size and cells[ch * size + cw] == code:
+                run += 1
+                ch -= dh
+                cw -= dw
+            if run >= self.win_length:
+                return True
+        return False
+
+    def candidates(self) -> List[int]:
+        cells = self.cells
+        if self.size == 3:
+            return [i for i in self.order if cells[i] == EMPTY]
+        if self.filled == 0:
+            return [self.order[0]]
+
+        size = self.size
+        result = []
+        for index in self.order:
+            if cells[index] != EMPTY:
+                continue
+            h, w = divmod(index, size)
+            near = False
+            for ch in range(max(0, h - NEIGHBOURHOOD), min(size, h + NEIGHBOURHOOD + 1)):
+                row = ch * size
+                for cw in range(max(0, w - NEIGHBOURHOOD), min(size, w + NEIGHBOURHOOD + 1)):
+                    if cells[row + cw] != EMPTY:
+                        near = True
+                        break
+                if near:
+                    break
+            if near:
+                result.append(index)
+        return result or [i for i in self.order if cells[i] == EMPTY]
+
+    def evaluate(self, code: int) -> int:
+        # Open windows only hold one side's marks; longer ones are worth exponentially more.
+        cells = self.cells
+        weights = WINDOW_WEIGHTS
+        score = 0
+        for window in self.windows:
+            mine = theirs = 0
+            for index in window:
+                value = cells[index]
+                if value == code:
+                    mine += 1
+                elif value != EMPTY:
+                    theirs += 1
+            if mine and not theirs:
+                score += weights[mine]
+            elif theirs and not mine:
+                score -= weights[theirs]
+        return score
+
+    def negamax(self, depth: int, alpha: int, beta: int, code: int, ply: int) -> int:
+        self.nodes += 1
+        if self.nodes % CHECK_CLOCK_EVERY == 0 and (
+            time.perf_counter() > self.deadline or (self.node_limit and self.nodes >= self.node_limit)
+        ):
+            raise SearchTimeout()
+
+        if self.filled == len(self.cells):
+            return 0
+        if depth == 0:
+            return self.evaluate(code)
+
+        alpha_orig = alpha
+        table = self.table
+        # The same marks can arise with either side to move when games may start with O.
+        key = self.key ^ self.side_key if code == 2 else self.key
+        tt_move = -1
+        slot = table.probe(key)
+        if slot >= 0:
+            tt_move = table.moves[slot]
+            if table.depths[slot] >= depth:
+                value = _from_table(table.values[slot], ply)
+                flag = table.flags[slot]
+                if flag == EXACT:
+                    return value
+                if flag == LOWER and value > alpha:
+                    alpha = value
+                elif flag == UPPER and value < beta:
+                    beta = value
+                if alpha >= beta:
+                    return value
+
+        moves = self.candidates()
+        if tt_move >= 0 and tt_move in moves:
+            moves.remove(tt_move)
+            moves.insert(0, tt_move)
+
+        other = 3 - code
+        best = -WIN_SCORE - 1
+        best_move = moves[0]
+        for index in moves:
+            self._place(index, code)
+            if self._wins(index, code):
+                value = WIN_SCORE - ply
+            else:
+                value = -self.negamax(depth - 1, -beta, -alpha, other, ply + 1)
+            self._remove(index, code)
+            if value > best:
+                best = value
+                best_move = index
+            if value > alpha:
+                alpha = value
+            if alpha >= beta:
+                break
+
+        if best <= alpha_orig:
+            flag = UPPER
+        elif best >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        table.store(key, depth, _to_table(best, ply), flag, best_move)
+        return best
+
+    def search(
+        self, code: int, time_limit_ms: float, max_depth: Optional[int] = None, max_nodes: Optional[int] = None
+    ) -> SearchResult:
+        # max_nodes bounds the work instead of the clock, so the result is the same on any host.
+        start = time.perf_counter()
+        self.deadline = start + time_limit_ms / 1000.0
+        self.node_limit = self.nodes + max_nodes if max_nodes else 0
+        self.table.new_search()
+        empties = len(self.cells) - self.filled
+        limit = empties if max_depth is None else min(max_depth, empties)
+
+        moves = self.candidates()
+        # An immediate win needs no search.
+        for index in moves:
+            self._place(index, code)
+            won = self._wins(index, code)
+            self._remove(index, code)
+            if won:
+                return SearchResult(index, WIN_SCORE, 1, self.nodes, True, (time.perf_counter() - start) * 1000)
+
+        best = SearchResult(moves[0], 0, 0, 0, False, 0.0)
+        for depth in range(1, limit + 1):
+            try:
+                value, action = self._root(moves, depth, code)
+            except SearchTimeout:
+                break
+            best = SearchResult(action, value, depth, self.nodes, False, 0.0)
+            moves.remove(action)
+            moves.insert(0, action)
+            if abs(value) >= MATE_BOUND:
+                best.complete = True
+                break
+        if best.depth == empties:
+            best.complete = True
+        best.nodes = self.nodes
+        best.elapsed_ms = (time.perf_counter() - start) * 1000
+        return best
+
+    def _root(self, moves: List[int], depth: int, code: int) -> Tuple[int, int]:
+        alpha = -WIN_SCORE - 1
+        beta = WIN_SCORE + 1
+        best_move = moves[0]
+        other = 3 - code
+        for index in moves:
+            self._place(index, code)
+            if self._wins(index, code):
+                value = WIN_SCORE - 1
+            else:
+                value = -self.negamax(depth - 1, -beta, -alpha, other, 2)
+            self._remove(index, code)
+            if value > alpha:
+                alpha = value
+                best_move = index
+        return alpha, best_move
+
+
+def best_move(
+    cells: Sequence[int],
+    size: int,
+    win_length: int,
+    code: int,
+    time_limit_ms: float = 200.0,
+    max_depth: Optional[int] = None,
+    table: Optional[TranspositionTable] = None,
+    max_nodes: Optional[int] = None,
+) -> SearchResult:
+    return Searcher(cells, size, win_length, table).search(code, time_limit_ms, max_depth, max_nodes)
@@ -1,13 +1,15 @@
 from __future__ import annotations
 
+import math
 import pickle
 import random
 from dataclasses import dataclass
 from functools import lru_cache
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 Board = Tuple[int, ...]
 StateKey = Tuple[Board, int]
+RecordedGame = Tuple[int, Sequence[int]]
 WIN_LINES = (
     (0, 1, 2),
     (3, 4, 5),
@@ -34,6 +36,13 @@ def apply_action(board: Board, action: int, player: int) -> Board:
     return tuple(cells)
 
 
+def board_index(board: Board) -> int:
+    index = 0
+    for value in reversed(board):
+        index = index * 3 + (value % 3)
+    return index
+
+
 def winner(board: Board) -> int:
     for i, j, k in WIN_LINES:
         total = board[i] + board[j] + board[k]
@@ -85,6 +94,15 @@ def minimax_action(board: Board, player: int) -> int:
     return best_action
 
 
+def epsilon_minimax_action(board: Board, player: int, epsilon: float, rng=random) -> int:
+    actions = legal_actions(board)
+    if not actions:
+        return 0
+    if epsilon > 0.0 and rng.random() < epsilon:
+        return actions[rng.randrange(len(actions))]
+    return minimax_action(board, player)
+
+
 @dataclass
 class RLQModel:
     q: Dict[StateKey, List[float]]
@@ -109,6 +127,27 @@ class RLQModel:
                 best_action = action
         return best_action
 
+    def sample_action(self, board: Board, player: int, temperature: float, rng=random) -> int:
+        qvals = self.q.get((board, player))
+        if qvals is None or temperature <= 0.0:
+            return self.choose_action(board, player)
+
+        actions = legal_actions(board)
+        if not actions:
+            return 0
+
+        # Softmax over the shared Q row without building a per-call probability table.
+        best = max(qvals[a] for a in actions)
+        total = 0.0
+        for action in actions:
+            total += math.exp((qvals[action] - best) / temperature)
+        threshold = rng.random() * total
+        for action in actions:
+            threshold -= math.exp((qvals[action] - best) / temperature)
+            if threshold <= 0.0:
+                return action
+        return actions[-1]
+
 
 def _linear(start: float, end: float, step: int, total_steps: int) -> float:
     if total_steps <= 1:
@@ -144,6 +183,38 @@ def _update_q(
     qvals[action] = old + alpha * (target - old)
 
 
+def _learn_game(model: RLQModel, first_player: int, actions: Sequence[int], alpha: float, gamma: float) -> None:
+    board = empty_board()
+    player = first_player
+    for action in actions:
+        if not 0 <= action < 9 or terminal(board) or board[action] != 0:
+            return
+
+        next_board = apply_action(board, action, player)
+        done = terminal(next_board)
+        if done:
+            w = winner(next_board)
+            reward = 1.0 if w == player else (-1.0 if w == -player else 0.0)
+        else:
+            reward = 0.0
+
+        _update_q(
+            model=model,
+            board=board,
+            player=player,
+            action=action,
+            reward=reward,
+            next_board=next_board,
+            next_player=-player,
+            done=done,
+            alpha=alpha,
+            gamma=gamma,
+        )
+
+        board = next_board
+        player = -player
+
+
 def train_model(
     episodes: int = 300_000,
     alpha: float = 0.35,
@@ -154,9 +225,20 @@ def train_model(
     teacher_end: float = 0.05,
     seed: int = 7,
     log_every: int = 50_000,
+    model: Optional[RLQModel] = None,
+    games: Optional[Iterable[RecordedGame]] = None,
 ) -> RLQModel:
     rng = random.Random(seed)
-    model = RLQModel(q={})
+    if model is None:
+        model = RLQModel(q={})
+
+    if games is not None:
+        replayed = 0
+        for first_player, actions in games:
+            _learn_game(model, first_player, actions, alpha, gamma)
+            replayed += 1
+            if log_every and replayed % log_every == 0:
+                print(f"[games={replayed}] states={len(model.q)}")
 
     for episode in range(1, episodes + 1):
         epsilon = _linear(epsilon_start, epsilon_end, episode, episodes)
@@ -210,6 +292,27 @@ def train_model(
     return model
 
 
+def save_games(games: Iterable[RecordedGame], path: str) -> int:
+    count = 0
+    with open(path, "w", encoding="ascii") as f:
+        for first_player, actions in games:
+            # One digit per cell only fits the 3x3 board.
+            if any(not 0 <= a < 9 for a in actions):
+                raise ValueError(f"not a 3x3 game: {list(actions)}")
+            f.write(("X" if first_player == 1 else "O") + ":" + "".join(str(a) for a in actions) + "\n")
+            count += 1
+    return count
+
+
+def load_games(path: str) -> Iterator[RecordedGame]:
+    with open(path, "r", encoding="ascii") as f:
+        for line in f:
+            first, _, actions = line.strip().partition(":")
+            if first not in {"X", "O"} or not actions.isdigit() or "9" in actions:
+                continue
+            yield (1 if first == "X" else -1), [int(a) for a in actions]
+
+
 def save_model(model: RLQModel, path: str) -> None:
     payload = {"version": 2, "q": model.q}
     with open(path, "wb") as f:
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .mcts import MCTS, wins_at
+from .search import TranspositionTable, best_move
+from .qtable import load_table
+from .tictactoe_model import epsilon_minimax_action, load_model, minimax_action
+
+# policy(cells, size, win_length, code, rng) -> cell index; cells use the engine codes 0 empty, 1 X, 2 O.
+Policy = Callable[[bytearray, int, int, int, random.Random], int]
+
+MODEL_VALUES = (0, 1, -1)
+CHUNK_GAMES = 2_000
+THREE_BY_THREE_ONLY = ("minimax", "epsilon", "model")
+
+
+@dataclass
+class PairResult:
+    wins: int = 0
+    draws: int = 0
+    losses: int = 0
+
+    @property
+    def games(self) -> int:
+        return self.wins + self.draws + self.losses
+
+    def add(self, other: PairResult) -> None:
+        self.wins += other.wins
+        self.draws += other.draws
+        self.losses += other.losses
+
+
+def _model_board(cells: Sequence[int]) -> Tuple[int, ...]:
+    return tuple(MODEL_VALUES[value] for value in cells)
+
+
+def _random_policy(cells, size, win_length, code, rng):
+    return rng.choice([index for index, value in enumerate(cells) if value == 0])
+
+
+def make_policy(spec: str) -> Policy:
+    # random | minimax | epsilon:E | search[:MS] | mcts[:MS] | model:PATH[:TEMPERATURE], where PATH is a
+    # pickled model or a mapped .qtab table.
+    name, _, arg = spec.partition(":")
+    if name == "random":
+        return _random_policy
+    if name == "minimax":
+        return lambda cells, size, win_length, code, rng: minimax_action(_model_board(cells), 1 if code == 1 else -1)
+    if name == "epsilon":
+        epsilon = float(arg)
+        return lambda cells, size, win_length, code, rng: epsilon_minimax_action(
+            _model_board(cells), 1 if code == 1 else -1, epsilon, rng
+        )
+    if name == "search":
+        time_limit_ms = float(arg or 10)
+        table = TranspositionTable(bits=16)
+        return lambda cells, size, win_length, code, rng: best_move(
+            cells, size, win_length, code, time_limit_ms, table=table
+        ).action
+    if name == "mcts":
+        time_limit_ms = float(arg or 10)
+        return lambda cells, size, win_length, code, rng: MCTS(cells, size, win_length, code, rng=rng).search(
+            time_limit_ms
+        ).action
+    if name == "model":
+        path, temperature = arg, 0.0
+        head, sep, tail = arg.rpartition(":")
+        if sep and tail.replace(".", "", 1).isdigit():
+            path, temperature = head, float(tail)
+        model = load_table(path) if path.endswith(".qtab") else load_model(path)
+        return lambda cells, size, win_length, code, rng: model.sample_action(
+            _model_board(cells), 1 if code == 1 else -1, temperature, rng
+        )
+    raise ValueError(f"Unknown policy spec: {spec}")
+
+
+def play_game(
+    first: Policy, second: Policy, size: int, win_length: int, rng: random.Random
+) -> int:
+    # `first` plays X. Returns 1 if X wins, 2 if O wins, 0 for a draw.
+    cells = bytearray(size * size)
+    policies = (None, first, second)
+    code = 1
+    for _ in range(size * size):
+        index = policies[code](cells, size, win_length, code, rng)
+        if cells[index] != 0:
+            raise ValueError(f"Policy for {'XO'[code - 1]} played occupied cell {index}")
+        cells[index] = code
+        if wins_at(cells, size, win_length, index, code):
+            return code
+        code = 3 - code
+    return 0
+
+
+_worker_policies: Dict[str, Policy] = {}
+
+
+def _init_worker(specs: Sequence[str]) -> None:
+    for spec in specs:
+        _worker_policies[spec] = make_policy(spec)
+
+
+def play_chunk(spec_a: str, spec_b: str, games: int, size: int, win_length: int, seed: int) -> PairResult:
+    # Seats alternate so neither side keeps the first-move advantage.
+    if spec_a not in _worker_policies or spec_b not in _worker_policies:
+        _init_worker((spec_a, spec_b))
+    policy_a = _worker_policies[spec_a]
+    policy_b = _worker_policies[spec_b]
+    rng = random.Random(seed)
+    result = PairResult()
+    for game_index in range(games):
+        a_is_x = game_index % 2 == 0
+        outcome = play_game(policy_a, policy_b, size, win_length, rng) if a_is_x else play_game(
+            policy_b, policy_a, size, win_length, rng
+        )
+        if outcome == 0:
+            result.draws += 1
+        elif (outcome == 1) == a_is_x:
+            result.wins += 1
+        else:
+            result.losses += 1
+    return result
+
+
+def run_tournament(
+    specs: Sequence[str],
+    games: int,
+    size: int = 3,
+    win_length: int = 3,
+    workers: Optional[int] = None,
+    seed: int = 0,
+    chunk_games: int = CHUNK_GAMES,
+) -> Tuple[Dict[Tuple[str, str], PairResult], float]:
+    # Results are from the row policy's point of view, with the wall-clock seconds taken.
+    if size != 3 or win_length != 3:
+        for spec in specs:
+            if spec.partition(":")[0] in THREE_BY_THREE_ONLY:
+                raise ValueError(f"Policy {spec} only plays 3x3 boards")
+
+    pairs = [(a, b) for i, a in enumerate(specs) for b in specs[i + 1 :]]
+    results = {pair: PairResult() for pair in pairs}
+    jobs = []
+    for pair_index, (a, b) in enumerate(pairs):
+        for start in range(0, games, chunk_games):
+            jobs.append((a, b, min(chunk_games, games - start), seed * 1_000_003 + pair_index * 65_537 + start))
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(tuple(specs),)) as pool:
+        futures = [
+            (a, b, pool.submit(play_chunk, a, b, count, size, win_length, chunk_seed))
+            for a, b, count, chunk_seed in jobs
+        ]
+        for a, b, future in futures:
+            results[(a, b)].add(future.result())
+    elapsed = time.perf_counter() - started
+
+    full: Dict[Tuple[str, str], PairResult] = {}
+    for (a, b), result in results.items():
+        full[(a, b)] = result
+        full[(b, a)] = PairResult(result.losses, result.draws, result.wins)
+    return full, elapsed
+
+
+def format_matrix(specs: Sequence[str], results: Dict[Tuple[str, str], PairResult]) -> str:
+    width = max(12, *(len(spec) for spec in specs)) + 2
+    lines = ["W/D/L (row vs column)".ljust(width) + "".join(spec.rjust(width) for spec in specs)]
+    for a in specs:
+        cells: List[str] = []
+        for b in specs:
+            result = results.get((a, b))
+            cells.append("-".rjust(width) if result is None else f"{result.wins}/{result.draws}/{result.losses}".rjust(width))
+        lines.append(a.ljust(width) + "".join(cells))
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Play policies against each other in-process (run as: python -m training.tournament)."
+    )
+    parser.add_argument(
+        "policies",
+        nargs="+",
+        help="random | minimax | epsilon:E | search[:MS] | mcts[:MS] | model:PATH[:TEMPERATURE]",
+    )
+    parser.add_argument("--games", type=int, default=10_000, help="games per pairing, seats alternate")
+    parser.add_argument("--board-size", type=int, default=3)
+    parser.add_argument("--win-length", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-games", type=int, default=CHUNK_GAMES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    if len(set(args.policies)) < 2:
+        parser.error("need at least two distinct policies")
+    specs = list(dict.fromkeys(args.policies))
+    win_length = args.win_length or min(args.board_size, 5)
+    results, elapsed = run_tournament(
+        specs, args.games, args.board_size, win_length, args.workers, args.seed, args.chunk_games
+    )
+
+    total_games = sum(result.games for (a, b), result in results.items() if specs.index(a) < specs.index(b))
+    print(format_matrix(specs, results))
+    print(f"{total_games} games in {elapsed:.2f}s on {args.workers} workers: {total_games / elapsed:.0f} games/s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "board_size": args.board_size,
+                    "win_length": win_length,
+                    "games": total_games,
+                    "seconds": elapsed,
+                    "results": [{"row": a, "column": b, **asdict(result)} for (a, b), result in results.items()],
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
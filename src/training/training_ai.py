@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import argparse
 from pathlib import Path
 
-from tictactoe_model import (
+from .replay_buffer import ReplayBuffer, train_from_replay
+from .tictactoe_model import (
+    load_games,
+    load_model,
     save_model,
     train_model,
 )
@@ -13,23 +17,77 @@ FINAL_MODEL_PATH = MODELS_DIR / "final_model.pkl"
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Train the tic-tac-toe Q-learning model (run as: python -m training.training_ai)."
+    )
+    parser.add_argument(
+        "--fine-tune",
+        metavar="GAMES",
+        help="replay recorded games (python -m training.analytics --export-games) into the final model",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="BUFFER",
+        help="sample mini-batches from a replay buffer (python -m training.replay_buffer) into the final model",
+    )
+    parser.add_argument("--replay-batches", type=int, default=10_000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument(
+        "--output",
+        default=str(FINAL_MODEL_PATH),
+        help="where to save the model; save elsewhere to gate it against the served one first",
+    )
+    args = parser.parse_args()
+
     MODELS_DIR.mkdir(parents=True, exist_ok=True)
 
-    print("Training RL model (Q-learning with minimax guidance)...")
-    model = train_model(
-        episodes=300_000,
-        alpha=0.35,
-        gamma=0.99,
-        epsilon_start=1.0,
-        epsilon_end=0.02,
-        teacher_start=0.70,
-        teacher_end=0.05,
-        seed=7,
-        log_every=50_000,
-    )
+    if args.replay:
+        print(f"Training final model from replay buffer {args.replay}...")
+        buffer = ReplayBuffer(args.replay)
+        try:
+            model = train_from_replay(
+                load_model(str(FINAL_MODEL_PATH)),
+                buffer,
+                batches=args.replay_batches,
+                batch_size=args.batch_size,
+                alpha=0.1,
+                gamma=0.99,
+                seed=7,
+            )
+        finally:
+            buffer.close()
+    elif args.fine_tune:
+        print(f"Fine-tuning final model on recorded games from {args.fine_tune}...")
+        model = train_model(
+            episodes=0,
+            alpha=0.35,
+            gamma=0.99,
+            log_every=50_000,
+            model=load_model(str(FINAL_MODEL_PATH)),
+            games=load_games(args.fine_tune),
+        )
+    else:
+        print("Training RL model (Q-learning with minimax guidance)...")
+        model = train_model(
+            episodes=300_000,
+            alpha=0.35,
+            gamma=0.99,
+            epsilon_start=1.0,
+            epsilon_end=0.02,
+            teacher_start=0.70,
+            teacher_end=0.05,
+            seed=7,
+            log_every=50_000,
+        )
 
-    save_model(model, str(FINAL_MODEL_PATH))
-    print("\nSaved final model to training/models/final_model.pkl")
+    save_model(model, args.output)
+    print(f"\nSaved model to {args.output}")
+    if Path(args.output).resolve() != FINAL_MODEL_PATH:
+        print(
+            f"Gate it against the served model: python -m training.evaluate {args.output} "
+            "--baseline training/models/final_model.pkl (from src/), then copy it over final_model.pkl"
+        )
+    print("Refresh the table the server maps with: python -m training.qtable (from src/)")
 
 
 if __name__ == "__main__":